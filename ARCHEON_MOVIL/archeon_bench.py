@@ -0,0 +1,152 @@
+# archeon_bench.py - Micro-benchmarks de las rutas calientes de CloudManager
+#
+# Uso:  python archeon_bench.py tokens [n] [latencia_ms]
+#       python archeon_bench.py hashing [n] [workers]
+#       python archeon_bench.py backend [n] [latencia_ms] [tasa_fallos]
+#
+# Todo corre contra el Supabase en memoria (archeon_fake_supabase) con
+# semilla fija, así dos ejecuciones con los mismos argumentos son comparables.
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List
+
+
+def _medir(fn: Callable[[], Any], n: int) -> float:
+    """Devuelve operaciones por segundo."""
+    inicio = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - inicio)
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def bench_tokens(n: int = 20000, latencia_ms: float = 0.0) -> Dict[str, float]:
+    """
+    Validaciones/segundo del token antiguo (`token:firma` + SELECT en sessions)
+    frente al token v2 autocontenido. `latencia_ms` simula el viaje a la red de
+    la ruta antigua (0 = sólo el coste de CPU).
+    """
+    from archeon_cloud import CloudManager
+    from archeon_fake_supabase import SupabaseEnMemoria
+
+    cloud = CloudManager()
+    backend = SupabaseEnMemoria(latencia=latencia_ms / 1000.0, semilla=1)
+    cloud.supabase = backend
+    cloud.cloud_ready = True
+
+    email = "bench@archeon.local"
+    token = uuid.uuid4().hex
+    backend.tablas["sessions"] = [{
+        "token": token,
+        "email": email,
+        "expira": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
+    }]
+    antiguo = f"{token}:{cloud.firmar_token(token)}"
+    nuevo = cloud.crear_sesion(email)
+
+    assert cloud.obtener_usuario_por_token(antiguo) == email
+    assert cloud.obtener_usuario_por_token(nuevo) == email
+
+    n_antiguo = n if not latencia_ms else max(1, min(n, int(2000 / latencia_ms)))
+    resultado = {
+        "antiguo_por_s": _medir(lambda: cloud.obtener_usuario_por_token(antiguo), n_antiguo),
+        "v2_por_s": _medir(lambda: cloud.obtener_usuario_por_token(nuevo), n),
+    }
+    resultado["aceleracion"] = resultado["v2_por_s"] / resultado["antiguo_por_s"]
+    cloud.close()
+    return resultado
+
+
+def bench_hashing(n: int = 8, workers: int = 2) -> Dict[str, float]:
+    """Hashes/segundo por perfil de iteraciones, en serie y en el pool."""
+    from archeon_hashing import PERFILES, PasswordHasher
+
+    resultado = {}
+    for perfil, iteraciones in PERFILES.items():
+        hasher = PasswordHasher(iteraciones=iteraciones, workers=workers, max_cola=n)
+        resultado[f"{perfil}_{iteraciones}_serie_por_s"] = _medir(lambda: hasher.hash("bench-password"), n)
+
+        inicio = time.perf_counter()
+        futuros = [hasher.hash_async("bench-password") for _ in range(n)]
+        for futuro in futuros:
+            futuro.result()
+        resultado[f"{perfil}_{iteraciones}_pool{workers}_por_s"] = n / (time.perf_counter() - inicio)
+        hasher.close()
+    return resultado
+
+
+def bench_backend(n: int = 300, latencia_ms: float = 20.0, tasa_fallos: float = 0.0) -> Dict[str, float]:
+    """
+    Rendimiento de la capa de nube con red simulada (latencia ± 50 % de jitter,
+    1 % de llamadas 10x más lentas y `tasa_fallos` cortes de red):
+    - escritura: filas/s de chats + gustos hasta que la cola queda vacía, y
+      cuántas llamadas hicieron falta (lotes).
+    - lectura: p50/p95/p99 de un SELECT con timeouts, reintentos y breaker.
+    """
+    from archeon_cloud import CloudManager
+    from archeon_fake_supabase import SupabaseEnMemoria
+
+    latencia = latencia_ms / 1000.0
+    backend = SupabaseEnMemoria(latencia=latencia, jitter=latencia / 2, tasa_lentas=0.01,
+                                tasa_fallos=tasa_fallos, semilla=42)
+    cloud = CloudManager()
+    cloud.supabase = backend
+    cloud.cloud_ready = True
+    email = "bench@archeon.local"
+    doc_id = cloud._get_user_doc_id(email)
+    backend.tablas["users"] = [{"id": doc_id, "email": email, "config": "{}"}]
+
+    inicio = time.perf_counter()
+    for i in range(n):
+        cloud.guardar_mensaje_chat(email, f"contacto{i % 5}", f"mensaje {i}", "yo", leido=True)
+        cloud.guardar_gusto(email, f"gusto{i % 20}", i % 2 == 0)
+    cloud.flush_writes(120)
+    segundos = time.perf_counter() - inicio
+    llamadas_escritura = backend.stats()["llamadas"]
+
+    tiempos, errores = [], 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            cloud.supabase.table("users").select("config").eq("id", doc_id).execute()
+        except Exception:
+            errores += 1
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    cloud.close()
+
+    return {
+        "escritura_filas_por_s": 2 * n / segundos,
+        "escritura_llamadas": llamadas_escritura,
+        "lectura_p50_ms": _percentil(tiempos, 50),
+        "lectura_p95_ms": _percentil(tiempos, 95),
+        "lectura_p99_ms": _percentil(tiempos, 99),
+        "lectura_max_ms": max(tiempos),
+        "lectura_errores": errores,
+        "fallos_inyectados": backend.stats()["fallos_inyectados"],
+    }
+
+
+BENCHMARKS = {
+    "tokens": bench_tokens,
+    "hashing": bench_hashing,
+    "backend": bench_backend,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Uso: python archeon_bench.py [{'|'.join(BENCHMARKS)}] [args...]")
+        sys.exit(1)
+
+    # El espejo local va a memoria para no dejar ficheros ni medir el disco
+    os.environ.setdefault("AR_LOCAL_DB", ":memory:")
+    args = [float(a) if "." in a else int(a) for a in sys.argv[2:]]
+    for clave, valor in BENCHMARKS[sys.argv[1]](*args).items():
+        print(f">> [BENCH] {clave}: {valor:,.2f}")
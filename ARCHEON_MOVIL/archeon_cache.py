@@ -0,0 +1,270 @@
+# archeon_cache.py - Caché LRU + TTL con carga single-flight
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Entrada:
+    __slots__ = ("valor", "expira", "obsoleta_hasta", "tamano")
+
+    def __init__(self, valor: Any, expira: float, obsoleta_hasta: float, tamano: int):
+        self.valor = valor
+        self.expira = expira
+        self.obsoleta_hasta = obsoleta_hasta
+        self.tamano = tamano
+
+
+class _Vuelo:
+    """Carga en curso para una clave: los demás hilos esperan su resultado."""
+    __slots__ = ("evento", "valor", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+class CacheLRU:
+    """
+    Caché en RAM acotada por número de entradas y por bytes aproximados.
+
+    - Cada namespace ("config", "gustos", ...) tiene su propio TTL.
+    - Stale-while-revalidate: una entrada caducada se sigue sirviendo durante
+      `stale` segundos mientras se refresca en segundo plano.
+    - Single-flight: varios fallos simultáneos de la misma clave provocan una
+      única llamada al loader.
+    """
+
+    def __init__(self, max_entradas: int = 512, max_bytes: int = 4 * 1024 * 1024,
+                 ttl: float = 300, stale: float = 60):
+        self.max_entradas = max(1, int(max_entradas))
+        self.max_bytes = max(1024, int(max_bytes))
+        self.ttl_defecto = ttl
+        self.stale_defecto = stale
+
+        self._datos: "OrderedDict[tuple, _Entrada]" = OrderedDict()
+        self._bytes = 0
+        self._namespaces: Dict[str, Dict[str, float]] = {}
+        self._en_vuelo: Dict[tuple, _Vuelo] = {}
+        # Se incrementa en cada escritura/invalidación para que una carga lenta
+        # no pise un valor más nuevo escrito mientras tanto
+        self._versiones: Dict[tuple, int] = {}
+        self._lock = threading.RLock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+        self._stats = {
+            "hits": 0, "misses": 0, "stale_hits": 0, "cargas": 0, "errores_carga": 0,
+            "coalescidas": 0, "refrescos": 0, "evicciones": 0, "expiradas": 0,
+        }
+        self._stats_ns: Dict[str, Dict[str, int]] = {}
+
+    # ==========================================================
+    # ⚙️ CONFIGURACIÓN
+    # ==========================================================
+    def configurar_namespace(self, namespace: str, ttl: Optional[float] = None, stale: Optional[float] = None):
+        with self._lock:
+            self._namespaces[namespace] = {
+                "ttl": self.ttl_defecto if ttl is None else ttl,
+                "stale": self.stale_defecto if stale is None else stale,
+            }
+
+    def _politica(self, namespace: str) -> Dict[str, float]:
+        return self._namespaces.get(namespace) or {"ttl": self.ttl_defecto, "stale": self.stale_defecto}
+
+    @staticmethod
+    def _estimar_tamano(valor: Any) -> int:
+        try:
+            return len(json.dumps(valor, default=str))
+        except (TypeError, ValueError):
+            return sys.getsizeof(valor)
+
+    def _contar(self, namespace: str, campo: str):
+        self._stats[campo] += 1
+        ns = self._stats_ns.setdefault(namespace, {"hits": 0, "misses": 0, "stale_hits": 0})
+        if campo in ns:
+            ns[campo] += 1
+
+    # ==========================================================
+    # 📖 LECTURA / ESCRITURA
+    # ==========================================================
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor fresco o `default` (no dispara cargas)."""
+        with self._lock:
+            entrada = self._datos.get((namespace, key))
+            if entrada and entrada.expira > time.time():
+                self._datos.move_to_end((namespace, key))
+                self._contar(namespace, "hits")
+                return entrada.valor
+            self._contar(namespace, "misses")
+            return default
+
+    def set(self, namespace: str, key: Hashable, valor: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._versiones[(namespace, key)] = self._versiones.get((namespace, key), 0) + 1
+            self._poner(namespace, key, valor, ttl)
+
+    def _poner(self, namespace: str, key: Hashable, valor: Any, ttl: Optional[float] = None):
+        politica = self._politica(namespace)
+        ttl = politica["ttl"] if ttl is None else ttl
+        ahora = time.time()
+        entrada = _Entrada(valor, ahora + ttl, ahora + ttl + politica["stale"], self._estimar_tamano(valor))
+        with self._lock:
+            anterior = self._datos.pop((namespace, key), None)
+            if anterior:
+                self._bytes -= anterior.tamano
+            self._datos[(namespace, key)] = entrada
+            self._bytes += entrada.tamano
+            self._evictar()
+
+    def actualizar(self, namespace: str, key: Hashable, fn: Callable[[Any], Any],
+                   si_no_existe: Any = None) -> bool:
+        """Aplica fn al valor cacheado (write-through). Si no existe guarda `si_no_existe`."""
+        with self._lock:
+            entrada = self._datos.get((namespace, key))
+            if entrada is not None:
+                self.set(namespace, key, fn(entrada.valor))
+                return True
+            if si_no_existe is not None:
+                self.set(namespace, key, si_no_existe)
+            return False
+
+    def _evictar(self):
+        """Expulsa las entradas menos usadas hasta cumplir los límites."""
+        while self._datos and (len(self._datos) > self.max_entradas or self._bytes > self.max_bytes):
+            _, entrada = self._datos.popitem(last=False)
+            self._bytes -= entrada.tamano
+            self._stats["evicciones"] += 1
+
+    # ==========================================================
+    # 🚀 CARGA SINGLE-FLIGHT + STALE-WHILE-REVALIDATE
+    # ==========================================================
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Any],
+                    ttl: Optional[float] = None) -> Any:
+        """
+        Devuelve el valor cacheado o lo carga con `loader()`.
+        Si el loader lanza excepción, ésta se propaga y no se cachea nada.
+        """
+        clave = (namespace, key)
+        with self._lock:
+            entrada = self._datos.get(clave)
+            ahora = time.time()
+            if entrada is not None:
+                if entrada.expira > ahora:
+                    self._datos.move_to_end(clave)
+                    self._contar(namespace, "hits")
+                    return entrada.valor
+                if entrada.obsoleta_hasta > ahora:
+                    self._contar(namespace, "stale_hits")
+                    self._refrescar_en_fondo(namespace, key, loader, ttl)
+                    return entrada.valor
+                self._datos.pop(clave)
+                self._bytes -= entrada.tamano
+                self._stats["expiradas"] += 1
+
+            self._contar(namespace, "misses")
+            vuelo = self._en_vuelo.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = _Vuelo()
+                self._en_vuelo[clave] = vuelo
+            else:
+                self._stats["coalescidas"] += 1
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.valor
+
+        self._cargar(namespace, key, loader, ttl, vuelo)
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor
+
+    def _cargar(self, namespace: str, key: Hashable, loader: Callable[[], Any],
+                ttl: Optional[float], vuelo: _Vuelo):
+        clave = (namespace, key)
+        with self._lock:
+            version = self._versiones.get(clave, 0)
+        try:
+            vuelo.valor = loader()
+            with self._lock:
+                self._stats["cargas"] += 1
+                if self._versiones.get(clave, 0) == version:
+                    self._poner(namespace, key, vuelo.valor, ttl)
+        except Exception as e:
+            vuelo.error = e
+            with self._lock:
+                self._stats["errores_carga"] += 1
+        finally:
+            with self._lock:
+                self._en_vuelo.pop((namespace, key), None)
+            vuelo.evento.set()
+
+    def _refrescar_en_fondo(self, namespace: str, key: Hashable, loader: Callable[[], Any],
+                            ttl: Optional[float]):
+        """Lanza (una sola vez por clave) la recarga de una entrada obsoleta."""
+        clave = (namespace, key)
+        if clave in self._en_vuelo:
+            return
+        vuelo = _Vuelo()
+        self._en_vuelo[clave] = vuelo
+        self._stats["refrescos"] += 1
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._pool.submit(self._cargar, namespace, key, loader, ttl, vuelo)
+
+    # ==========================================================
+    # 🧹 INVALIDACIÓN
+    # ==========================================================
+    def invalidar(self, namespace: Optional[str] = None, key: Hashable = None):
+        """
+        Borra entradas. Sin argumentos vacía todo; con `key` borra esa clave y
+        las claves tupla cuyo primer elemento sea `key` (ej. (email, limit)).
+        """
+        def coincide(clave: tuple) -> bool:
+            ns, k = clave
+            if namespace is not None and ns != namespace:
+                return False
+            return key is None or k == key or (isinstance(k, tuple) and bool(k) and k[0] == key)
+
+        with self._lock:
+            for clave in list(self._datos.keys()):
+                if coincide(clave):
+                    self._bytes -= self._datos.pop(clave).tamano
+                    self._versiones[clave] = self._versiones.get(clave, 0) + 1
+            for clave in list(self._en_vuelo.keys()):
+                if coincide(clave):
+                    self._versiones[clave] = self._versiones.get(clave, 0) + 1
+
+    def clear(self):
+        self.invalidar()
+
+    # ==========================================================
+    # 📊 MÉTRICAS
+    # ==========================================================
+    def tamano(self, namespace: str) -> int:
+        with self._lock:
+            return sum(1 for ns, _ in self._datos if ns == namespace)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self._stats["hits"] + self._stats["misses"] + self._stats["stale_hits"]
+            aciertos = self._stats["hits"] + self._stats["stale_hits"]
+            por_namespace = {}
+            for ns in set(self._namespaces) | set(self._stats_ns):
+                s = self._stats_ns.get(ns, {"hits": 0, "misses": 0, "stale_hits": 0})
+                por_namespace[ns] = {"entradas": self.tamano(ns), **s}
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_entradas": self.max_entradas,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+                "hit_ratio": round(aciertos / consultas, 3) if consultas else 0.0,
+                "por_namespace": por_namespace,
+            }
@@ -7,44 +7,267 @@ import base64
 import time
 import threading
 import json
+import atexit
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout, as_completed
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional, Any, Union
-
-# Importamos Supabase de forma segura
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
+from typing import Dict, Iterator, List, Optional, Any, Union
+
+# Supabase sólo se comprueba aquí: importarlo cuesta cientos de ms y se hace
+# dentro de _initialize_supabase (en segundo plano si se pide)
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
+if not SUPABASE_AVAILABLE:
     print("!! [CLOUD] Librería supabase no instalada. Ejecutando en MODO OFFLINE.")
 
+from archeon_write_queue import WriteBehindExecutor, InsertBatcher, AgregadorDeltas, Debouncer
+from archeon_cache import CacheLRU
+from archeon_local_store import LocalStore
+from archeon_hashing import PasswordHasher, parsear_registro
+from archeon_resilience import CircuitBreaker, ClienteResiliente, LimitadorIntentos, PoliticaLlamadas, es_transitorio
+from archeon_realtime import FeedCambios, FeedSupabase, REALTIME_AVAILABLE
+from archeon_skills import IndiceTriggers
+from archeon_metrics import RegistroMetricas
+
 class CloudManager:
     """
     Gestor de la nube (Supabase + Postgres) BLINDADO Y AUTOMATIZADO.
     Versión optimizada v10.0 con Caché + Async + Conexión Supabase
     """
+
+    # Tareas que pueden derramarse a disco y reanudarse tras un reinicio
+    _TAREAS_DIFERIBLES = {
+        "_guardar_config_cloud", "_guardar_comando_cloud", "_incrementar_comando_cloud", "_guardar_skill_cloud",
+        "_guardar_skill_internal", "_borrar_skill_cloud", "_update_login_time", "_tarea_journal",
+        "_marcar_leidos_cloud",
+    }
+
+    # Pasos del borrado de cuenta que se ejecutan en paralelo (`users` va al final)
+    _PASOS_BORRADO = (
+        "memoria", "gustos", "comandos", "chats_mensajes", "configuraciones",
+        "skills", "sessions", "verification_codes", "archeon-drive",
+    )
+    # Tablas heredadas que pueden no existir en el proyecto
+    _PASOS_OPCIONALES = {"configuraciones"}
+
+    # Tabla local -> namespace de caché que hay que invalidar al sincronizar
+    _NAMESPACE_TABLA = {
+        "config": "config", "memoria": "recuerdos", "gustos": "gustos",
+        "comandos": "comandos", "skills": "skills",
+        "chats_mensajes": "no_leidos", "no_leidos": "no_leidos",
+    }
+
+    # Tablas remotas vigiladas por el feed: columna del filtro y tabla local
+    _TABLAS_REALTIME = {
+        "users": ("id", "config"), "gustos": ("user_id", "gustos"),
+        "comandos": ("user_id", "comandos"), "skills": ("user_id", "skills"),
+    }
     
     # ==========================================================
     # 🔧 INICIALIZACIÓN Y CONFIGURACIÓN (OPTIMIZADO v10.0)
     # ==========================================================
-    def __init__(self, supabase_config: Dict[str, str] = None, secret_key: str = None):
-        """Inicializa Supabase con múltiples métodos de autenticación"""
+    def __init__(self, supabase_config: Dict[str, str] = None, secret_key: str = None,
+                 en_segundo_plano: Optional[bool] = None):
+        """
+        Inicializa Supabase con múltiples métodos de autenticación.
+
+        Con `en_segundo_plano` (o AR_CLOUD_BACKGROUND=1) el import y el
+        create_client van a un hilo y el constructor vuelve enseguida; `listo`
+        se resuelve al terminar y las operaciones que necesitan la nube la
+        esperan hasta AR_CLOUD_READY_WAIT segundos.
+        """
+        # Latencia por (tabla, operación) de todas las llamadas a Supabase;
+        # AR_METRICS_FILE vuelca una línea JSON por ciclo de sincronización
+        self._metricas = RegistroMetricas()
+        self.METRICS_FILE = os.getenv("AR_METRICS_FILE")
+        # Timeouts, reintentos y circuit breaker compartidos por todas las llamadas
+        self._politica = PoliticaLlamadas(
+            CircuitBreaker(
+                umbral=int(os.getenv("AR_CB_THRESHOLD", "5")),
+                enfriamiento=float(os.getenv("AR_CB_COOLDOWN", "30"))
+            ),
+            reintentos=int(os.getenv("AR_RETRIES", "3")),
+            metricas=self._metricas
+        )
         self.cloud_ready = False 
         self.supabase = None
         self.client = None
         
         # ✅ MEJORA v10.0: SISTEMA DE CACHÉ INTELIGENTE (RAM)
-        self._config_cache = {}  # {'email': {'data': {...}, 'timestamp': 12345678}}
-        self._gustos_cache = {}
-        self._comandos_cache = {}
         self.CACHE_TTL = 300  # 5 minutos de vida para la caché
+        self.cache = CacheLRU(
+            max_entradas=int(os.getenv("AR_CACHE_ENTRIES", "512")),
+            max_bytes=int(os.getenv("AR_CACHE_BYTES", str(4 * 1024 * 1024))),
+            ttl=self.CACHE_TTL,
+        )
+        for namespace in ("config", "gustos", "comandos", "skills"):
+            self.cache.configurar_namespace(namespace, ttl=self.CACHE_TTL)
+        self.cache.configurar_namespace("recuerdos", ttl=60, stale=30)
+        self.cache.configurar_namespace("no_leidos", ttl=60, stale=30)
+
+        # Feed de cambios (Realtime): mientras está conectado la caché sólo se
+        # invalida por eventos, así que el TTL puede ser mucho más largo
+        self.CACHE_TTL_REALTIME = int(os.getenv("AR_CACHE_TTL_REALTIME", "3600"))
+        self._feed: Optional[FeedCambios] = None
+        self._observados: Dict[str, List[int]] = {}
+        self._observados_lock = threading.Lock()
+        self._usuario_actual: Optional[str] = None
+
+        # Cola de escritura en segundo plano: pool fijo en vez de un hilo por llamada
+        self._writer = WriteBehindExecutor(
+            workers=int(os.getenv("AR_WRITE_WORKERS", "2")),
+            max_queue=int(os.getenv("AR_WRITE_QUEUE", "256")),
+            politica=os.getenv("AR_WRITE_POLICY", "block"),
+            spill_dir=os.getenv("AR_SPILL_DIR", "archeon_spill"),
+            resolver=self._resolver_tarea,
+        )
+        # Lotes para las tablas con muchas inserciones (una llamada HTTP por lote)
+        self._batcher = InsertBatcher(
+            self._enviar_lote_cloud,
+            self._writer,
+            max_filas=int(os.getenv("AR_BATCH_ROWS", "50")),
+            max_espera=float(os.getenv("AR_BATCH_WAIT", "1.0")),
+            claves_upsert={"gustos": ("user_id", "gusto")},
+        )
+        # Usos de comandos: se suman en RAM y se sube un delta por comando
+        self._usos = AgregadorDeltas(
+            self._enviar_delta_comando,
+            intervalo=float(os.getenv("AR_USAGE_FLUSH", "10")),
+        )
+        # Config: los cambios de una ráfaga se funden en un único parche por usuario
+        self.CONFIG_CAS_INTENTOS = 3
+        self._parches_config: Dict[str, Dict[str, Any]] = {}
+        self._parches_lock = threading.Lock()
+        self._config_debounce = Debouncer(
+            self._subir_parche_config,
+            espera=float(os.getenv("AR_CONFIG_DEBOUNCE", "1.5")),
+            espera_max=float(os.getenv("AR_CONFIG_DEBOUNCE_MAX", "5")),
+        )
+        # Hilos para precargar la siguiente página del historial
+        self._prefetch: Optional[ThreadPoolExecutor] = None
+        # Índice de triggers de skills por email (se construye en la primera búsqueda)
+        self._indices_skills: Dict[str, IndiceTriggers] = {}
+        # Resultado de la última precarga tras el login (warm_user)
+        self._ultima_precarga: Optional[Dict[str, Any]] = None
+        # RPCs que el servidor no tiene instaladas (se usa el camino alternativo)
+        self._rpc_ausentes = set()
+        atexit.register(self.close)
 
-        if SUPABASE_AVAILABLE:
-            self._initialize_supabase(supabase_config)
+        # Espejo local (SQLite): todas las lecturas salen de aquí y las escrituras
+        # quedan en un diario hasta que Supabase las confirma
+        self.local = LocalStore(os.getenv("AR_LOCAL_DB", "archeon_local.db"))
+        self.SYNC_INTERVAL = 30  # Segundos entre sincronizaciones en segundo plano
+        self.SYNC_PAGE = 500  # Filas por página al descargar cambios
+
+        self._iniciar_sincronizacion()
 
         key_source = secret_key or os.getenv("AR_SECRET_KEY", "AR_Default_Development_Key_2025")
         self.secret_key = key_source.encode()
-        
+
+        # Revocaciones de tokens v2 (jti de 16 bytes -> expiración) y bajas por email
+        self.SESSION_HOURS = 24
+        self._revocados: Dict[bytes, float] = {}
+        self._emails_revocados: Dict[str, float] = {}
+        self._revocados_lock = threading.Lock()
+        # Tokens v2 con firma ya verificada -> (jti, email, emitido, expira), LRU
+        self._tokens_verificados: "OrderedDict[str, tuple]" = OrderedDict()
+        self.MAX_TOKENS_VERIFICADOS = 1024
+
+        # Purga de sesiones caducadas: filas por lote y presupuesto de tiempo por pasada
+        self.PURGE_BATCH = int(os.getenv("AR_PURGE_BATCH", "1000"))
+        self.PURGE_BUDGET = float(os.getenv("AR_PURGE_BUDGET", "5.0"))
+        self.ERASE_WORKERS = int(os.getenv("AR_ERASE_WORKERS", "4"))
+
+        # Códigos de verificación: los fallos y los envíos se limitan en local,
+        # así el fuerza bruta nunca llega a la base de datos
+        ventana_codigos = float(os.getenv("AR_CODE_WINDOW", "900"))
+        self._fallos_codigo = LimitadorIntentos(int(os.getenv("AR_CODE_MAX_ATTEMPTS", "5")), ventana_codigos)
+        self._envios_codigo = LimitadorIntentos(int(os.getenv("AR_CODE_MAX_ISSUES", "3")), ventana_codigos)
+
+        # Hash de contraseñas fuera del hilo llamador (AR_HASH_ITERATIONS manda sobre el perfil)
+        iteraciones = os.getenv("AR_HASH_ITERATIONS")
+        self.hasher = PasswordHasher(
+            iteraciones=int(iteraciones) if iteraciones else None,
+            perfil=os.getenv("AR_HASH_PROFILE", "estandar"),
+            workers=int(os.getenv("AR_HASH_WORKERS", "2")),
+            max_cola=int(os.getenv("AR_HASH_QUEUE", "8")),
+        )
+        # Registro versionado (pbkdf2_sha256$iter$salt$hash) en altas, cambios de
+        # contraseña y regeneración tras el login. Sin AR_HASH_REHASH=1 se escribe
+        # el formato antiguo (hash hex + columna salt), el único que lee la Base PC
+        self.HASH_REHASH = os.getenv("AR_HASH_REHASH") == "1"
+
+        # Arranque de la conexión (al final: el hilo puede usar todo lo anterior)
+        if en_segundo_plano is None:
+            en_segundo_plano = os.getenv("AR_CLOUD_BACKGROUND") == "1"
+        self.READY_WAIT = float(os.getenv("AR_CLOUD_READY_WAIT", "10"))
+        self._listo: Future = Future()
+        self._arranque: Dict[str, Any] = {"segundo_plano": en_segundo_plano, "ms": None,
+                                          "primer_frame_ms": None}
+        if en_segundo_plano:
+            threading.Thread(target=self._arrancar, args=(supabase_config,),
+                             daemon=True, name="cloud-init").start()
+        else:
+            self._arrancar(supabase_config)
+
+    def _arrancar(self, supabase_config: Union[Dict, str, None]):
+        """Crea el cliente, sube lo que se anotó en el diario mientras tanto y resuelve `listo`."""
+        inicio = time.perf_counter()
+        try:
+            if os.getenv("AR_FAKE_SUPABASE") == "1":
+                self._initialize_fake()
+            elif SUPABASE_AVAILABLE:
+                self._initialize_supabase(supabase_config)
+            if self.cloud_ready:
+                self._subir_diario()
+        except Exception as e:
+            print(f"❌ [CLOUD] Error en el arranque: {e}")
+        finally:
+            self._arranque["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+            self._listo.set_result(self.cloud_ready)
+        if self._arranque["segundo_plano"]:
+            print(f">> [CLOUD] Arranque en segundo plano: {self._arranque['ms']} ms "
+                  f"({'online' if self.cloud_ready else 'offline'})")
+
+    @property
+    def listo(self) -> Future:
+        """Futuro que se resuelve (con cloud_ready) cuando termina el arranque."""
+        return self._listo
+
+    def esperar_listo(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta que termine el arranque o venza el plazo; devuelve cloud_ready."""
+        try:
+            self._listo.result(self.READY_WAIT if timeout is None else timeout)
+        except FuturoTimeout:
+            print("!! [CLOUD] La nube sigue arrancando: se continúa en modo offline")
+        return self.cloud_ready
+
+    def marcar_primer_frame(self, ms: float):
+        """La UI informa de cuánto tardó en pintar la primera pantalla."""
+        self._arranque["primer_frame_ms"] = round(ms, 1)
+        print(f">> [MÓVIL] Primer frame en {ms:.0f} ms "
+              f"(nube {'lista' if self._listo.done() else 'aún arrancando'})")
+
+    @property
+    def cloud_ready(self) -> bool:
+        """Conectado y con el circuito sin abrir (abierto = modo offline inmediato)."""
+        return self._conectado and self._politica.breaker.estado != CircuitBreaker.ABIERTO
+
+    @cloud_ready.setter
+    def cloud_ready(self, valor: bool):
+        self._conectado = bool(valor)
+
+    @property
+    def supabase(self):
+        return self._supabase
+
+    @supabase.setter
+    def supabase(self, cliente):
+        # Cualquier cliente asignado (real o de pruebas) pasa por la política de llamadas
+        if cliente is not None and not isinstance(cliente, ClienteResiliente):
+            cliente = ClienteResiliente(cliente, self._politica)
+        self._supabase = cliente
+
     def _initialize_supabase(self, supabase_config: Union[Dict, str, None]):
         """✅ MEJORA v10.0: Inicialización Supabase en memoria"""
         try:
@@ -80,9 +303,12 @@ class CloudManager:
                         print(f">> [CLOUD] Configurando Supabase desde archivo: {supabase_config}")
             
             if config and config.get("url") and config.get("key"):
-                self.supabase = create_client(config["url"], config["key"])
+                from supabase import create_client
+                self.supabase = create_client(config["url"], config["key"], **self._opciones_cliente())
                 self.cloud_ready = True
                 print("🔥 [CLOUD] Supabase CONECTADO correctamente (Async Ready)")
+                if REALTIME_AVAILABLE and os.getenv("AR_REALTIME", "1") != "0":
+                    self.feed = FeedSupabase(config["url"], config["key"])
                 self._iniciar_mantenimiento()
             else:
                 print("❌ [CLOUD] No se pudo inicializar Supabase: configuración incompleta")
@@ -92,12 +318,421 @@ class CloudManager:
             print(f"❌ [CLOUD] Error inicializando Supabase: {e}")
             self.cloud_ready = False
     
-    def _run_async(self, target_func, *args):
-        """✅ MEJORA v10.0: Ejecuta una función en segundo plano para no bloquear"""
+    def _opciones_cliente(self) -> Dict[str, Any]:
+        """
+        Timeouts en el propio transporte (httpx de postgrest y storage): así una
+        llamada colgada se corta de verdad y devuelve su hilo a la política.
+        """
+        try:
+            from supabase import ClientOptions
+            politica = self._politica
+            consultas = ("select", "insert", "upsert", "update", "delete", "rpc")
+            return {"options": ClientOptions(
+                postgrest_client_timeout=max(politica.timeout_transporte(op) for op in consultas),
+                storage_client_timeout=politica.timeout_transporte("storage"),
+            )}
+        except (ImportError, TypeError) as e:
+            print(f"!! [CLOUD] Cliente sin timeout de transporte: {e}")
+            return {}
+
+    def _initialize_fake(self):
+        """
+        AR_FAKE_SUPABASE=1: backend en memoria (archeon_fake_supabase) con su
+        feed Realtime local. Latencia y fallos se ajustan con AR_FAKE_*.
+        """
+        from archeon_fake_supabase import SupabaseEnMemoria
+        from archeon_realtime import FeedLocal
+
+        feed = FeedLocal()
+        self.supabase = SupabaseEnMemoria.desde_entorno(feed=feed)
+        self.cloud_ready = True
+        self.feed = feed
+        print("🧪 [CLOUD] Supabase EN MEMORIA (AR_FAKE_SUPABASE=1): nada sale a la red")
+
+    def _run_async(self, target_func, *args, key=None):
+        """Encola la función en la cola de escritura. Las tareas con la misma clave
+        (por defecto el primer argumento: email o doc_id) se ejecutan en orden."""
         if not self.cloud_ready: 
             return
-        t = threading.Thread(target=target_func, args=args, daemon=True)
+        if key is None and args:
+            key = args[0]
+        self._writer.submit(key, target_func, *args)
+
+    def _resolver_tarea(self, nombre: str):
+        """Traduce el nombre guardado en disco a un método permitido."""
+        if nombre not in self._TAREAS_DIFERIBLES:
+            return None
+        return getattr(self, nombre, None)
+
+    def _enviar_lote_cloud(self, tabla: str, filas: List[Dict[str, Any]], modo: str):
+        """Una sola llamada bulk por lote. Lanza excepción si Supabase la rechaza."""
+        query = self.supabase.table(tabla)
+        if modo == "upsert":
+            query.upsert(filas).execute()
+        else:
+            query.insert(filas).execute()
+
+    def flush_writes(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todas las escrituras pendientes lleguen a la nube."""
+        self._usos.flush()
+        self._config_debounce.flush()
+        self._batcher.flush()
+        return self._writer.flush(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> bool:
+        """Vacía lotes y cola de escritura y detiene sus hilos (llamar al salir)."""
+        if self._feed is not None:
+            self._feed.detener()
+        self._usos.close()
+        self._config_debounce.close()
+        self._batcher.close()
+        return self._writer.close(timeout)
+
+    # ==========================================================
+    # 📒 DIARIO LOCAL Y SINCRONIZACIÓN (OFFLINE-FIRST)
+    # ==========================================================
+    def _journal_lote(self, tabla: str, fila: Dict[str, Any], modo: str = "insert"):
+        """Anota una fila en el diario y la manda al lote de su tabla si hay nube."""
+        payload = {"fila": fila, "modo": modo}
+        jid = self.local.encolar(tabla, "lote", payload)
+        self._despachar_journal(jid, tabla, "lote", payload)
+
+    def _journal_tarea(self, tabla: str, user_id: Optional[str], nombre_fn: str, *args):
+        """Anota una tarea (config, comando, skill) en el diario y la encola si hay nube."""
+        payload = {"fn": nombre_fn, "args": list(args), "user_id": user_id}
+        jid = self.local.encolar(tabla, "tarea", payload)
+        self._despachar_journal(jid, tabla, "tarea", payload)
+
+    def _despachar_journal(self, jid: int, tabla: str, tipo: str, payload: Dict[str, Any]):
+        if not self.cloud_ready or not self.local.tomar(jid):
+            return
+        if tipo == "lote":
+            self._batcher.agregar(tabla, payload["fila"], payload.get("modo", "insert"),
+                                  callback=self._callback_journal(jid))
+        else:
+            # Las tareas sobre tablas que van en lote comparten cola con sus lotes,
+            # así se aplican después de las filas que ya estaban en camino
+            clave = ("lote", tabla) if tabla in ("memoria", "chats_mensajes", "gustos") else payload.get("user_id")
+            self._run_async(self._tarea_journal, jid, payload["fn"], *payload["args"], key=clave)
+
+    def _callback_journal(self, jid: int):
+        def callback(ok: bool, error: Optional[str]):
+            if ok:
+                self.local.confirmar(jid)
+            else:
+                self.local.liberar(jid, error, contar=self.cloud_ready)
+        return callback
+
+    def _tarea_journal(self, jid: int, nombre_fn: str, *args):
+        """Ejecuta una tarea del diario y la confirma sólo si la nube la aceptó."""
+        if self.local.confirmado(jid):
+            return
+        fn = self._resolver_tarea(nombre_fn)
+        if fn is not None and fn(*args):
+            self.local.confirmar(jid)
+        else:
+            self.local.liberar(jid, f"{nombre_fn} falló", contar=self.cloud_ready)
+
+    def _iniciar_sincronizacion(self):
+        """Hilo que sube el diario pendiente y baja los cambios remotos."""
+        def tarea_sync():
+            while True:
+                time.sleep(self.SYNC_INTERVAL)
+                try:
+                    if self.cloud_ready:
+                        self.sincronizar_revocaciones()
+                        self.reanudar_borrados()
+                        self.sincronizar()
+                except Exception as e:
+                    print(f"!! [SYNC] Error en sincronización: {e}")
+                if self.METRICS_FILE:
+                    self.exportar_metricas("jsonl", self.METRICS_FILE)
+
+        t = threading.Thread(target=tarea_sync, daemon=True)
         t.start()
+
+    def _subir_diario(self) -> int:
+        """Encola hacia la nube las entradas del diario que siguen pendientes."""
+        subidas = 0
+        for entrada in self.local.pendientes():
+            self._despachar_journal(entrada["id"], entrada["tabla"], entrada["tipo"], entrada["payload"])
+            subidas += 1
+        return subidas
+
+    def sincronizar(self, email: Optional[str] = None) -> Dict[str, Any]:
+        """Reconciliación con Supabase: sube el diario y descarga deltas por fecha."""
+        if not self.cloud_ready:
+            return {"ok": False, "subidas": 0, "descargas": 0}
+
+        subidas = self._subir_diario()
+
+        descargas = 0
+        vigiladas = {tabla for _, tabla in self._TABLAS_REALTIME.values()}
+        for usuario in ([email] if email else self.local.usuarios()):
+            doc_id = self._get_user_doc_id(usuario)
+            al_dia = self._feed_al_dia(usuario)
+            for tabla in ("config", "memoria", "gustos", "comandos", "skills", "chats_mensajes", "no_leidos"):
+                if not self.local.sincronizado(doc_id, tabla):
+                    continue  # Se descargará completa en su primera lectura
+                if al_dia and tabla in vigiladas:
+                    continue  # El feed ya trae sus cambios al momento
+                try:
+                    descargas += self._descargar_tabla(usuario, tabla)
+                except Exception as e:
+                    print(f"!! [SYNC] Error descargando {tabla}: {e}")
+
+        if subidas or descargas:
+            print(f">> [SYNC] Subidas: {subidas} | Filas descargadas: {descargas}")
+        return {"ok": True, "subidas": subidas, "descargas": descargas}
+
+    def _descargar_tabla(self, email: str, tabla: str, completo: bool = False) -> int:
+        """
+        Copia a SQLite los cambios remotos de una tabla. Usa `fecha` (o
+        `actualizado` en users) como cursor: sólo baja lo nuevo desde el último sync.
+        """
+        doc_id = self._get_user_doc_id(email)
+        cursor = None if completo else self.local.cursor(doc_id, tabla)
+        n = 0
+
+        if tabla == "config":
+            response = self.supabase.table("users") \
+                .select("config, actualizado") \
+                .eq("id", doc_id) \
+                .execute()
+            nuevo_cursor = cursor
+            if response.data:
+                fila = response.data[0]
+                actualizado = fila.get("actualizado")
+                if not cursor or (actualizado and actualizado > cursor):
+                    config_str = fila.get("config") or "{}"
+                    remoto = json.loads(config_str) if isinstance(config_str, str) else config_str
+                    # Los cambios locales aún sin subir ganan sobre la copia remota
+                    pendientes = self.local.parches_config_pendientes(doc_id)
+                    self.local.guardar_config(doc_id, {**remoto, **pendientes}, actualizado, reemplazar=True)
+                    n = 1
+                nuevo_cursor = actualizado or cursor
+            self.local.marcar_sync(doc_id, tabla, nuevo_cursor)
+
+        elif tabla == "no_leidos":
+            # Contadores por contacto: una fila por conversación, no por mensaje.
+            # También recoge lo marcado como leído desde otros equipos.
+            antes = self.local.no_leidos(doc_id)
+            conteos = self._descargar_no_leidos(doc_id)
+            self.local.marcar_sync(doc_id, tabla, None)
+            n = int(conteos != antes)
+
+        elif tabla == "skills":
+            # Sin columna de fecha: copia completa (son pocas filas)
+            response = self.supabase.table("skills").select("*").eq("user_id", doc_id).execute()
+            self.local.reemplazar_skills(doc_id, response.data)
+            indice = self._indices_skills.get(email)
+            if indice is not None:
+                indice.reemplazar(self.local.skills(doc_id))
+            self.local.marcar_sync(doc_id, tabla, None)
+            n = len(response.data)
+
+        else:
+            filas = []
+            if cursor:
+                # Delta: páginas ascendentes desde el cursor (gte + deduplicado local)
+                while True:
+                    response = self.supabase.table(tabla) \
+                        .select("*") \
+                        .eq("user_id", doc_id) \
+                        .gte("fecha", cursor) \
+                        .order("fecha") \
+                        .limit(self.SYNC_PAGE) \
+                        .execute()
+                    filas.extend(response.data)
+                    if len(response.data) < self.SYNC_PAGE:
+                        break
+                    siguiente = response.data[-1].get("fecha")
+                    if not siguiente or siguiente == cursor:
+                        break
+                    cursor = siguiente
+            else:
+                # Primera descarga: sólo la historia reciente
+                response = self.supabase.table(tabla) \
+                    .select("*") \
+                    .eq("user_id", doc_id) \
+                    .order("fecha", desc=True) \
+                    .limit(self.SYNC_PAGE) \
+                    .execute()
+                filas = response.data
+
+            if tabla in ("memoria", "chats_mensajes"):
+                self.local.insertar_filas(tabla, filas)
+            elif tabla == "gustos":
+                self.local.upsert_gustos(filas)
+            elif tabla == "comandos":
+                self.local.upsert_comandos(filas)
+
+            fechas = [f["fecha"] for f in filas if f.get("fecha")]
+            self.local.marcar_sync(doc_id, tabla, max(fechas) if fechas else cursor)
+            n = len(filas)
+
+        namespace = self._NAMESPACE_TABLA.get(tabla)
+        if n and namespace:
+            self.cache.invalidar(namespace, email)
+        return n
+
+    # ==========================================================
+    # 📡 CAMBIOS EN TIEMPO REAL (FEED -> ESPEJO LOCAL -> CACHÉ)
+    # ==========================================================
+    @property
+    def feed(self) -> Optional[FeedCambios]:
+        return self._feed
+
+    @feed.setter
+    def feed(self, feed: Optional[FeedCambios]):
+        """Cambia el feed (FeedSupabase, o FeedLocal en pruebas) y traslada las suscripciones."""
+        observados = list(self._observados)
+        for email in observados:
+            self.dejar_de_observar(email)
+        if self._feed is not None:
+            self._feed.detener()
+        self._feed = feed
+        if feed is not None:
+            feed.al_cambiar_estado(self._al_cambiar_feed)
+            for email in observados:
+                self.observar_cambios(email)
+
+    @property
+    def usuario_actual(self) -> Optional[str]:
+        return self._usuario_actual
+
+    @usuario_actual.setter
+    def usuario_actual(self, email: Optional[str]):
+        """La interfaz fija aquí la sesión activa: sólo se vigilan sus filas."""
+        anterior, self._usuario_actual = self._usuario_actual, email
+        if anterior and anterior != email:
+            self.dejar_de_observar(anterior)
+        if email and email != "guest":
+            self.observar_cambios(email)
+
+    def observar_cambios(self, email: str) -> bool:
+        """Suscribe al feed las filas del usuario en users, gustos, comandos y skills."""
+        if self._feed is None:
+            return False
+        doc_id = self._get_user_doc_id(email)
+        with self._observados_lock:
+            if email in self._observados:
+                return True
+            self.local.registrar_usuario(doc_id, email)
+            aplicar = lambda cambio: self._aplicar_cambio(email, doc_id, cambio)
+            self._observados[email] = [
+                self._feed.suscribir(tabla, columna, doc_id, aplicar)
+                for tabla, (columna, _) in self._TABLAS_REALTIME.items()
+            ]
+        if self._feed.conectado:
+            self._ponerse_al_dia_async(email)
+        else:
+            self._feed.iniciar()  # Al conectar avisa por _al_cambiar_feed
+        return True
+
+    def dejar_de_observar(self, email: str):
+        with self._observados_lock:
+            subs = self._observados.pop(email, [])
+        for sub_id in subs:
+            self._feed.cancelar(sub_id)
+
+    def _feed_al_dia(self, email: str) -> bool:
+        return self._feed is not None and self._feed.conectado and email in self._observados
+
+    def _al_cambiar_feed(self, conectado: bool):
+        """
+        Conectado: TTL largo y puesta al día de lo ocurrido antes de suscribirse.
+        Desconectado: vuelve el TTL corto y se descarta lo cacheado, que ya no
+        está vigilado (se recarga del espejo local, sin red).
+        """
+        ttl = self.CACHE_TTL_REALTIME if conectado else self.CACHE_TTL
+        namespaces = [self._NAMESPACE_TABLA[tabla] for _, tabla in self._TABLAS_REALTIME.values()]
+        for namespace in namespaces:
+            self.cache.configurar_namespace(namespace, ttl=ttl)
+        print(f">> [REALTIME] Feed {'conectado' if conectado else 'desconectado'} (TTL caché {ttl}s)")
+        for email in list(self._observados):
+            if conectado:
+                self._ponerse_al_dia_async(email)
+            else:
+                for namespace in namespaces:
+                    self.cache.invalidar(namespace, email)
+
+    def _ponerse_al_dia_async(self, email: str):
+        threading.Thread(target=self._ponerse_al_dia, args=(email,), daemon=True,
+                         name="realtime-catchup").start()
+
+    def _ponerse_al_dia(self, email: str):
+        """Delta de las tablas vigiladas: cubre el hueco entre el último sync y el feed."""
+        if not self.cloud_ready:
+            return
+        doc_id = self._get_user_doc_id(email)
+        for _, tabla in self._TABLAS_REALTIME.values():
+            if not self.local.sincronizado(doc_id, tabla):
+                continue
+            try:
+                self._descargar_tabla(email, tabla)
+            except Exception as e:
+                print(f"!! [REALTIME] Error poniendo al día {tabla}: {e}")
+
+    def _aplicar_cambio(self, email: str, doc_id: str, cambio: Dict[str, Any]):
+        """
+        Aplica un cambio remoto al espejo local y parchea la entrada cacheada
+        (si la hay) con el resultado, sin tocar las demás claves del usuario.
+        """
+        tabla, tipo = cambio["tabla"], cambio["tipo"]
+        nuevo, anterior = cambio["nuevo"], cambio["anterior"]
+
+        if tabla == "users":
+            if tipo == "DELETE":
+                self.cache.invalidar(key=email)  # Cuenta borrada desde otro equipo
+                return
+            if "config" not in nuevo:
+                return
+            config_str = nuevo.get("config") or "{}"
+            remoto = json.loads(config_str) if isinstance(config_str, str) else config_str
+            # Los cambios locales aún sin subir ganan sobre la copia remota
+            pendientes = self.local.parches_config_pendientes(doc_id)
+            self.local.guardar_config(doc_id, {**remoto, **pendientes}, nuevo.get("actualizado"), reemplazar=True)
+            self.cache.actualizar("config", email,
+                                  lambda _: {**self._default_config(email), **(self.local.config(doc_id) or {})})
+
+        elif tabla == "gustos":
+            if tipo == "DELETE":
+                if anterior.get("gusto") is None:
+                    return  # Sin REPLICA IDENTITY FULL el DELETE sólo trae el id
+                self.local.borrar_por_clave("gustos", doc_id, anterior["gusto"])
+            else:
+                self.local.upsert_gustos([{**nuevo, "user_id": doc_id}])
+            self.cache.actualizar("gustos", email, lambda _: self.local.gustos(doc_id))
+
+        elif tabla == "comandos":
+            if tipo == "DELETE":
+                if anterior.get("comando") is None:
+                    return
+                self.local.borrar_por_clave("comandos", doc_id, anterior["comando"])
+            else:
+                self.local.upsert_comandos([{**nuevo, "user_id": doc_id}])
+            self.cache.actualizar("comandos", email, lambda _: self.local.comandos(doc_id))
+
+        elif tabla == "skills":
+            if tipo == "DELETE":
+                if anterior.get("id") is None:
+                    return
+                self.local.borrar_skill(anterior["id"])
+            else:
+                self.local.upsert_skill(doc_id, nuevo.get("trigger"), nuevo.get("actions"), nuevo.get("id"))
+            self._refrescar_skills(email, doc_id)
+
+    def _asegurar_local(self, email: str, tabla: str) -> str:
+        """Primera lectura de una tabla: la copia completa a SQLite si hay nube."""
+        doc_id = self._get_user_doc_id(email)
+        self.local.registrar_usuario(doc_id, email)
+        if self.cloud_ready and not self.local.sincronizado(doc_id, tabla):
+            try:
+                self._descargar_tabla(email, tabla, completo=True)
+            except Exception as e:
+                print(f"!! [SYNC] No se pudo descargar {tabla}, usando copia local: {e}")
+        return doc_id
             
     def _get_user_doc_id(self, email: str) -> str:
         """ID único e irreversible por usuario."""
@@ -121,44 +756,77 @@ class CloudManager:
         t = threading.Thread(target=tarea_limpieza, daemon=True)
         t.start()
 
-    def limpiar_sesiones_expiradas(self):
-        """Borra de la base de datos los tokens que ya no sirven."""
+    def limpiar_sesiones_expiradas(self, batch_size: Optional[int] = None,
+                                   presupuesto: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Borra de la base de datos los tokens que ya no sirven.
+
+        El borrado se hace en el servidor por rangos de `expira`: por cada lote sólo
+        se descarga la fecha frontera (la fila nº batch_size) y se borra todo lo
+        anterior con un DELETE filtrado, así la memoria y el tráfico no dependen
+        de cuántas sesiones se hayan acumulado. Se detiene al agotar `presupuesto`
+        segundos; lo que quede se borra en la siguiente pasada.
+        """
+        resultado = {"ok": False, "eliminadas": 0, "lotes": 0, "duracion_ms": 0.0, "completado": False}
         if not self.cloud_ready: 
-            return
+            return resultado
+
+        batch_size = max(1, batch_size or self.PURGE_BATCH)
+        presupuesto = self.PURGE_BUDGET if presupuesto is None else presupuesto
+        inicio = time.perf_counter()
+        now_iso = datetime.now(timezone.utc).isoformat()
             
         try:
-            now_iso = datetime.now(timezone.utc).isoformat()
-            
-            # Consultar sesiones expiradas
-            response = self.supabase.table("sessions") \
-                .select("*") \
-                .lt("expira", now_iso) \
-                .execute()
-            
-            expired_sessions = response.data
-            
-            if expired_sessions:
-                # Eliminar en lotes de 100
-                batch_size = 100
-                for i in range(0, len(expired_sessions), batch_size):
-                    batch = expired_sessions[i:i + batch_size]
-                    token_ids = [session["token"] for session in batch]
-                    
-                    self.supabase.table("sessions") \
-                        .delete() \
-                        .in_("token", token_ids) \
-                        .execute()
-                
-                print(f"🧹 [MANTENIMIENTO] Se eliminaron {len(expired_sessions)} sesiones expiradas.")
+            while time.perf_counter() - inicio < presupuesto:
+                # Fecha de la última fila del lote (si no existe, queda menos de un lote)
+                frontera = self.supabase.table("sessions") \
+                    .select("expira") \
+                    .lt("expira", now_iso) \
+                    .order("expira") \
+                    .range(batch_size - 1, batch_size - 1) \
+                    .execute()
+
+                consulta = self.supabase.table("sessions").delete(count="exact", returning="minimal")
+                if frontera.data:
+                    consulta = consulta.lte("expira", frontera.data[0]["expira"])
+                else:
+                    consulta = consulta.lt("expira", now_iso)
+                response = consulta.execute()
+
+                resultado["lotes"] += 1
+                resultado["eliminadas"] += response.count or 0
+                if not frontera.data:
+                    resultado["completado"] = True
+                    break
+
+            resultado["ok"] = True
+            if resultado["eliminadas"]:
+                print(f"🧹 [MANTENIMIENTO] Se eliminaron {resultado['eliminadas']} sesiones expiradas.")
+            self._purgar_sesiones_revocadas(now_iso)
                 
         except Exception as e:
             print(f"!! Error en limpieza: {e}")
 
+        resultado["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        return resultado
+
+    def _purgar_sesiones_revocadas(self, now_iso: str):
+        """Las revocaciones de cuentas borradas sobran en cuanto el token caduca."""
+        try:
+            self.supabase.table("sesiones_revocadas").delete(returning="minimal") \
+                .lt("expira", now_iso).execute()
+        except Exception as e:
+            if es_transitorio(e):
+                print(f"!! Error purgando sesiones_revocadas: {e}")
+
     # ==========================================================
     # 🔐 HASH DE PASSWORD
     # ==========================================================
     def hash_password(self, password: str, salt: Optional[bytes] = None) -> tuple:
-        """Genera hash seguro de contraseña usando PBKDF2-HMAC-SHA256."""
+        """
+        Genera hash seguro de contraseña usando PBKDF2-HMAC-SHA256 (formato antiguo).
+        Las cuentas nuevas usan el registro versionado de `self.hasher`.
+        """
         if not salt: 
             salt = os.urandom(16)
         else:
@@ -175,7 +843,7 @@ class CloudManager:
     # ==========================================================
     def crear_usuario(self, email: str, username: str, password: str) -> Dict[str, Any]:
         """Crea un nuevo usuario en Supabase."""
-        if not self.cloud_ready: 
+        if not self.esperar_listo(): 
             return {"ok": False, "error": "Modo offline. No se puede crear usuario."}
             
         try:
@@ -190,7 +858,7 @@ class CloudManager:
             if response.data:
                 return {"ok": False, "error": "El usuario ya existe."}
 
-            hashed, salt = self.hash_password(password)
+            registro, salt = self._registro_password(password)
             now_iso = datetime.now(timezone.utc).isoformat()
 
             # Insertar nuevo usuario
@@ -198,7 +866,7 @@ class CloudManager:
                 "id": doc_id,
                 "email": email,
                 "username": username,
-                "password_hash": hashed,
+                "password_hash": registro,
                 "salt": salt,
                 "creado": now_iso,
                 "ultimo_login": now_iso,
@@ -221,7 +889,7 @@ class CloudManager:
         
     def validar_login(self, email: str, password: str) -> bool:
         """Valida credenciales de usuario."""
-        if not self.cloud_ready: 
+        if not self.esperar_listo(): 
             return False
             
         try:
@@ -239,16 +907,23 @@ class CloudManager:
             user_data = response.data[0]
             
             # Verificar que tenemos los datos necesarios
-            if not user_data or "salt" not in user_data or "password_hash" not in user_data: 
+            if not user_data or "password_hash" not in user_data: 
                 return False 
                 
-            # Calcular hash con la sal almacenada
-            hashed_calculado, _ = self.hash_password(password, user_data["salt"])
-            
-            # Comparar de forma segura
-            if hmac.compare_digest(hashed_calculado, user_data["password_hash"]):
+            # Recalcular con la sal e iteraciones del registro y comparar de forma segura
+            correcta, actualizar = self.hasher.verificar(
+                password, user_data["password_hash"], user_data.get("salt")
+            )
+            
+            if correcta:
+                # La fila ya trae la config: se siembra el espejo sin otra petición
+                self._sembrar_config(email, doc_id, user_data)
                 # ✅ MEJORA v10.0: Actualizar último login en segundo plano
                 self._run_async(self._update_login_time, doc_id)
+                if actualizar and self.HASH_REHASH:
+                    # Registro con menos iteraciones: se regenera ahora que tenemos
+                    # la contraseña en claro (no se derrama a disco)
+                    self._run_async(self._actualizar_hash, doc_id, password)
                 return True
                 
             return False
@@ -257,6 +932,70 @@ class CloudManager:
             print(f"!! [CLOUD] Error validando login: {e}")
             return False
     
+    def _sembrar_config(self, email: str, doc_id: str, user_data: Dict[str, Any]):
+        if "config" not in user_data or self.local.sincronizado(doc_id, "config"):
+            return
+        try:
+            config_str = user_data.get("config") or "{}"
+            remoto = json.loads(config_str) if isinstance(config_str, str) else config_str
+            self.local.registrar_usuario(doc_id, email)
+            pendientes = self.local.parches_config_pendientes(doc_id)
+            self.local.guardar_config(doc_id, {**remoto, **pendientes}, user_data.get("actualizado"), reemplazar=True)
+            self.local.marcar_sync(doc_id, "config", user_data.get("actualizado"))
+        except Exception as e:
+            print(f"!! [CLOUD] No se pudo sembrar la config local: {e}")
+
+    def warm_user(self, email: str, timeout: Optional[float] = 20.0) -> Dict[str, Any]:
+        """
+        Precarga tras el login: config, gustos, comandos, skills, recuerdos y
+        no leídos se piden a la vez y quedan en la caché, así las primeras
+        lecturas del dashboard no tocan la red. Las lecturas que lleguen
+        mientras tanto se unen a la carga en curso (single-flight).
+
+        Devuelve {"ok", "ms", "tablas": {namespace: ms}, "errores": {namespace: error}}.
+        """
+        cargas = {
+            "config": ("config", email, lambda: self._cargar_config(email)),
+            "gustos": ("gustos", email, lambda: self._cargar_gustos(email)),
+            "comandos": ("comandos", email, lambda: self._cargar_comandos(email)),
+            "skills": ("skills", email, lambda: self._cargar_skills(email)),
+            "recuerdos": ("recuerdos", (email, 1, 10), lambda: self._cargar_recuerdos(email, 1, 10)),
+            "no_leidos": ("no_leidos", email, lambda: self._cargar_no_leidos(email)),
+        }
+
+        def cargar(namespace, clave, loader) -> float:
+            t0 = time.perf_counter()
+            self.cache.get_or_load(namespace, clave, loader)
+            return (time.perf_counter() - t0) * 1000
+
+        inicio = time.perf_counter()
+        tiempos, errores = {}, {}
+        pool = ThreadPoolExecutor(max_workers=len(cargas), thread_name_prefix="warm")
+        try:
+            futuros = {pool.submit(cargar, *args): nombre for nombre, args in cargas.items()}
+            try:
+                for futuro in as_completed(futuros, timeout=timeout):
+                    nombre = futuros[futuro]
+                    try:
+                        tiempos[nombre] = round(futuro.result(), 1)
+                    except Exception as e:
+                        errores[nombre] = str(e)[:200]
+            except FuturoTimeout:
+                for futuro, nombre in futuros.items():
+                    if not futuro.done():
+                        errores[nombre] = f"Sin terminar tras {timeout:.0f}s"
+        finally:
+            pool.shutdown(wait=False)
+
+        total = round((time.perf_counter() - inicio) * 1000, 1)
+        resultado = {"ok": not errores, "ms": total, "tablas": tiempos, "errores": errores}
+        self._ultima_precarga = resultado
+        detalle = ", ".join(f"{n} {ms:.0f}ms" for n, ms in sorted(tiempos.items(), key=lambda x: -x[1]))
+        print(f">> [CLOUD] Usuario precargado en {total:.0f}ms ({detalle})")
+        for nombre, error in errores.items():
+            print(f"!! [CLOUD] Precarga de {nombre} fallida: {error}")
+        return resultado
+
     def _update_login_time(self, doc_id: str):
         """✅ MEJORA v10.0: Actualiza el login en segundo plano."""
         try:
@@ -267,18 +1006,38 @@ class CloudManager:
         except Exception as e:
             print(f"!! Error actualizando login time: {e}")
 
+    def _registro_password(self, password: str) -> tuple:
+        """(password_hash, salt_hex) a guardar en `users`, según AR_HASH_REHASH."""
+        if not self.HASH_REHASH:
+            return self.hasher.hash_legado(password)
+        registro = self.hasher.hash(password)
+        _, salt, _ = parsear_registro(registro)
+        return registro, salt.hex()
+
+    def _actualizar_hash(self, doc_id: str, password: str):
+        """Sube el registro de contraseña al factor de trabajo actual."""
+        try:
+            registro, salt = self._registro_password(password)
+            self.supabase.table("users") \
+                .update({"password_hash": registro, "salt": salt}) \
+                .eq("id", doc_id) \
+                .execute()
+            print(f">> [CLOUD] Hash de contraseña actualizado a {self.hasher.iteraciones} iteraciones")
+        except Exception as e:
+            print(f"!! Error actualizando hash de contraseña: {e}")
+
     def actualizar_password(self, email: str, nueva_password: str) -> bool:
         """Actualiza la contraseña del usuario."""
-        if not self.cloud_ready: 
+        if not self.esperar_listo(): 
             return False
             
         try:
             doc_id = self._get_user_doc_id(email)
-            hashed, salt = self.hash_password(nueva_password)
+            registro, salt = self._registro_password(nueva_password)
             
             self.supabase.table("users") \
                 .update({
-                    "password_hash": hashed, 
+                    "password_hash": registro, 
                     "salt": salt,
                     "actualizado": datetime.now(timezone.utc).isoformat()
                 }) \
@@ -301,7 +1060,13 @@ class CloudManager:
         return base64.urlsafe_b64encode(firma).decode().rstrip("=")
 
     def crear_sesion(self, email: str) -> str:
-        """Crea una sesión/token para el usuario."""
+        """
+        Crea una sesión/token para el usuario.
+
+        Formato v2: `v2.<payload>.<firma>`, donde payload (base64) lleva el jti,
+        el email, la emisión y la expiración. Se valida sin ir a la base de datos;
+        la fila en `sessions` sólo sirve para revocarlo y para la limpieza.
+        """
         if email == "guest":
             # 🟢 FIX: Genera un ID de sesión único y temporal para el modo invitado.
             return f"guest_{uuid.uuid4().hex}"
@@ -311,29 +1076,79 @@ class CloudManager:
             return f"offline_{uuid.uuid4().hex}"
             
         try:
-            token = uuid.uuid4().hex
-            firma = self.firmar_token(token)
-            exp = datetime.now(timezone.utc) + timedelta(hours=24)
+            jti = uuid.uuid4().hex
+            ahora = datetime.now(timezone.utc)
+            exp = ahora + timedelta(hours=self.SESSION_HOURS)
+
+            payload = json.dumps(
+                {"t": jti, "e": email, "i": int(ahora.timestamp()), "x": int(exp.timestamp())},
+                separators=(",", ":")
+            )
+            payload_b64 = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+            cuerpo = f"v2.{payload_b64}"
+            firma = self.firmar_token(cuerpo)
 
             # Guardar sesión en Supabase
             session_data = {
-                "token": token,
+                "token": jti,
                 "email": email,
                 "firma_almacenada": firma,
-                "creado": datetime.now(timezone.utc).isoformat(),
+                "creado": ahora.isoformat(),
                 "expira": exp.isoformat()
             }
             
             self.supabase.table("sessions").insert(session_data).execute()
             
             print(f">> [CLOUD] Sesión creada para: {email}")
-            return f"{token}:{firma}"
+            return f"{cuerpo}.{firma}"
             
         except Exception as e:
             print(f"!! [CLOUD] Error creando sesión: {e}")
             # Fallback a token offline
             return f"fallback_{uuid.uuid4().hex}"
 
+    @staticmethod
+    def _decodificar_payload(payload_b64: str) -> Dict[str, Any]:
+        relleno = "=" * (-len(payload_b64) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload_b64 + relleno))
+
+    def _verificar_token_v2(self, full_token: str) -> Optional[tuple]:
+        """Firma HMAC + payload de un token v2 -> (jti, email, emitido, expira) o None si es falso."""
+        with self._revocados_lock:
+            datos = self._tokens_verificados.get(full_token)
+            if datos is not None:
+                self._tokens_verificados.move_to_end(full_token)
+                return datos
+
+        cuerpo, sep, firma_cliente = full_token.rpartition(".")
+        if not sep or not hmac.compare_digest(self.firmar_token(cuerpo), firma_cliente):
+            return None
+        try:
+            payload = self._decodificar_payload(cuerpo[3:])
+            datos = (bytes.fromhex(payload["t"]), payload["e"], payload.get("i", 0), payload["x"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        with self._revocados_lock:
+            self._tokens_verificados[full_token] = datos
+            while len(self._tokens_verificados) > self.MAX_TOKENS_VERIFICADOS:
+                self._tokens_verificados.popitem(last=False)
+        return datos
+
+    def _validar_token_v2(self, full_token: str) -> Optional[str]:
+        """Validación puramente local (HMAC + expiración + lista de revocados)."""
+        datos = self._verificar_token_v2(full_token)
+        if datos is None:
+            return None
+
+        jti, email, emitido, expira = datos
+        if time.time() > expira or jti in self._revocados:
+            return None
+        baja = self._emails_revocados.get(email)
+        if baja is not None and emitido <= baja:
+            return None
+        return email
+
     def obtener_usuario_por_token(self, full_token: str) -> Optional[str]:
         """Obtiene el email del usuario a partir del token."""
         if not full_token: 
@@ -347,8 +1162,12 @@ class CloudManager:
         # Token offline/fallback
         if full_token.startswith("offline_") or full_token.startswith("fallback_"):
             return "offline_user"
+
+        # Token v2 autocontenido: no necesita consultar `sessions`
+        if full_token.startswith("v2."):
+            return self._validar_token_v2(full_token)
             
-        # Token de Supabase
+        # Token de Supabase (formato antiguo `token:firma`)
         if ":" not in full_token: 
             return None
 
@@ -356,10 +1175,7 @@ class CloudManager:
             token, firma_cliente = full_token.split(":", 1)
             
             # Validación criptográfica local (RÁPIDA) antes de ir a la nube
-            firma_real = hmac.new(self.secret_key, token.encode(), hashlib.sha256).digest()
-            firma_real_b64 = base64.urlsafe_b64encode(firma_real).decode().rstrip("=")
-            
-            if not hmac.compare_digest(firma_real_b64, firma_cliente):
+            if not hmac.compare_digest(self.firmar_token(token), firma_cliente):
                 return None
             
             # Obtener sesión de Supabase
@@ -375,9 +1191,9 @@ class CloudManager:
             
             # Verificar expiración
             exp = datetime.fromisoformat(session_data["expira"].replace("Z", "+00:00"))
-            if datetime.now(timezone.utc) > exp:
+            if datetime.now(timezone.utc) > exp or session_data.get("revocado"):
                 # Token expirado - eliminar en segundo plano
-                self._run_async(lambda: self.supabase.table("sessions").delete().eq("token", token).execute())
+                self._run_async(lambda: self.supabase.table("sessions").delete().eq("token", token).execute(), key=token)
                 return None
 
             return session_data["email"]
@@ -386,97 +1202,266 @@ class CloudManager:
             print(f"!! [CLOUD] Error obteniendo usuario por token: {e}")
             return None
 
+    def revocar_sesion(self, full_token: str):
+        """
+        Cierra una sesión: deja de validar aquí al momento y en otros equipos al
+        sincronizar. Sólo se aceptan tokens con firma válida (si no, cualquiera
+        podría revocar la sesión de otro conociendo su jti). Necesita la columna:
+
+            alter table sessions add column revocado boolean default false;
+            create index sessions_revocado_expira_idx on sessions (revocado, expira);
+        """
+        if not full_token:
+            return
+        if full_token.startswith("v2."):
+            datos = self._verificar_token_v2(full_token)
+            if datos is None:
+                return
+            jti_bytes, _, _, exp = datos
+            with self._revocados_lock:
+                self._revocados[jti_bytes] = exp
+            jti = jti_bytes.hex()
+        elif ":" in full_token:
+            jti, firma_cliente = full_token.split(":", 1)
+            if not hmac.compare_digest(self.firmar_token(jti), firma_cliente):
+                return
+        else:
+            return
+
+        self._run_async(
+            lambda: self.supabase.table("sessions").update({"revocado": True}).eq("token", jti).execute(),
+            key=jti
+        )
+
+    def sincronizar_revocaciones(self) -> int:
+        """
+        Descarga los jti revocados aún vigentes y purga los ya caducados.
+        Se llama periódicamente desde el hilo de sincronización; el filtro usa
+        el índice (revocado, expira) descrito en `revocar_sesion`.
+        """
+        if not self.cloud_ready:
+            return 0
+        try:
+            now_iso = datetime.now(timezone.utc).isoformat()
+            response = self.supabase.table("sessions") \
+                .select("token, expira") \
+                .eq("revocado", True) \
+                .gt("expira", now_iso) \
+                .execute()
+            filas = [(f.get("token"), f.get("expira")) for f in response.data]
+            filas += [(f.get("jti"), f.get("expira")) for f in self._sesiones_revocadas_vigentes(now_iso)]
+
+            ahora = time.time()
+            with self._revocados_lock:
+                revocados = {jti: exp for jti, exp in self._revocados.items() if exp > ahora}
+                for jti, expira in filas:
+                    try:
+                        exp = datetime.fromisoformat(expira.replace("Z", "+00:00")).timestamp()
+                        revocados[bytes.fromhex(jti)] = exp
+                    except (ValueError, TypeError, AttributeError):
+                        continue
+                # Sustitución atómica: los lectores nunca ven el dict a medio construir
+                self._revocados = revocados
+            return len(revocados)
+
+        except Exception as e:
+            print(f"!! [CLOUD] Error sincronizando revocaciones: {e}")
+            return len(self._revocados)
+
+    def _sesiones_revocadas_vigentes(self, now_iso: str) -> List[Dict[str, Any]]:
+        """Jti de cuentas borradas (ver `_borrar_sesiones`); vacío si la tabla no existe."""
+        try:
+            return self.supabase.table("sesiones_revocadas") \
+                .select("jti, expira") \
+                .gt("expira", now_iso) \
+                .execute().data
+        except Exception as e:
+            if es_transitorio(e):
+                raise
+            return []
+
     # ==========================================================
     # 🗑️ ELIMINACIÓN DE DATOS (GDPR / DERECHO AL OLVIDO)
     # ==========================================================
     def eliminar_usuario_total(self, email: str) -> bool:
         """Borra ABSOLUTAMENTE TODO de un usuario. Irreversible."""
+        return self.borrar_cuenta(email)["ok"]
+
+    def borrar_cuenta(self, email: str, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Borrado total de la cuenta con informe por tabla (filas, ms, error).
+
+        Las tablas y el Storage se borran en paralelo y cada paso terminado se
+        anota en un checkpoint local: si algo falla o la app se cierra, la
+        siguiente llamada (o el hilo de sincronización) sólo repite lo que
+        faltaba. `users` se borra el último, cuando todo lo demás fue bien.
+        """
+        informe = {"ok": False, "email": email, "pasos": {}, "duracion_ms": 0.0}
         if not self.cloud_ready: 
-            return False
-            
+            informe["error"] = "Modo offline"
+            return informe
+
+        inicio = time.perf_counter()
+        doc_id = self._get_user_doc_id(email)
+        self.local.iniciar_borrado(email)
+        hechos = self.local.pasos_borrados(email)
+        for paso, ms in hechos.items():
+            informe["pasos"][paso] = {"ok": True, "ms": ms, "reanudado": True}
+
+        # 1. Cortar el acceso y evitar que escrituras pendientes vuelvan a subir datos
+        with self._revocados_lock:
+            self._emails_revocados[email] = time.time()
+        self.local.descartar_journal_usuario(doc_id)
+        self.flush_writes(timeout=10)
+
+        # 2. Todas las tablas + Storage a la vez
+        pendientes = [paso for paso in self._PASOS_BORRADO if paso not in hechos]
+        if pendientes:
+            with ThreadPoolExecutor(max_workers=workers or self.ERASE_WORKERS,
+                                    thread_name_prefix="borrado") as pool:
+                futuros = {pool.submit(self._paso_borrado, paso, email, doc_id): paso for paso in pendientes}
+                for futuro in as_completed(futuros):
+                    informe["pasos"][futuros[futuro]] = futuro.result()
+
+        # 3. Usuario principal y copia local, sólo si no quedan huérfanos en la nube
+        fallidos = [paso for paso, r in informe["pasos"].items() if not r["ok"]]
+        if not fallidos:
+            informe["pasos"]["users"] = self._paso_borrado("users", email, doc_id)
+            if informe["pasos"]["users"]["ok"]:
+                self.local.olvidar_usuario(doc_id)
+                self.flush_cache(email)
+                self._indices_skills.pop(email, None)
+                self.local.terminar_borrado(email)
+                informe["ok"] = True
+            else:
+                fallidos = ["users"]
+
+        informe["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        if informe["ok"]:
+            print(f"☠️ [CLOUD] Usuario {email} eliminado permanentemente ({informe['duracion_ms']} ms).")
+        else:
+            print(f"!! [CLOUD] Borrado de {email} incompleto, se reanudará: {', '.join(fallidos)}")
+        return informe
+
+    def _paso_borrado(self, paso: str, email: str, doc_id: str) -> Dict[str, Any]:
+        inicio = time.perf_counter()
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            # 1. Borrar subcolecciones
-            tables_to_clean = [
-                "memoria", "gustos", "comandos", "chats_mensajes"
-            ]
-            
-            for table in tables_to_clean:
+            if paso == "archeon-drive":
+                filas = self._borrar_archivos_drive(email)
+            elif paso == "sessions":
+                filas = self._borrar_sesiones(email)
+            elif paso == "verification_codes":
+                response = self.supabase.table(paso).delete(count="exact", returning="minimal") \
+                    .eq("email", email).execute()
+                filas = response.count
+            elif paso == "users":
+                response = self.supabase.table(paso).delete(count="exact", returning="minimal") \
+                    .eq("id", doc_id).execute()
+                filas = response.count
+            else:
+                response = self.supabase.table(paso).delete(count="exact", returning="minimal") \
+                    .eq("user_id", doc_id).execute()
+                filas = response.count
+        except Exception as e:
+            ms = round((time.perf_counter() - inicio) * 1000, 1)
+            if paso in self._PASOS_OPCIONALES and not es_transitorio(e):
+                filas = 0  # La tabla no existe en este proyecto: nada que borrar
+            else:
+                print(f"!! Error eliminando {paso}: {e}")
+                return {"ok": False, "ms": ms, "error": str(e)}
+
+        ms = round((time.perf_counter() - inicio) * 1000, 1)
+        self.local.marcar_paso_borrado(email, paso, ms)
+        return {"ok": True, "ms": ms, "filas": filas}
+
+    def _borrar_sesiones(self, email: str) -> int:
+        """
+        Revoca y borra las sesiones del usuario. Los tokens v2 se validan sin
+        consultar `sessions`, así que antes de borrar las filas sus jti pasan al
+        conjunto de revocados y, para que otros equipos también los rechacen
+        hasta que caduquen, se copian sin el email a:
+
+            create table sesiones_revocadas (jti text primary key, expira timestamptz not null);
+            create index sesiones_revocadas_expira_idx on sesiones_revocadas (expira);
+
+        Sin esa tabla el borrado sigue adelante: aquí ya corta la baja por email.
+        """
+        now_iso = datetime.now(timezone.utc).isoformat()
+        response = self.supabase.table("sessions") \
+            .select("token, expira") \
+            .eq("email", email) \
+            .gt("expira", now_iso) \
+            .execute()
+
+        revocadas = []
+        with self._revocados_lock:
+            for fila in response.data:
                 try:
-                    self.supabase.table(table).delete().eq("user_id", doc_id).execute()
-                except Exception as e:
-                    print(f"!! Error eliminando {table}: {e}")
-            
-            # 2. Borrar configuraciones
-            try:
-                self.supabase.table("configuraciones").delete().eq("user_id", doc_id).execute()
-            except:
-                pass
-            
-            # 3. Borrar sesiones activas
-            try:
-                self.supabase.table("sessions").delete().eq("email", email).execute()
-            except:
-                pass
-            
-            # 4. Borrar códigos de verificación
+                    exp = datetime.fromisoformat(fila["expira"].replace("Z", "+00:00")).timestamp()
+                    self._revocados[bytes.fromhex(fila["token"])] = exp
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue  # Token antiguo (no hex): al borrar la fila deja de validar
+                revocadas.append({"jti": fila["token"], "expira": fila["expira"]})
+
+        if revocadas:
             try:
-                self.supabase.table("verification_codes").delete().eq("email", email).execute()
-            except:
-                pass
-            
-            # 5. Borrar usuario principal
-            self.supabase.table("users").delete().eq("id", doc_id).execute()
-            
-            print(f"☠️ [CLOUD] Usuario {email} eliminado permanentemente.")
-            return True
-            
-        except Exception as e:
-            print(f"!! [CLOUD] Error eliminando usuario: {e}")
-            return False
+                self.supabase.table("sesiones_revocadas") \
+                    .upsert(revocadas, on_conflict="jti", returning="minimal") \
+                    .execute()
+            except Exception as e:
+                if es_transitorio(e):
+                    raise  # Se reintenta el paso entero: las filas siguen ahí
+                print(f"!! [CLOUD] Revocaciones de {email} sólo locales (¿falta sesiones_revocadas?): {e}")
+
+        response = self.supabase.table("sessions").delete(count="exact", returning="minimal") \
+            .eq("email", email).execute()
+        return response.count
+
+    def _borrar_archivos_drive(self, email: str) -> int:
+        """Borra los objetos del usuario en `archeon-drive` y sus filas de `archivos`."""
+        bucket = self.supabase.storage.from_("archeon-drive")
+
+        # Rutas registradas + lo que haya en su carpeta (subidas interrumpidas)
+        response = self.supabase.table("archivos").select("url_path").eq("user_id", email).execute()
+        rutas = {f["url_path"] for f in response.data if f.get("url_path")}
+        offset = 0
+        while True:
+            objetos = bucket.list(email, {"limit": 1000, "offset": offset}) or []
+            rutas.update(f"{email}/{o['name']}" for o in objetos if o.get("name"))
+            if len(objetos) < 1000:
+                break
+            offset += 1000
+
+        rutas = sorted(rutas)
+        for i in range(0, len(rutas), 100):
+            bucket.remove(rutas[i:i + 100])
+
+        self.supabase.table("archivos").delete().eq("user_id", email).execute()
+        return len(rutas)
+
+    def reanudar_borrados(self) -> int:
+        """Continúa los borrados de cuenta que quedaron a medias."""
+        pendientes = self.local.borrados_pendientes()
+        for email in pendientes:
+            self.borrar_cuenta(email)
+        return len(pendientes)
 
     # ==========================================================
     # ⚡ MEMORIA Y CONFIGURACIÓN OPTIMIZADA (CACHE + ASYNC)
     # ==========================================================
     def obtener_config(self, email: str) -> Dict[str, Any]:
-        """✅ MEJORA v10.0: Obtiene configuración usando Caché para velocidad extrema."""
-        if not self.cloud_ready: 
-            return self._default_config(email)
-
-        # 1. Revisar Caché RAM
-        cached = self._config_cache.get(email)
-        if cached:
-            age = time.time() - cached['timestamp']
-            if age < self.CACHE_TTL:  # Si tiene menos de 5 minutos
-                return cached['data']
-
-        # 2. Si no hay caché o expiró, buscar en Nube
+        """✅ MEJORA v10.0: Obtiene configuración usando Caché + copia local."""
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("users") \
-                .select("config") \
-                .eq("id", doc_id) \
-                .execute()
-            
-            if response.data:
-                config_str = response.data[0].get("config", "{}")
-                config = json.loads(config_str) if config_str else {}
-                # Asegurar que tenemos valores por defecto
-                full_config = {**self._default_config(email), **config}
-                
-                # ✅ MEJORA: Actualizar Caché
-                self._config_cache[email] = {
-                    'data': full_config,
-                    'timestamp': time.time()
-                }
-                return full_config
-            return self._default_config(email)
-            
+            return self.cache.get_or_load("config", email, lambda: self._cargar_config(email))
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo config: {e}")
             return self._default_config(email)
+
+    def _cargar_config(self, email: str) -> Dict[str, Any]:
+        """Lee la config del espejo local (lo invoca la caché en un fallo)."""
+        doc_id = self._asegurar_local(email, "config")
+        # Asegurar que tenemos valores por defecto
+        return {**self._default_config(email), **(self.local.config(doc_id) or {})}
     
     def _default_config(self, email: str) -> Dict[str, Any]:
         """Configuración por defecto."""
@@ -490,197 +1475,248 @@ class CloudManager:
 
     def guardar_config(self, email: str, config: Dict[str, Any]):
         """✅ MEJORA v10.0: Guarda y actualiza la caché inmediatamente."""
-        if not self.cloud_ready: 
-            return
-            
-        # 1. Actualizar caché local (para que la UI se sienta instantánea)
-        if email in self._config_cache:
-            current = self._config_cache[email]['data']
-            self._config_cache[email]['data'] = {**current, **config}
-            self._config_cache[email]['timestamp'] = time.time()  # Refrescar TTL
-        else:
-            # Si no hay caché, crear una nueva
-            self._config_cache[email] = {
-                'data': {**self._default_config(email), **config},
-                'timestamp': time.time()
-            }
+        doc_id = self._get_user_doc_id(email)
+        self.local.registrar_usuario(doc_id, email)
+
+        # 1. Actualizar copia local y caché (para que la UI se sienta instantánea)
+        self.local.guardar_config(doc_id, config)
+        self.cache.actualizar(
+            "config", email,
+            lambda current: {**current, **config},
+            si_no_existe={**self._default_config(email), **(self.local.config(doc_id) or {})}
+        )
+
+        # ✅ MEJORA v10.0: Guardar en Nube en Segundo Plano (Fire & Forget).
+        # Mientras la ráfaga siga abierta se reescribe la misma entrada del diario
+        with self._parches_lock:
+            abierto = self._parches_config.get(email)
+            if abierto is not None:
+                parche = {**abierto["payload"]["args"][1], **config}
+                payload = {"fn": "_guardar_config_cloud", "args": [email, parche], "user_id": doc_id}
+                if self.local.actualizar_payload(abierto["jid"], payload):
+                    abierto["payload"] = payload
+                else:
+                    abierto = None  # La sincronización ya la tomó: empezamos otra
+            if abierto is None:
+                payload = {"fn": "_guardar_config_cloud", "args": [email, dict(config)], "user_id": doc_id}
+                jid = self.local.encolar("config", "tarea", payload)
+                self._parches_config[email] = {"jid": jid, "payload": payload}
+        self._config_debounce.tocar(email)
 
-        # ✅ MEJORA v10.0: Guardar en Nube en Segundo Plano (Fire & Forget)
-        self._run_async(self._guardar_config_cloud, email, config)
+    def _subir_parche_config(self, email: str):
+        """Fin de la ráfaga: se sube el parche fundido en una sola escritura."""
+        with self._parches_lock:
+            abierto = self._parches_config.pop(email, None)
+        if abierto is not None:
+            self._despachar_journal(abierto["jid"], "config", "tarea", abierto["payload"])
     
-    def _guardar_config_cloud(self, email: str, config: Dict[str, Any]):
-        """✅ MEJORA v10.0: Guarda la configuración en la nube en segundo plano."""
+    def _guardar_config_cloud(self, email: str, config: Dict[str, Any]) -> bool:
+        """
+        ✅ MEJORA v10.0: Aplica un parche de configuración en la nube sin pisar
+        cambios ajenos. Primero intenta la fusión en el servidor:
+
+            create or replace function merge_config(p_id text, p_parche jsonb)
+            returns timestamptz language sql as $$
+                update users
+                   set config = (coalesce(nullif(config, '')::jsonb, '{}'::jsonb) || p_parche)::text,
+                       actualizado = now()
+                 where id = p_id
+                returning actualizado;
+            $$;
+
+        Si no existe, lee-fusiona-escribe con control optimista sobre `actualizado`.
+        """
         try:
             doc_id = self._get_user_doc_id(email)
-            
-            # Obtener configuración actual
-            response = self.supabase.table("users") \
-                .select("config") \
-                .eq("id", doc_id) \
-                .execute()
-            
-            if response.data:
-                current_config_str = response.data[0].get("config", "{}")
-                current_config = json.loads(current_config_str) if current_config_str else {}
-                
-                # Fusionar configuraciones
-                merged_config = {**current_config, **config}
-                
-                # Guardar actualizado
-                self.supabase.table("users") \
+
+            if "merge_config" not in self._rpc_ausentes:
+                try:
+                    response = self.supabase.rpc("merge_config", {"p_id": doc_id, "p_parche": config}).execute()
+                    if response.data:
+                        print(f">> [CLOUD] Configuración sincronizada: {email}")
+                        return True
+                    # Sin fila que actualizar: el usuario se crea más abajo
+                except Exception as e:
+                    if es_transitorio(e):
+                        raise
+                    print(f"!! [CLOUD] RPC merge_config no disponible, usando versión optimista: {e}")
+                    self._rpc_ausentes.add("merge_config")
+
+            for _ in range(self.CONFIG_CAS_INTENTOS):
+                # Obtener configuración actual y su versión
+                response = self.supabase.table("users") \
+                    .select("config, actualizado") \
+                    .eq("id", doc_id) \
+                    .execute()
+
+                if not response.data:
+                    # Crear nuevo usuario con configuración
+                    user_data = {
+                        "id": doc_id,
+                        "email": email,
+                        "config": json.dumps(config),
+                        "creado": datetime.now(timezone.utc).isoformat()
+                    }
+                    self.supabase.table("users").insert(user_data).execute()
+                    print(f">> [CLOUD] Configuración sincronizada: {email}")
+                    return True
+
+                fila = response.data[0]
+                current_config_str = fila.get("config") or "{}"
+                current_config = json.loads(current_config_str) if isinstance(current_config_str, str) else current_config_str
+
+                # Guardar sólo si nadie escribió desde nuestra lectura
+                consulta = self.supabase.table("users") \
                     .update({
-                        "config": json.dumps(merged_config),
+                        "config": json.dumps({**current_config, **config}),
                         "actualizado": datetime.now(timezone.utc).isoformat()
                     }) \
-                    .eq("id", doc_id) \
-                    .execute()
-            else:
-                # Crear nuevo usuario con configuración
-                user_data = {
-                    "id": doc_id,
-                    "email": email,
-                    "config": json.dumps(config),
-                    "creado": datetime.now(timezone.utc).isoformat()
-                }
-                self.supabase.table("users").insert(user_data).execute()
-                
-            print(f">> [CLOUD] Configuración sincronizada: {email}")
+                    .eq("id", doc_id)
+                if fila.get("actualizado"):
+                    consulta = consulta.eq("actualizado", fila["actualizado"])
+                else:
+                    consulta = consulta.is_("actualizado", "null")
+
+                if consulta.execute().data:
+                    print(f">> [CLOUD] Configuración sincronizada: {email}")
+                    return True
+
+            print(f"!! [CLOUD] Config de {email} modificada a la vez en otro equipo; se reintentará")
+            return False
             
         except Exception as e:
             print(f"!! [CLOUD] Error guardando config async: {e}")
+            return False
 
     def guardar_recuerdo(self, email: str, categoria: str, contenido: str, importancia: int = 1):
-        """✅ MEJORA v10.0: Fire & Forget - No espera a que termine."""
-        self._run_async(self._guardar_recuerdo_cloud, email, categoria, contenido, importancia)
-    
-    def _guardar_recuerdo_cloud(self, email: str, categoria: str, contenido: str, importancia: int):
-        """✅ MEJORA v10.0: Guarda recuerdos en la nube en segundo plano."""
-        if not self.cloud_ready: 
-            return
-            
-        try:
-            doc_id = self._get_user_doc_id(email)
-            
-            recuerdo_data = {
-                "user_id": doc_id,
-                "categoria": categoria,
-                "contenido": contenido,
-                "importancia": importancia,
-                "fecha": datetime.now(timezone.utc).isoformat()
-            }
-            
-            self.supabase.table("memoria").insert(recuerdo_data).execute()
-            
-        except Exception as e:
-            print(f"!! [CLOUD] Error guardando recuerdo async: {e}")
+        """Fire & Forget - el recuerdo se agrupa con otros y se envía en lote."""
+        recuerdo_data = {
+            "user_id": self._get_user_doc_id(email),
+            "categoria": categoria,
+            "contenido": contenido,
+            "importancia": importancia,
+            "fecha": datetime.now(timezone.utc).isoformat()
+        }
+        self.local.insertar_filas("memoria", [recuerdo_data])
+        self._journal_lote("memoria", recuerdo_data)
+        self.cache.invalidar("recuerdos", email)
 
     def obtener_recuerdos(self, email: str, min_importancia: int = 1, limit: int = 10) -> List[Dict[str, Any]]:
-        """Obtiene recuerdos del usuario."""
-        if not self.cloud_ready: 
-            return []
-            
+        """Obtiene recuerdos del usuario (cacheados por email + filtros)."""
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("memoria") \
-                .select("*") \
-                .eq("user_id", doc_id) \
-                .gte("importancia", min_importancia) \
-                .order("fecha", desc=True) \
-                .limit(limit) \
-                .execute()
-                
-            return response.data
-            
+            return self.cache.get_or_load(
+                "recuerdos", (email, min_importancia, limit),
+                lambda: self._cargar_recuerdos(email, min_importancia, limit)
+            )
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo recuerdos: {e}")
             return []
 
+    def _cargar_recuerdos(self, email: str, min_importancia: int, limit: int) -> List[Dict[str, Any]]:
+        doc_id = self._asegurar_local(email, "memoria")
+        return self.local.recuerdos(doc_id, min_importancia, limit)
+
     # ==========================================================
     # ❤️ GUSTOS Y COMANDOS CON CACHÉ
     # ==========================================================
     def guardar_gusto(self, email: str, gusto: str, valor: bool = True):
-        """✅ MEJORA v10.0: Actualiza caché y guarda en segundo plano."""
-        if not self.cloud_ready: 
-            return
-            
-        # Update Cache
-        if email not in self._gustos_cache:
-            self._gustos_cache[email] = {}
-        self._gustos_cache[email][gusto] = valor
+        """✅ MEJORA v10.0: Actualiza caché y guarda en segundo plano (en lote)."""
+        # Update Cache (sólo si ya está cargada; si no, la próxima lectura la trae completa)
+        self.cache.actualizar("gustos", email, lambda gustos: {**gustos, gusto: valor})
         
-        # ✅ MEJORA: Async Cloud
-        self._run_async(self._guardar_gusto_cloud, email, gusto, valor)
-    
-    def _guardar_gusto_cloud(self, email: str, gusto: str, valor: bool):
-        """✅ MEJORA v10.0: Guarda gustos en la nube en segundo plano."""
-        try:
-            doc_id = self._get_user_doc_id(email)
-            
-            gusto_data = {
-                "user_id": doc_id,
-                "gusto": gusto,
-                "activo": valor,
-                "fecha": datetime.now(timezone.utc).isoformat()
-            }
-            
-            # Upsert (insert or update)
-            self.supabase.table("gustos").upsert(gusto_data).execute()
-            
-        except Exception as e:
-            print(f"!! [CLOUD] Error guardando gusto async: {e}")
+        gusto_data = {
+            "user_id": self._get_user_doc_id(email),
+            "gusto": gusto,
+            "activo": valor,
+            "fecha": datetime.now(timezone.utc).isoformat()
+        }
+        self.local.upsert_gustos([gusto_data])
+        # Upsert (insert or update) agrupado con los demás gustos pendientes
+        self._journal_lote("gustos", gusto_data, modo="upsert")
 
     def obtener_gustos(self, email: str) -> Dict[str, bool]:
-        """✅ MEJORA v10.0: Obtiene gustos usando caché."""
-        # Check Cache
-        if email in self._gustos_cache:
-            return self._gustos_cache[email]
-        
-        if not self.cloud_ready: 
-            return {}
-            
+        """✅ MEJORA v10.0: Obtiene gustos usando caché + copia local."""
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("gustos") \
-                .select("*") \
-                .eq("user_id", doc_id) \
-                .execute()
-            
-            gustos = {item["gusto"]: item["activo"] for item in response.data}
-            
-            # ✅ MEJORA: Fill Cache
-            self._gustos_cache[email] = gustos
-            return gustos
-            
+            return self.cache.get_or_load("gustos", email, lambda: self._cargar_gustos(email))
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo gustos: {e}")
             return {}
 
+    def _cargar_gustos(self, email: str) -> Dict[str, bool]:
+        doc_id = self._asegurar_local(email, "gustos")
+        return self.local.gustos(doc_id)
+
     def guardar_comando(self, email: str, comando: str, accion: str):
         """✅ MEJORA v10.0: Guarda comandos en segundo plano."""
-        if not self.cloud_ready: 
+        if not email:
             return
-            
+        doc_id = self._get_user_doc_id(email)
+        self.local.upsert_comandos([{
+            "user_id": doc_id,
+            "comando": comando,
+            "accion": accion,
+            "fecha": datetime.now(timezone.utc).isoformat()
+        }], incrementar=True)
+
         # Update Cache
-        if email not in self._comandos_cache:
-            self._comandos_cache[email] = {}
-        self._comandos_cache[email][comando] = accion
+        self.cache.actualizar("comandos", email, lambda comandos: {**comandos, comando: accion})
         
-        # ✅ MEJORA: Ejecutar en segundo plano
-        self._run_async(self._guardar_comando_cloud, email, comando, accion)
-    
-    def _guardar_comando_cloud(self, email: str, comando: str, accion: str):
-        """✅ MEJORA v10.0: Guarda comando en la nube en segundo plano."""
+        # ✅ MEJORA: Los usos repetidos se agregan y suben como un único delta
+        self._usos.sumar((email, comando), 1, accion)
+
+    def _enviar_delta_comando(self, clave: tuple, delta: int, accion: str):
+        email, comando = clave
+        self._journal_tarea("comandos", self._get_user_doc_id(email), "_incrementar_comando_cloud",
+                            email, comando, accion, delta)
+
+    def _guardar_comando_cloud(self, email: str, comando: str, accion: str) -> bool:
+        """Compatibilidad con entradas antiguas del diario (un uso cada una)."""
+        return self._incrementar_comando_cloud(email, comando, accion, 1)
+
+    def _incrementar_comando_cloud(self, email: str, comando: str, accion: str, delta: int) -> bool:
+        """
+        Suma `delta` usos en un solo viaje y sin carreras, con la función SQL:
+
+            create or replace function incrementar_uso_comando(
+                p_user_id text, p_comando text, p_accion text, p_delta int, p_fecha timestamptz)
+            returns int language sql as $$
+                insert into comandos (user_id, comando, accion, fecha, usos)
+                values (p_user_id, p_comando, p_accion, p_fecha, p_delta)
+                on conflict (user_id, comando) do update
+                    set accion = excluded.accion, fecha = excluded.fecha,
+                        usos = comandos.usos + excluded.usos
+                returning usos;
+            $$;
+
+        Si el servidor aún no la tiene, se usa el antiguo select + upsert.
+        """
+        doc_id = self._get_user_doc_id(email)
+        fecha = datetime.now(timezone.utc).isoformat()
+
+        if "incrementar_uso_comando" not in self._rpc_ausentes:
+            try:
+                self.supabase.rpc("incrementar_uso_comando", {
+                    "p_user_id": doc_id,
+                    "p_comando": comando,
+                    "p_accion": accion,
+                    "p_delta": delta,
+                    "p_fecha": fecha
+                }).execute()
+                return True
+            except Exception as e:
+                if es_transitorio(e):
+                    print(f"!! [CLOUD] Error guardando comando async: {e}")
+                    return False
+                print(f"!! [CLOUD] RPC incrementar_uso_comando no disponible, usando select+upsert: {e}")
+                self._rpc_ausentes.add("incrementar_uso_comando")
+
         try:
-            doc_id = self._get_user_doc_id(email)
-            
             comando_data = {
                 "user_id": doc_id,
                 "comando": comando,
                 "accion": accion,
-                "fecha": datetime.now(timezone.utc).isoformat(),
-                "usos": 1
+                "fecha": fecha,
+                "usos": delta
             }
             
             # Incrementar usos si existe
@@ -692,83 +1728,52 @@ class CloudManager:
             
             if response.data:
                 current_uses = response.data[0].get("usos", 0)
-                comando_data["usos"] = current_uses + 1
+                comando_data["usos"] = current_uses + delta
             
             self.supabase.table("comandos").upsert(comando_data).execute()
+            return True
             
         except Exception as e:
             print(f"!! [CLOUD] Error guardando comando async: {e}")
+            return False
 
     def obtener_comandos(self, email: str) -> Dict[str, str]:
-        """Obtiene comandos personalizados del usuario."""
-        if not self.cloud_ready: 
-            return {}
-            
+        """Obtiene comandos personalizados del usuario (con caché)."""
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("comandos") \
-                .select("*") \
-                .eq("user_id", doc_id) \
-                .execute()
-            
-            comandos = {item["comando"]: item["accion"] for item in response.data}
-            return comandos
-            
+            return self.cache.get_or_load("comandos", email, lambda: self._cargar_comandos(email))
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo comandos: {e}")
             return {}
 
+    def _cargar_comandos(self, email: str) -> Dict[str, str]:
+        doc_id = self._asegurar_local(email, "comandos")
+        return self.local.comandos(doc_id)
+
     # ==========================================================
     # 💬 CHAT (ASÍNCRONO)
     # ==========================================================
     def guardar_mensaje_chat(self, email: str, contacto: str, texto: str, autor: str, leido: bool = False):
-        """✅ MEJORA v10.0: Guarda mensajes en segundo plano."""
-        if not self.cloud_ready: 
-            return
-            
-        # ✅ MEJORA: Ejecutar en segundo plano
-        self._run_async(self._guardar_mensaje_chat_cloud, email, contacto, texto, autor, leido)
-    
-    def _guardar_mensaje_chat_cloud(self, email: str, contacto: str, texto: str, autor: str, leido: bool):
-        """✅ MEJORA v10.0: Guarda mensaje en la nube en segundo plano."""
-        try:
-            doc_id = self._get_user_doc_id(email)
-            
-            mensaje_data = {
-                "user_id": doc_id,
-                "contacto": contacto,
-                "texto": texto,
-                "autor": autor,
-                "leido": leido,
-                "fecha": datetime.now(timezone.utc).isoformat()
-            }
-            
-            self.supabase.table("chats_mensajes").insert(mensaje_data).execute()
-            
-        except Exception as e:
-            print(f"!! [CLOUD] Error guardando mensaje async: {e}")
+        """Guarda mensajes en segundo plano, agrupados en lotes."""
+        mensaje_data = {
+            "user_id": self._get_user_doc_id(email),
+            "contacto": contacto,
+            "texto": texto,
+            "autor": autor,
+            "leido": leido,
+            "fecha": datetime.now(timezone.utc).isoformat()
+        }
+        self.local.insertar_filas("chats_mensajes", [mensaje_data])
+        if autor != "yo" and not leido:
+            self.cache.actualizar("no_leidos", email,
+                                  lambda conteos: {**conteos, contacto: conteos.get(contacto, 0) + 1})
+        self._journal_lote("chats_mensajes", mensaje_data)
 
     def obtener_chat(self, email: str, contacto: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Obtiene historial de chat con un contacto."""
-        if not self.cloud_ready: 
-            return []
-            
+        """Obtiene historial de chat con un contacto (desde la copia local)."""
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("chats_mensajes") \
-                .select("*") \
-                .eq("user_id", doc_id) \
-                .eq("contacto", contacto) \
-                .order("fecha", desc=True) \
-                .limit(limit) \
-                .execute()
-            
-            # Ordenar cronológicamente
-            mensajes = response.data
-            mensajes.reverse()
-            return mensajes
+            doc_id = self._asegurar_local(email, "chats_mensajes")
+            # Ordenados cronológicamente
+            return self.local.chat(doc_id, contacto, limit)
             
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo chat: {e}")
@@ -776,33 +1781,182 @@ class CloudManager:
 
     def mensajes_sin_leer(self, email: str) -> List[str]:
         """Obtiene lista de contactos con mensajes sin leer."""
-        if not self.cloud_ready: 
-            return []
-            
+        return list(self.contar_no_leidos(email))
+
+    def contar_no_leidos(self, email: str) -> Dict[str, int]:
+        """
+        {contacto: mensajes sin leer}. Sale de una tabla local de contadores que
+        se actualiza al guardar/recibir mensajes y al marcarlos como leídos, y se
+        reconcilia con la vista `chats_no_leidos` del servidor al sincronizar.
+        """
         try:
-            doc_id = self._get_user_doc_id(email)
-            
-            response = self.supabase.table("chats_mensajes") \
-                .select("contacto") \
-                .eq("user_id", doc_id) \
-                .neq("autor", "yo") \
-                .eq("leido", False) \
-                .execute()
-            
-            # Obtener contactos únicos
-            contactos = list(set([msg["contacto"] for msg in response.data]))
-            return contactos
-            
+            return self.cache.get_or_load("no_leidos", email, lambda: self._cargar_no_leidos(email))
         except Exception as e:
             print(f"!! [CLOUD] Error obteniendo mensajes sin leer: {e}")
-            return []
+            return {}
+
+    def _cargar_no_leidos(self, email: str) -> Dict[str, int]:
+        doc_id = self._asegurar_local(email, "no_leidos")
+        return self.local.no_leidos(doc_id)
+
+    def _descargar_no_leidos(self, doc_id: str) -> Dict[str, int]:
+        """
+        Una fila por conversación desde la vista:
+
+            create view chats_no_leidos as
+                select user_id, contacto, count(*) as no_leidos
+                from chats_mensajes
+                where not leido and autor <> 'yo'
+                group by user_id, contacto;
+
+        Si el servidor no la tiene, se recuentan los mensajes locales.
+        """
+        if "chats_no_leidos" not in self._rpc_ausentes:
+            try:
+                response = self.supabase.table("chats_no_leidos") \
+                    .select("contacto, no_leidos") \
+                    .eq("user_id", doc_id) \
+                    .execute()
+                conteos = {f["contacto"]: int(f["no_leidos"]) for f in response.data}
+                # Lo aún no subido se reaplica en orden: los mensajes recibidos
+                # suman y lo marcado como leído aquí sigue contando como leído
+                for entrada in self.local.journal_tabla(doc_id, "chats_mensajes"):
+                    payload = entrada["payload"]
+                    if entrada["tipo"] == "lote":
+                        fila = payload.get("fila", {})
+                        if fila.get("autor") != "yo" and not fila.get("leido"):
+                            conteos[fila.get("contacto")] = conteos.get(fila.get("contacto"), 0) + 1
+                    elif payload.get("fn") == "_marcar_leidos_cloud":
+                        args = payload.get("args", [])
+                        contactos = args[1] if len(args) > 1 else None
+                        conteos = {} if contactos is None else {
+                            c: n for c, n in conteos.items() if c not in contactos
+                        }
+                self.local.reemplazar_no_leidos(doc_id, conteos)
+                return conteos
+            except Exception as e:
+                if es_transitorio(e):
+                    raise
+                print(f"!! [CLOUD] Vista chats_no_leidos no disponible, contando en local: {e}")
+                self._rpc_ausentes.add("chats_no_leidos")
+        return self.local.recontar_no_leidos(doc_id)
+
+    def marcar_leidos(self, email: str, contactos: Optional[List[str]] = None):
+        """Marca como leídas de una vez las conversaciones dadas (o todas)."""
+        doc_id = self._get_user_doc_id(email)
+        self.local.marcar_leidos(doc_id, contactos)
+        if contactos is None:
+            self.cache.set("no_leidos", email, {})
+        else:
+            self.cache.actualizar("no_leidos", email,
+                                  lambda conteos: {c: n for c, n in conteos.items() if c not in contactos})
+        self._batcher.flush()  # Los mensajes aún en lote se insertan antes del UPDATE
+        self._journal_tarea("chats_mensajes", doc_id, "_marcar_leidos_cloud", email, contactos)
+
+    def _marcar_leidos_cloud(self, email: str, contactos: Optional[List[str]]) -> bool:
+        """Un único UPDATE para todas las conversaciones."""
+        try:
+            consulta = self.supabase.table("chats_mensajes") \
+                .update({"leido": True}, returning="minimal") \
+                .eq("user_id", self._get_user_doc_id(email)) \
+                .eq("leido", False)
+            if contactos is not None:
+                consulta = consulta.in_("contacto", contactos)
+            consulta.execute()
+            return True
+        except Exception as e:
+            print(f"!! [CLOUD] Error marcando mensajes como leídos: {e}")
+            return False
         
+    # ==========================================================
+    # 📜 HISTORIAL PAGINADO (KEYSET + PRECARGA)
+    # ==========================================================
+    def iter_chat(self, email: str, contacto: str, pagina: int = 50) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Historial con `contacto` página a página, de lo más reciente hacia atrás.
+        Cada página viene en orden cronológico (lista para anteponerla en la UI
+        al hacer scroll) y la siguiente se pide en segundo plano mientras tanto.
+        """
+        doc_id = self._asegurar_local(email, "chats_mensajes")
+        return self._iterar_historial("chats_mensajes", doc_id, pagina, {"contacto": contacto})
+
+    def iter_recuerdos(self, email: str, min_importancia: int = 1,
+                       pagina: int = 20) -> Iterator[List[Dict[str, Any]]]:
+        """Igual que iter_chat, para la memoria del usuario."""
+        doc_id = self._asegurar_local(email, "memoria")
+        return self._iterar_historial("memoria", doc_id, pagina, {"min_importancia": min_importancia})
+
+    def _iterar_historial(self, tabla: str, doc_id: str, pagina: int,
+                          filtros: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        if self._prefetch is None:
+            self._prefetch = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+
+        futuro = self._prefetch.submit(self._pagina_historial, tabla, doc_id, pagina, filtros, {"fase": "local"})
+        while futuro is not None:
+            filas, siguiente = futuro.result()
+            # Pedimos ya la siguiente página: se descarga mientras el llamador usa ésta
+            futuro = None
+            if siguiente is not None:
+                futuro = self._prefetch.submit(self._pagina_historial, tabla, doc_id, pagina, filtros, siguiente)
+            if filas:
+                filas.reverse()
+                yield filas
+
+    def _pagina_historial(self, tabla: str, doc_id: str, pagina: int, filtros: Dict[str, Any],
+                          cursor: Dict[str, Any]) -> tuple:
+        """
+        Devuelve (filas, siguiente_cursor). Primero se agota la copia local con
+        keyset (fecha, local_id); después se sigue en Supabase con keyset
+        (fecha, id) desde la fila más antigua que ya tenemos. Lo que llega de la
+        nube se guarda en local, así que nunca se descarga dos veces.
+        """
+        marca = f"{tabla}:inicio:{json.dumps(filtros, sort_keys=True)}"
+
+        if cursor["fase"] == "local":
+            filas = self.local.pagina(tabla, doc_id, cursor.get("antes"), pagina, **filtros)
+            if len(filas) == pagina:
+                ultima = filas[-1]
+                siguiente = {"fase": "local", "antes": (ultima["fecha"], ultima["local_id"]),
+                             "remoto": (ultima["fecha"], ultima["id"])}
+            elif self.local.sincronizado(doc_id, marca):
+                siguiente = None  # Ya bajamos antes todo el historial hasta el principio
+            else:
+                ultima = filas[-1] if filas else None
+                siguiente = {"fase": "remoto",
+                             "remoto": (ultima["fecha"], ultima["id"]) if ultima else cursor.get("remoto")}
+            for fila in filas:
+                del fila["local_id"]
+            return filas, siguiente
+
+        if not self.cloud_ready:
+            return [], None
+
+        consulta = self.supabase.table(tabla).select("*").eq("user_id", doc_id)
+        if filtros.get("contacto") is not None:
+            consulta = consulta.eq("contacto", filtros["contacto"])
+        if filtros.get("min_importancia") is not None:
+            consulta = consulta.gte("importancia", filtros["min_importancia"])
+        if cursor.get("remoto"):
+            fecha, remote_id = cursor["remoto"]
+            if remote_id is not None:
+                consulta = consulta.or_(f'fecha.lt."{fecha}",and(fecha.eq."{fecha}",id.lt.{remote_id})')
+            else:
+                consulta = consulta.lt("fecha", fecha)
+        response = consulta.order("fecha", desc=True).order("id", desc=True).limit(pagina).execute()
+
+        filas = response.data
+        self.local.insertar_filas(tabla, filas)
+        if len(filas) < pagina:
+            self.local.marcar_sync(doc_id, marca, None)
+            return filas, None
+        return filas, {"fase": "remoto", "remoto": (filas[-1]["fecha"], filas[-1]["id"])}
+
     # ==========================================================
     # 🔐 GESTIÓN DE CÓDIGOS (ESTRICTO BASE DE DATOS)
     # ==========================================================
     def guardar_codigo_verificacion(self, email: str, codigo: str) -> bool:
-        """Guarda en Supabase y CONFIRMA que se escribió correctamente."""
-        if not self.cloud_ready: 
+        """Guarda el código en Supabase; el upsert devuelve la fila escrita como confirmación."""
+        if not self.esperar_listo(): 
             print("!! [CLOUD] Error: Nube no disponible para guardar código.")
             return False
 
@@ -810,6 +1964,11 @@ class CloudManager:
             # 1. Normalización
             email_clean = str(email).lower().strip()
             doc_id = hashlib.sha256(f"code_{email_clean}".encode()).hexdigest()
+
+            permitido, espera = self._envios_codigo.permitir(email_clean)
+            if not permitido:
+                print(f"!! [CLOUD] Demasiados códigos pedidos para {doc_id[:8]}, reintentar en {espera:.0f}s")
+                return False
             
             print(f">> [CLOUD] Intentando escribir en DB | ID: {doc_id[:8]}...")
 
@@ -821,14 +1980,11 @@ class CloudManager:
                 "creado": datetime.now(timezone.utc).isoformat()
             }
 
-            # 2. ESCRITURA SINCRÓNICA (Bloqueante)
-            self.supabase.table("verification_codes").upsert(datos).execute()
-            
-            # 3. AUTO-VERIFICACIÓN DE INTEGRIDAD (La prueba de fuego)
+            # 2. ESCRITURA SINCRÓNICA con la fila de vuelta (un solo viaje)
             response = self.supabase.table("verification_codes") \
-                .select("*") \
-                .eq("id", doc_id) \
+                .upsert(datos, returning="representation") \
                 .execute()
+            self._envios_codigo.registrar(email_clean)
             
             if response.data:
                 print(f"✅ [CLOUD] Escritura CONFIRMADA en base de datos. El documento existe.")
@@ -842,77 +1998,259 @@ class CloudManager:
             return False
 
     def validar_codigo_verificacion(self, email: str, codigo_usuario: str) -> Dict[str, Any]:
-        """Verifica directamente contra la base de datos."""
-        if not self.cloud_ready: 
+        """
+        Consume el código de forma atómica: un único DELETE condicionado a que
+        el código coincida y no haya caducado, que devuelve la fila borrada.
+        Si dos validaciones compiten, sólo una recibe la fila.
+        """
+        if not self.esperar_listo(): 
             return {"ok": False, "error": "Nube desconectada"}
 
+        email_clean = str(email).lower().strip()
+        code_user = str(codigo_usuario).strip()
+
+        permitido, espera = self._fallos_codigo.permitir(email_clean)
+        if not permitido:
+            return {"ok": False, "error": f"Demasiados intentos. Prueba de nuevo en {max(1, round(espera / 60))} min."}
+        if not code_user:
+            return {"ok": False, "error": "Código incorrecto."}
+
         try:
-            email_clean = str(email).lower().strip()
             doc_id = hashlib.sha256(f"code_{email_clean}".encode()).hexdigest()
-            code_user = str(codigo_usuario).strip()
-            
-            print(f">> [CLOUD] Consultando DB para ID: {doc_id[:8]}...")
-            
-            # Forzamos lectura fresca del servidor
+            print(f">> [CLOUD] Consumiendo código para ID: {doc_id[:8]}...")
+
             response = self.supabase.table("verification_codes") \
-                .select("*") \
+                .delete(returning="representation") \
                 .eq("id", doc_id) \
+                .eq("codigo", code_user) \
+                .gt("expira", datetime.now(timezone.utc).isoformat()) \
                 .execute()
-            
-            if not response.data:
-                print(f"!! [CLOUD] Documento {doc_id[:8]} NO ENCONTRADO en la consulta de validación.")
-                return {"ok": False, "error": "Código no encontrado (Error de DB)."}
 
-            data = response.data[0]
-            print(f">> [CLOUD] Datos recuperados: {data.get('codigo')} vs Ingresado: {code_user}")
-            
-            # Verificar expiración
-            try:
-                expira = datetime.fromisoformat(data["expira"])
-                if datetime.now(timezone.utc) > expira:
-                    return {"ok": False, "error": "El código ha expirado."}
-            except: 
-                pass
-
-            # Comparar
-            if str(data["codigo"]).strip() == code_user:
-                # Borrar tras uso
-                try:
-                    self.supabase.table("verification_codes").delete().eq("id", doc_id).execute()
-                except: 
-                    pass
+            if response.data:
+                self._fallos_codigo.limpiar(email_clean)
                 return {"ok": True}
-            else:
-                return {"ok": False, "error": "Código incorrecto."}
+
+            self._fallos_codigo.registrar(email_clean)
+            return {"ok": False, "error": "Código incorrecto o expirado."}
 
         except Exception as e:
             print(f"!! [CLOUD] Error validando: {e}")
             return {"ok": False, "error": f"Error técnico: {e}"}
 
+    # ==========================================================
+    # ⚡ SKILL STUDIO (MACROS)
+    # ==========================================================
+    def obtener_skills(self, email: str) -> List[Dict]:
+        """Descarga las macros guardadas por el usuario (con caché + copia local)."""
+        try:
+            return self.cache.get_or_load("skills", email, lambda: self._cargar_skills(email))
+        except Exception as e:
+            print(f"!! [CLOUD] Error obteniendo skills: {e}")
+            return []
+
+    def _cargar_skills(self, email: str) -> List[Dict]:
+        doc_id = self._asegurar_local(email, "skills")
+        return self.local.skills(doc_id)
+
+    def buscar_skill(self, email: str, texto: str) -> Optional[Dict[str, Any]]:
+        """
+        Skill del usuario cuyo trigger abre `texto` ({"id", "trigger",
+        "actions"} o None). Usa un índice Aho–Corasick en RAM: tras la primera
+        llamada no lee ni la caché ni la red.
+        """
+        indice = self._indices_skills.get(email)
+        if indice is None:
+            indice = IndiceTriggers(self.obtener_skills(email))
+            self._indices_skills[email] = indice
+        return indice.buscar(texto)
+
+    def _refrescar_skills(self, email: str, doc_id: str):
+        """Propaga el espejo local a la caché y al índice de triggers (sólo lo que cambió)."""
+        skills = self.local.skills(doc_id)
+        self.cache.actualizar("skills", email, lambda _: skills)
+        indice = self._indices_skills.get(email)
+        if indice is not None:
+            indice.reemplazar(skills)
+
+    def guardar_skill(self, email: str, trigger: str, actions: List[Dict]):
+        """Guarda una macro. Volver a guardar el mismo trigger la sobrescribe."""
+        doc_id = self._get_user_doc_id(email)
+        self.local.registrar_usuario(doc_id, email)
+        self.local.upsert_skill(doc_id, trigger, actions)
+        self._refrescar_skills(email, doc_id)
+        
+        # Ejecutamos en segundo plano para no congelar la UI
+        self._journal_tarea("skills", doc_id, "_guardar_skill_cloud", email, trigger, actions)
+
+    def _guardar_skill_cloud(self, email: str, trigger: str, actions: List[Dict]) -> bool:
+        """
+        Upsert idempotente sobre (user_id, trigger). Necesita la restricción única
+        (antes se insertaban duplicados, así que primero se limpian):
+
+            delete from skills a using skills b
+             where a.user_id = b.user_id and a.trigger = b.trigger and a.id < b.id;
+            alter table skills add constraint skills_user_trigger_key unique (user_id, trigger);
+
+        Si el servidor aún no la tiene, se busca la fila y se actualiza o inserta.
+        """
+        doc_id = self._get_user_doc_id(email)
+        data = {
+            "user_id": doc_id,
+            "trigger": trigger,
+            "actions": json.dumps(actions) # Guardamos el JSON de pasos
+        }
+        try:
+            response = None
+            if "skills_user_trigger_key" not in self._rpc_ausentes:
+                try:
+                    response = self.supabase.table("skills").upsert(data, on_conflict="user_id,trigger").execute()
+                except Exception as e:
+                    if es_transitorio(e):
+                        raise
+                    print(f"!! [CLOUD] skills sin restricción única (user_id, trigger), usando select + update: {e}")
+                    self._rpc_ausentes.add("skills_user_trigger_key")
+
+            if response is None:
+                existente = self.supabase.table("skills") \
+                    .select("id") \
+                    .eq("user_id", doc_id) \
+                    .eq("trigger", trigger) \
+                    .limit(1) \
+                    .execute()
+                if existente.data:
+                    response = self.supabase.table("skills") \
+                        .update({"actions": data["actions"]}) \
+                        .eq("id", existente.data[0]["id"]) \
+                        .execute()
+                else:
+                    response = self.supabase.table("skills").insert(data).execute()
+
+            # Con el id remoto la skill ya se puede borrar desde este equipo
+            if response.data and response.data[0].get("id") is not None:
+                self.local.upsert_skill(doc_id, trigger, actions, response.data[0]["id"])
+                self._refrescar_skills(email, doc_id)
+            print(f">> [CLOUD] Skill guardada: {trigger}")
+            return True
+        except Exception as e:
+            print(f"!! [CLOUD] Error guardando skill: {e}")
+            return False
+
+    def _guardar_skill_internal(self, email: str, trigger: str, actions: List[Dict]) -> bool:
+        """Compatibilidad con entradas antiguas del diario."""
+        return self._guardar_skill_cloud(email, trigger, actions)
+    
+    def borrar_skill(self, skill_id: int):
+        """Elimina una macro por su ID numérico."""
+        self.local.borrar_skill(skill_id)
+        # No sabemos de qué usuario era: invalidamos todas las skills cacheadas
+        self.cache.invalidar("skills")
+        for indice in list(self._indices_skills.values()):
+            indice.quitar_id(skill_id)
+        self._journal_tarea("skills", None, "_borrar_skill_cloud", skill_id)
+
+    def _borrar_skill_cloud(self, skill_id: int) -> bool:
+        try:
+            self.supabase.table("skills").delete().eq("id", skill_id).execute()
+            print(f">> [CLOUD] Skill eliminada: ID {skill_id}")
+            return True
+        except Exception as e:
+            print(f"!! [CLOUD] Error borrando skill: {e}")
+            return False
+
     # ==========================================================
     # 🛠️ UTILIDADES ADICIONALES
     # ==========================================================
     def flush_cache(self, email: str = None):
         """Limpia la caché para un usuario específico o toda la caché."""
         if email:
-            self._config_cache.pop(email, None)
-            self._gustos_cache.pop(email, None)
-            self._comandos_cache.pop(email, None)
+            self.cache.invalidar(key=email)
             print(f">> [CLOUD] Caché limpiada para: {email}")
         else:
-            self._config_cache.clear()
-            self._gustos_cache.clear()
-            self._comandos_cache.clear()
+            self.cache.clear()
             print(">> [CLOUD] Caché completamente limpiada")
 
+    # ==========================================================
+    # 📈 MÉTRICAS DE LATENCIA
+    # ==========================================================
+    def metricas(self) -> Dict[str, Any]:
+        """
+        Foto de rendimiento: histogramas de Supabase por tabla.operación
+        (n, errores, p50/p95/p99, bytes), ordenados por tiempo total, más la
+        profundidad de la cola de escritura y el acierto de la caché.
+        """
+        escrituras = self._writer.stats()
+        lotes = self._batcher.stats()
+        cache = self.cache.stats()
+        return {
+            "desde": self._metricas.inicio,
+            "supabase": self._metricas.snapshot(),
+            "cola_escritura": {
+                "profundidad": escrituras.get("profundidad", 0),
+                "profundidad_max": escrituras.get("profundidad_max", 0),
+                "en_curso": escrituras.get("en_curso", 0),
+                "en_disco": escrituras.get("en_disco", 0),
+                "espera_media_ms": escrituras.get("espera_media_ms", 0),
+                "filas_en_lote": lotes.get("filas_en_espera", 0),
+            },
+            "cache": {
+                "hit_ratio": cache.get("hit_ratio", 0),
+                "por_namespace": {
+                    ns: round((d["hits"] + d["stale_hits"]) / consultas, 3)
+                    for ns, d in cache.get("por_namespace", {}).items()
+                    for consultas in [d["hits"] + d["misses"] + d["stale_hits"]] if consultas
+                },
+            },
+        }
+
+    def exportar_metricas(self, formato: str = "prometheus", ruta: Optional[str] = None) -> str:
+        """
+        Exporta las métricas como texto de Prometheus o como una línea JSON.
+        Con `ruta`, Prometheus sobrescribe el fichero y JSONL añade al final.
+        """
+        try:
+            foto = self.metricas()
+            if formato == "jsonl":
+                texto = self._metricas.jsonl({k: v for k, v in foto.items() if k != "supabase"})
+            else:
+                cola, cache = foto["cola_escritura"], foto["cache"]
+                texto = self._metricas.prometheus({
+                    "write_queue_depth": cola["profundidad"],
+                    "write_queue_in_flight": cola["en_curso"],
+                    "write_queue_spilled": cola["en_disco"],
+                    "batch_rows_pending": cola["filas_en_lote"],
+                    "cache_hit_ratio": cache["hit_ratio"],
+                })
+            if ruta:
+                with open(ruta, "a" if formato == "jsonl" else "w", encoding="utf-8") as f:
+                    f.write(texto)
+            return texto
+        except Exception as e:
+            print(f"!! [CLOUD] Error exportando métricas: {e}")
+            return ""
+
     def get_status(self) -> Dict[str, Any]:
         """Obtiene el estado del gestor de nube."""
         return {
             "cloud_ready": self.cloud_ready,
+            "circuito": self._politica.breaker.stats(),
+            "llamadas": self._politica.stats(),
+            "latencias": self._metricas.snapshot(),
             "supabase_available": SUPABASE_AVAILABLE,
-            "config_cache_size": len(self._config_cache),
-            "gustos_cache_size": len(self._gustos_cache),
-            "comandos_cache_size": len(self._comandos_cache)
+            "arranque": {**self._arranque, "listo": self._listo.done()},
+            "config_cache_size": self.cache.tamano("config"),
+            "gustos_cache_size": self.cache.tamano("gustos"),
+            "comandos_cache_size": self.cache.tamano("comandos"),
+            "cache": self.cache.stats(),
+            "escrituras": self._writer.stats(),
+            "lotes": self._batcher.stats(),
+            "usos_comandos": self._usos.stats(),
+            "config_debounce": self._config_debounce.stats(),
+            "local": self.local.stats(),
+            "sesiones_revocadas": len(self._revocados),
+            "codigos": {"fallos": self._fallos_codigo.stats(), "envios": self._envios_codigo.stats()},
+            "precarga": self._ultima_precarga,
+            "realtime": {**self._feed.stats(), "usuarios": len(self._observados)} if self._feed else None,
+            "hashing": self.hasher.stats()
         }
 
 # ==========================================================
@@ -944,94 +2282,3 @@ if __name__ == "__main__":
             print(f"Usuario del token: {email}")
     else:
         print("❌ Supabase no disponible")
-
-# ==========================================================
-    # ⚡ SKILL STUDIO (MACROS AVANZADAS)
-    # ==========================================================
-    def guardar_skill(self, email: str, trigger: str, actions: List[Dict]):
-        """Guarda una macro compleja (secuencia de pasos)."""
-        # Validar caché y modo offline...
-        if not self.cloud_ready: return
-        
-        self._run_async(self._guardar_skill_cloud, email, trigger, actions)
-
-    def _guardar_skill_cloud(self, email: str, trigger: str, actions: List[Dict]):
-        try:
-            doc_id = self._get_user_doc_id(email)
-            # Upsert basado en user_id y trigger sería ideal, 
-            # pero por simplicidad insertamos o actualizamos buscando por trigger
-            
-            # Primero borramos si existe para ese usuario (para sobrescribir)
-            self.supabase.table("skills").delete().eq("user_id", doc_id).eq("trigger", trigger).execute()
-            
-            data = {
-                "user_id": doc_id,
-                "trigger": trigger,
-                "actions": json.dumps(actions) # Guardamos el JSON de pasos
-            }
-            self.supabase.table("skills").insert(data).execute()
-            print(f">> [CLOUD] Skill guardada: {trigger}")
-        except Exception as e:
-            print(f"!! [CLOUD] Error guardando skill: {e}")
-
-    # ==========================================================
-    # ⚡ SKILL STUDIO (MACROS)
-    # ==========================================================
-    def obtener_skills(self, email: str) -> List[Dict]:
-        """Descarga las macros guardadas por el usuario."""
-        if not self.cloud_ready: return []
-        try:
-            doc_id = self._get_user_doc_id(email)
-            # Seleccionamos * de la tabla skills
-            response = self.supabase.table("skills").select("*").eq("user_id", doc_id).execute()
-            
-            # Procesar datos
-            skills = []
-            for item in response.data:
-                # Supabase a veces devuelve el JSON como string, a veces como dict
-                actions_data = item.get("actions")
-                if isinstance(actions_data, str):
-                    try: actions_data = json.loads(actions_data)
-                    except: actions_data = []
-                
-                skills.append({
-                    "id": item.get("id"),
-                    "trigger": item.get("trigger"),
-                    "actions": actions_data
-                })
-            return skills
-        except Exception as e:
-            print(f"!! [CLOUD] Error obteniendo skills: {e}")
-            return []
-
-    def guardar_skill(self, email: str, trigger: str, actions: List[Dict]):
-        """Guarda una nueva macro."""
-        if not self.cloud_ready: return
-        
-        # Ejecutamos en segundo plano para no congelar la UI
-        self._run_async(self._guardar_skill_internal, email, trigger, actions)
-
-    def _guardar_skill_internal(self, email: str, trigger: str, actions: List[Dict]):
-        try:
-            doc_id = self._get_user_doc_id(email)
-            
-            # Preparamos los datos
-            data = {
-                "user_id": doc_id,
-                "trigger": trigger,
-                "actions": json.dumps(actions) # Convertimos lista a JSON string para guardar
-            }
-            
-            self.supabase.table("skills").insert(data).execute()
-            print(f">> [CLOUD] Skill guardada: {trigger}")
-        except Exception as e:
-            print(f"!! [CLOUD] Error guardando skill: {e}")
-    
-    def borrar_skill(self, skill_id: int):
-        """Elimina una macro por su ID numérico."""
-        if not self.cloud_ready: return
-        try:
-            self.supabase.table("skills").delete().eq("id", skill_id).execute()
-            print(f">> [CLOUD] Skill eliminada: ID {skill_id}")
-        except Exception as e:
-            print(f"!! [CLOUD] Error borrando skill: {e}")
\ No newline at end of file
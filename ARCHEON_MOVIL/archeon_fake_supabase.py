@@ -0,0 +1,530 @@
+# archeon_fake_supabase.py - Supabase en memoria con latencia y fallos inyectables
+#
+# Implementa el subconjunto del cliente que usan CloudManager y las funciones
+# de Cloud Drive de main.py: table() con sus filtros, rpc(), storage.from_()
+# y las vistas/funciones SQL documentadas en archeon_cloud.py. Con la misma
+# `semilla` la secuencia de latencias y fallos es siempre la misma.
+import os
+import re
+import json
+import time
+import random
+import threading
+from copy import deepcopy
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class FalloSimulado(ConnectionError):
+    """Fallo de red inyectado (transitorio: se reintenta y cuenta para el breaker)."""
+
+
+class ErrorPostgrest(Exception):
+    """Error con el formato de PostgREST: el servidor respondió, no es transitorio."""
+
+    def __init__(self, mensaje: str, code: str, status: int = 400):
+        super().__init__(mensaje)
+        self.message = mensaje
+        self.code = code
+        self.status_code = status
+
+
+class _Respuesta:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _ahora() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _igual(a: Any, b: Any) -> bool:
+    if a == b:
+        return True
+    if a is None or b is None:
+        return False
+    return str(a).lower() == str(b).lower() if isinstance(a, bool) or isinstance(b, bool) else str(a) == str(b)
+
+
+def _comparar(a: Any, op: str, b: Any) -> bool:
+    if op == "eq":
+        return _igual(a, b)
+    if op == "neq":
+        return not _igual(a, b)
+    if op == "is":
+        objetivo = {"null": None, "true": True, "false": False}.get(str(b).lower(), b)
+        return a is objetivo or a == objetivo
+    if op == "in":
+        return any(_igual(a, v) for v in b)
+    if a is None or b is None:
+        return False
+    if type(a) is not type(b) and not (isinstance(a, (int, float)) and isinstance(b, (int, float))):
+        a, b = str(a), str(b)
+    return {"lt": a < b, "lte": a <= b, "gt": a > b, "gte": a >= b}[op]
+
+
+def _valor_literal(texto: str) -> Any:
+    texto = texto.strip()
+    if len(texto) >= 2 and texto[0] == texto[-1] == '"':
+        return texto[1:-1]
+    if re.fullmatch(r"-?\d+", texto):
+        return int(texto)
+    return texto
+
+
+def _dividir_nivel_cero(expr: str) -> List[str]:
+    """Separa por comas que no estén dentro de paréntesis ni de comillas."""
+    partes, nivel, comillas, actual = [], 0, False, ""
+    for caracter in expr:
+        if caracter == '"':
+            comillas = not comillas
+        elif not comillas and caracter == "(":
+            nivel += 1
+        elif not comillas and caracter == ")":
+            nivel -= 1
+        if caracter == "," and nivel == 0 and not comillas:
+            partes.append(actual)
+            actual = ""
+        else:
+            actual += caracter
+    partes.append(actual)
+    return [p.strip() for p in partes if p.strip()]
+
+
+def _parsear_logico(expr: str, conector: str = "or") -> Callable[[Dict[str, Any]], bool]:
+    """Filtro `or=(...)` de PostgREST: `a.op.v,and(b.op.v,c.op.v)` (sin `not`)."""
+    condiciones = []
+    for parte in _dividir_nivel_cero(expr):
+        grupo = re.fullmatch(r"(and|or)\((.*)\)", parte, re.S)
+        if grupo:
+            condiciones.append(_parsear_logico(grupo.group(2), grupo.group(1)))
+            continue
+        columna, op, valor = parte.split(".", 2)
+        condiciones.append(lambda fila, c=columna, o=op, v=_valor_literal(valor): _comparar(fila.get(c), o, v))
+    combinar = all if conector == "and" else any
+    return lambda fila: combinar(c(fila) for c in condiciones)
+
+
+class _Consulta:
+    """Query builder encadenable; el trabajo se hace en `execute()`."""
+
+    def __init__(self, backend: "SupabaseEnMemoria", tabla: str):
+        self._backend = backend
+        self._tabla = tabla
+        self._op = "select"
+        self._columnas = "*"
+        self._valores: Any = None
+        self._filtros: List[Callable[[Dict[str, Any]], bool]] = []
+        self._orden: List[Tuple[str, bool]] = []
+        self._limite: Optional[int] = None
+        self._desde = 0
+        self._count: Optional[str] = None
+        self._returning = "representation"
+        self._on_conflict = ""
+
+    # --- Operaciones ---
+    def select(self, columnas: str = "*", count: Optional[str] = None):
+        self._columnas, self._count = columnas, count
+        return self
+
+    def insert(self, filas: Any, count: Optional[str] = None, returning: str = "representation", **_):
+        self._op, self._valores, self._count, self._returning = "insert", filas, count, str(returning)
+        return self
+
+    def upsert(self, filas: Any, count: Optional[str] = None, returning: str = "representation",
+               on_conflict: str = "", **_):
+        self._op, self._valores, self._count, self._returning = "upsert", filas, count, str(returning)
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, valores: Dict[str, Any], count: Optional[str] = None, returning: str = "representation", **_):
+        self._op, self._valores, self._count, self._returning = "update", valores, count, str(returning)
+        return self
+
+    def delete(self, count: Optional[str] = None, returning: str = "representation", **_):
+        self._op, self._count, self._returning = "delete", count, str(returning)
+        return self
+
+    # --- Filtros y modificadores ---
+    def _filtro(self, columna: str, op: str, valor: Any):
+        self._filtros.append(lambda fila: _comparar(fila.get(columna), op, valor))
+        return self
+
+    def eq(self, columna: str, valor: Any):
+        return self._filtro(columna, "eq", valor)
+
+    def neq(self, columna: str, valor: Any):
+        return self._filtro(columna, "neq", valor)
+
+    def lt(self, columna: str, valor: Any):
+        return self._filtro(columna, "lt", valor)
+
+    def lte(self, columna: str, valor: Any):
+        return self._filtro(columna, "lte", valor)
+
+    def gt(self, columna: str, valor: Any):
+        return self._filtro(columna, "gt", valor)
+
+    def gte(self, columna: str, valor: Any):
+        return self._filtro(columna, "gte", valor)
+
+    def in_(self, columna: str, valores: List[Any]):
+        return self._filtro(columna, "in", list(valores))
+
+    def is_(self, columna: str, valor: Any):
+        return self._filtro(columna, "is", valor)
+
+    def or_(self, expr: str, **_):
+        self._filtros.append(_parsear_logico(expr))
+        return self
+
+    def order(self, columna: str, desc: bool = False, **_):
+        self._orden.append((columna, desc))
+        return self
+
+    def limit(self, n: int, **_):
+        self._limite = int(n)
+        return self
+
+    def range(self, inicio: int, fin: int, **_):
+        self._desde, self._limite = int(inicio), int(fin) - int(inicio) + 1
+        return self
+
+    def execute(self) -> _Respuesta:
+        return self._backend._ejecutar(self._op, self._tabla, lambda: self._resolver())
+
+    # --- Resolución ---
+    def _coincide(self, fila: Dict[str, Any]) -> bool:
+        return all(f(fila) for f in self._filtros)
+
+    def _proyectar(self, fila: Dict[str, Any]) -> Dict[str, Any]:
+        if self._columnas.strip() == "*":
+            return deepcopy(fila)
+        return {c.strip(): deepcopy(fila.get(c.strip())) for c in self._columnas.split(",")}
+
+    def _respuesta(self, filas: List[Dict[str, Any]], total: Optional[int] = None) -> _Respuesta:
+        data = [] if self._returning == "minimal" and self._op != "select" else [self._proyectar(f) for f in filas]
+        return _Respuesta(data, (len(filas) if total is None else total) if self._count else None)
+
+    def _resolver(self) -> _Respuesta:
+        b = self._backend
+        if self._op == "select":
+            filas = [f for f in b._filas(self._tabla) if self._coincide(f)]
+            for columna, desc in reversed(self._orden):
+                filas.sort(key=lambda f: (f.get(columna) is None, f.get(columna) if f.get(columna) is not None else ""),
+                           reverse=desc)
+            total = len(filas)
+            fin = None if self._limite is None else self._desde + self._limite
+            return self._respuesta(filas[self._desde:fin], total)
+
+        if self._op in ("insert", "upsert"):
+            filas = self._valores if isinstance(self._valores, list) else [self._valores]
+            clave = tuple(c.strip() for c in self._on_conflict.split(",")) if self._on_conflict else None
+            escritas = [b._escribir(self._tabla, dict(f), self._op == "upsert", clave) for f in filas]
+            return self._respuesta(escritas)
+
+        if self._op == "update":
+            cambiadas = b._actualizar(self._tabla, self._coincide, self._valores)
+            return self._respuesta(cambiadas)
+
+        borradas = b._borrar(self._tabla, self._coincide)
+        return self._respuesta(borradas)
+
+
+class _RPC:
+    def __init__(self, backend: "SupabaseEnMemoria", nombre: str, params: Dict[str, Any]):
+        self._backend = backend
+        self._nombre = nombre
+        self._params = params
+
+    def execute(self) -> _Respuesta:
+        def llamar():
+            funcion = self._backend.funciones.get(self._nombre)
+            if funcion is None:
+                raise ErrorPostgrest(f"Could not find the function public.{self._nombre}", "PGRST202", 404)
+            return _Respuesta(funcion(self._backend, **self._params))
+        return self._backend._ejecutar("rpc", f"rpc:{self._nombre}", llamar)
+
+
+class _Bucket:
+    def __init__(self, backend: "SupabaseEnMemoria", nombre: str):
+        self._backend = backend
+        self._nombre = nombre
+
+    def _objetos(self) -> Dict[str, bytes]:
+        return self._backend.buckets.setdefault(self._nombre, {})
+
+    def upload(self, path: str, file: Any, file_options: Optional[Dict[str, Any]] = None):
+        def subir():
+            if isinstance(file, (bytes, bytearray)):
+                datos = bytes(file)
+            elif isinstance(file, str):
+                with open(file, "rb") as f:
+                    datos = f.read()
+            else:
+                datos = file.read()
+            with self._backend._lock:
+                objetos = self._objetos()
+                if path in objetos and str((file_options or {}).get("upsert", "false")).lower() != "true":
+                    raise ErrorPostgrest("The resource already exists", "Duplicate", 409)
+                objetos[path] = datos
+            return {"path": path, "Key": f"{self._nombre}/{path}"}
+        return self._backend._ejecutar("storage", f"storage:{self._nombre}", subir)
+
+    def download(self, path: str) -> bytes:
+        def bajar():
+            with self._backend._lock:
+                if path not in self._objetos():
+                    raise ErrorPostgrest("Object not found", "NotFound", 404)
+                return self._objetos()[path]
+        return self._backend._ejecutar("storage", f"storage:{self._nombre}", bajar)
+
+    def remove(self, paths: List[str]) -> List[Dict[str, Any]]:
+        def borrar():
+            with self._backend._lock:
+                objetos = self._objetos()
+                return [{"name": p} for p in paths if objetos.pop(p, None) is not None]
+        return self._backend._ejecutar("storage", f"storage:{self._nombre}", borrar)
+
+    def list(self, path: str = "", options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        def listar():
+            prefijo = f"{path.rstrip('/')}/" if path else ""
+            with self._backend._lock:
+                nombres = sorted({p[len(prefijo):].split("/")[0] for p in self._objetos() if p.startswith(prefijo)})
+            opciones = options or {}
+            desde = int(opciones.get("offset", 0))
+            return [{"name": n} for n in nombres[desde:desde + int(opciones.get("limit", 100))]]
+        return self._backend._ejecutar("storage", f"storage:{self._nombre}", listar)
+
+    def get_public_url(self, path: str) -> str:
+        return f"memoria://{self._nombre}/{path}"
+
+
+class _Storage:
+    def __init__(self, backend: "SupabaseEnMemoria"):
+        self._backend = backend
+
+    def from_(self, bucket: str) -> _Bucket:
+        return _Bucket(self._backend, bucket)
+
+
+# ==========================================================
+# 🧮 VISTAS Y FUNCIONES SQL DEL PROYECTO
+# ==========================================================
+def _vista_chats_no_leidos(backend: "SupabaseEnMemoria") -> List[Dict[str, Any]]:
+    conteos: Dict[tuple, int] = {}
+    for fila in backend._filas("chats_mensajes"):
+        if not fila.get("leido") and fila.get("autor") != "yo":
+            clave = (fila.get("user_id"), fila.get("contacto"))
+            conteos[clave] = conteos.get(clave, 0) + 1
+    return [{"user_id": u, "contacto": c, "no_leidos": n} for (u, c), n in conteos.items()]
+
+
+def _rpc_merge_config(backend: "SupabaseEnMemoria", p_id: str, p_parche: Dict[str, Any]) -> Optional[str]:
+    def fusionar(fila):
+        actual = fila.get("config") or "{}"
+        actual = json.loads(actual) if isinstance(actual, str) else actual
+        return {"config": json.dumps({**actual, **p_parche}), "actualizado": _ahora()}
+    filas = backend._actualizar("users", lambda f: _igual(f.get("id"), p_id), fusionar)
+    return filas[0]["actualizado"] if filas else None
+
+
+def _rpc_incrementar_uso_comando(backend: "SupabaseEnMemoria", p_user_id: str, p_comando: str,
+                                 p_accion: str, p_delta: int, p_fecha: str) -> int:
+    with backend._lock:
+        for fila in backend._filas("comandos"):
+            if fila.get("user_id") == p_user_id and fila.get("comando") == p_comando:
+                nueva = {**fila, "accion": p_accion, "fecha": p_fecha, "usos": (fila.get("usos") or 0) + p_delta}
+                backend._reemplazar_fila("comandos", fila, nueva)
+                return nueva["usos"]
+        backend._escribir("comandos", {"user_id": p_user_id, "comando": p_comando, "accion": p_accion,
+                                       "fecha": p_fecha, "usos": p_delta}, False, None)
+        return p_delta
+
+
+class SupabaseEnMemoria:
+    """
+    Sustituto en proceso del cliente de Supabase.
+
+    - Latencia por llamada: `latencia` + uniforme(0, `jitter`) segundos, con
+      valores por operación en `latencias` ({"select": 0.02, "storage": 0.2}).
+    - Cola lenta: con probabilidad `tasa_lentas` la llamada tarda `factor_lentas`
+      veces más (para medir p99).
+    - Fallos: con probabilidad `tasa_fallos` (o `fallos[op]`) se lanza
+      FalloSimulado tras la latencia, como un corte de red.
+    - Claves: `primarias` (destino por defecto del upsert) y `unicas`; un
+      on_conflict que no coincide con ninguna da el error 42P10 de Postgres.
+    - Si se pasa `feed` (FeedLocal) cada escritura se publica como un evento Realtime.
+    """
+
+    PRIMARIAS = {"gustos": ("user_id", "gusto"), "comandos": ("user_id", "comando"),
+                 "sesiones_revocadas": ("jti",)}
+    UNICAS = {"skills": [("user_id", "trigger")]}
+
+    def __init__(self, latencia: float = 0.0, jitter: float = 0.0, tasa_fallos: float = 0.0,
+                 semilla: Optional[int] = None, latencias: Optional[Dict[str, float]] = None,
+                 fallos: Optional[Dict[str, float]] = None, tasa_lentas: float = 0.0,
+                 factor_lentas: float = 10.0, primarias: Optional[Dict[str, tuple]] = None,
+                 unicas: Optional[Dict[str, List[tuple]]] = None, feed: Any = None):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tasa_fallos = tasa_fallos
+        self.latencias = latencias or {}
+        self.fallos = fallos or {}
+        self.tasa_lentas = tasa_lentas
+        self.factor_lentas = factor_lentas
+        self.primarias = {**self.PRIMARIAS, **(primarias or {})}
+        self.unicas = {**self.UNICAS, **(unicas or {})}
+        self.feed = feed
+
+        self.tablas: Dict[str, List[Dict[str, Any]]] = {}
+        self.buckets: Dict[str, Dict[str, bytes]] = {}
+        self.vistas: Dict[str, Callable[["SupabaseEnMemoria"], List[Dict[str, Any]]]] = {
+            "chats_no_leidos": _vista_chats_no_leidos,
+        }
+        self.funciones: Dict[str, Callable[..., Any]] = {
+            "merge_config": _rpc_merge_config,
+            "incrementar_uso_comando": _rpc_incrementar_uso_comando,
+        }
+        self._ids: Dict[str, int] = {}
+        self._azar = random.Random(semilla)
+        self._lock = threading.RLock()
+        self._stats: Dict[str, Any] = {"llamadas": 0, "fallos_inyectados": 0, "lentas": 0,
+                                       "espera_total_s": 0.0, "por_operacion": {}}
+
+    @classmethod
+    def desde_entorno(cls, **kwargs) -> "SupabaseEnMemoria":
+        """AR_FAKE_LATENCY_MS, AR_FAKE_JITTER_MS, AR_FAKE_FAIL_RATE, AR_FAKE_SLOW_RATE y AR_FAKE_SEED."""
+        semilla = os.getenv("AR_FAKE_SEED")
+        return cls(
+            latencia=float(os.getenv("AR_FAKE_LATENCY_MS", "0")) / 1000,
+            jitter=float(os.getenv("AR_FAKE_JITTER_MS", "0")) / 1000,
+            tasa_fallos=float(os.getenv("AR_FAKE_FAIL_RATE", "0")),
+            tasa_lentas=float(os.getenv("AR_FAKE_SLOW_RATE", "0")),
+            semilla=int(semilla) if semilla else None,
+            **kwargs
+        )
+
+    # ==========================================================
+    # 🔌 API DEL CLIENTE
+    # ==========================================================
+    def table(self, nombre: str) -> _Consulta:
+        return _Consulta(self, nombre)
+
+    def from_(self, nombre: str) -> _Consulta:
+        return self.table(nombre)
+
+    def rpc(self, nombre: str, params: Optional[Dict[str, Any]] = None) -> _RPC:
+        return _RPC(self, nombre, params or {})
+
+    @property
+    def storage(self) -> _Storage:
+        return _Storage(self)
+
+    # ==========================================================
+    # ⏱️ LATENCIA Y FALLOS
+    # ==========================================================
+    def _ejecutar(self, op: str, destino: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            espera = self.latencias.get(op, self.latencia) + self._azar.uniform(0, self.jitter)
+            lenta = self._azar.random() < self.tasa_lentas
+            falla = self._azar.random() < self.fallos.get(op, self.tasa_fallos)
+            if lenta:
+                espera *= self.factor_lentas
+            self._stats["llamadas"] += 1
+            self._stats["espera_total_s"] += espera
+            self._stats["lentas"] += int(lenta)
+            self._stats["fallos_inyectados"] += int(falla)
+            por_op = self._stats["por_operacion"].setdefault(op, {"llamadas": 0, "fallos": 0})
+            por_op["llamadas"] += 1
+            por_op["fallos"] += int(falla)
+        if espera > 0:
+            time.sleep(espera)
+        if falla:
+            raise FalloSimulado(f"Fallo de red simulado en {op} {destino}")
+        return fn()
+
+    # ==========================================================
+    # 🗄️ ALMACENAMIENTO
+    # ==========================================================
+    def _filas(self, tabla: str) -> List[Dict[str, Any]]:
+        vista = self.vistas.get(tabla)
+        if vista is not None:
+            return vista(self)
+        return self.tablas.setdefault(tabla, [])
+
+    def _claves(self, tabla: str) -> List[tuple]:
+        return [self.primarias.get(tabla, ("id",))] + list(self.unicas.get(tabla, []))
+
+    def _buscar_por(self, tabla: str, clave: tuple, fila: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if any(fila.get(c) is None for c in clave):
+            return None
+        for existente in self.tablas.get(tabla, []):
+            if all(_igual(existente.get(c), fila.get(c)) for c in clave):
+                return existente
+        return None
+
+    def _escribir(self, tabla: str, fila: Dict[str, Any], upsert: bool, on_conflict: Optional[tuple]) -> Dict[str, Any]:
+        with self._lock:
+            claves = self._claves(tabla)
+            if upsert:
+                destino = on_conflict or claves[0]
+                if destino not in claves and destino != ("id",):
+                    raise ErrorPostgrest("there is no unique or exclusion constraint matching the "
+                                         "ON CONFLICT specification", "42P10")
+                existente = self._buscar_por(tabla, destino, fila)
+                if existente is not None:
+                    nueva = {**existente, **fila}
+                    self._reemplazar_fila(tabla, existente, nueva)
+                    return nueva
+            for clave in claves:
+                if self._buscar_por(tabla, clave, fila) is not None:
+                    raise ErrorPostgrest(f"duplicate key value violates unique constraint ({', '.join(clave)})",
+                                         "23505", 409)
+            if "id" not in fila:
+                self._ids[tabla] = self._ids.get(tabla, 0) + 1
+                fila["id"] = self._ids[tabla]
+            self.tablas.setdefault(tabla, []).append(fila)
+        self._publicar(tabla, "INSERT", fila, None)
+        return fila
+
+    def _reemplazar_fila(self, tabla: str, anterior: Dict[str, Any], nueva: Dict[str, Any]):
+        with self._lock:
+            filas = self.tablas[tabla]
+            filas[filas.index(anterior)] = nueva
+        self._publicar(tabla, "UPDATE", nueva, anterior)
+
+    def _actualizar(self, tabla: str, coincide: Callable[[Dict[str, Any]], bool],
+                    valores: Any) -> List[Dict[str, Any]]:
+        """`valores` puede ser un dict o una función fila -> dict de cambios."""
+        cambiadas = []
+        with self._lock:
+            for fila in [f for f in self.tablas.get(tabla, []) if coincide(f)]:
+                cambios = valores(fila) if callable(valores) else valores
+                nueva = {**fila, **cambios}
+                self._reemplazar_fila(tabla, fila, nueva)
+                cambiadas.append(nueva)
+        return cambiadas
+
+    def _borrar(self, tabla: str, coincide: Callable[[Dict[str, Any]], bool]) -> List[Dict[str, Any]]:
+        with self._lock:
+            filas = self.tablas.get(tabla, [])
+            borradas = [f for f in filas if coincide(f)]
+            self.tablas[tabla] = [f for f in filas if not coincide(f)]
+        for fila in borradas:
+            self._publicar(tabla, "DELETE", None, fila)
+        return borradas
+
+    def _publicar(self, tabla: str, tipo: str, nuevo: Optional[Dict[str, Any]], anterior: Optional[Dict[str, Any]]):
+        if self.feed is not None:
+            self.feed.publicar(tabla, tipo, deepcopy(nuevo), deepcopy(anterior))
+
+    # ==========================================================
+    # 📊 MÉTRICAS
+    # ==========================================================
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**deepcopy(self._stats), "espera_total_s": round(self._stats["espera_total_s"], 3),
+                    "filas": {t: len(f) for t, f in self.tablas.items()},
+                    "objetos": {b: len(o) for b, o in self.buckets.items()}}
@@ -0,0 +1,166 @@
+# archeon_hashing.py - Hash de contraseñas en pool con registro versionado
+import os
+import hmac
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+ALGORITMO = "pbkdf2_sha256"
+
+# Iteraciones PBKDF2 según la potencia del dispositivo
+PERFILES = {
+    "movil": 150_000,
+    "estandar": 300_000,
+    "alto": 600_000,
+}
+
+# Los registros antiguos guardaban sólo el hash (hex) con la sal en otra columna
+ITERACIONES_LEGADO = 300_000
+
+
+class ColaHashLlena(RuntimeError):
+    """Hay demasiados hashes pendientes; el llamador debe reintentar más tarde."""
+
+
+def formatear_registro(iteraciones: int, salt: bytes, hashed: bytes) -> str:
+    return f"{ALGORITMO}${iteraciones}${salt.hex()}${hashed.hex()}"
+
+
+def parsear_registro(registro: str, salt_legado: Optional[str] = None) -> Tuple[int, bytes, str]:
+    """
+    Devuelve (iteraciones, salt, hash_hex). Acepta el formato versionado
+    `pbkdf2_sha256$iter$salt$hash` y el antiguo (hash hex + columna salt).
+    """
+    partes = (registro or "").split("$")
+    if len(partes) == 4 and partes[0] == ALGORITMO:
+        return int(partes[1]), bytes.fromhex(partes[2]), partes[3]
+    if salt_legado:
+        return ITERACIONES_LEGADO, bytes.fromhex(salt_legado), registro
+    raise ValueError("Registro de contraseña no reconocido")
+
+
+class PasswordHasher:
+    """
+    PBKDF2-HMAC-SHA256 ejecutado en un pool de hilos (hashlib libera el GIL).
+
+    - La cola es acotada: como mucho `max_cola` hashes en curso o esperando;
+      por encima se espera `espera_cola` segundos y luego se lanza ColaHashLlena.
+    - `verificar` indica si el registro usa menos iteraciones que las actuales,
+      para que el llamador lo regenere tras un login correcto (el formato,
+      antiguo o versionado, no cuenta por sí solo).
+    """
+
+    def __init__(self, iteraciones: Optional[int] = None, perfil: Optional[str] = None,
+                 workers: int = 2, max_cola: int = 8, espera_cola: float = 10.0):
+        if iteraciones is None:
+            iteraciones = PERFILES.get(perfil or "estandar", PERFILES["estandar"])
+        self.iteraciones = int(iteraciones)
+        self.workers = max(1, int(workers))
+        self.max_cola = max(self.workers, int(max_cola))
+        self.espera_cola = espera_cola
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._hueco = threading.BoundedSemaphore(self.max_cola)
+        self._lock = threading.Lock()
+        self._stats = {"hashes": 0, "verificaciones": 0, "actualizables": 0,
+                       "rechazados": 0, "tiempo_total_ms": 0.0}
+
+    # ==========================================================
+    # 🔐 OPERACIONES SÍNCRONAS (se ejecutan en el pool)
+    # ==========================================================
+    def hash(self, password: str) -> str:
+        return self.hash_async(password).result()
+
+    def hash_legado(self, password: str) -> Tuple[str, str]:
+        """(hash_hex, salt_hex) en el formato antiguo, con ITERACIONES_LEGADO."""
+        return self._enviar(self._hash_legado, password).result()
+
+    def verificar(self, password: str, registro: str, salt_legado: Optional[str] = None) -> Tuple[bool, bool]:
+        """Devuelve (correcta, necesita_actualizar)."""
+        return self.verificar_async(password, registro, salt_legado).result()
+
+    def necesita_actualizar(self, registro: str, salt_legado: Optional[str] = None) -> bool:
+        """Sólo si el registro usa menos iteraciones: un perfil más ligero nunca rebaja uno existente."""
+        try:
+            iteraciones, _, _ = parsear_registro(registro, salt_legado)
+        except ValueError:
+            return False
+        return iteraciones < self.iteraciones
+
+    # ==========================================================
+    # ⚡ API ASÍNCRONA
+    # ==========================================================
+    def hash_async(self, password: str) -> Future:
+        return self._enviar(self._hash, password)
+
+    def verificar_async(self, password: str, registro: str, salt_legado: Optional[str] = None) -> Future:
+        return self._enviar(self._verificar, password, registro, salt_legado)
+
+    def _enviar(self, fn, *args) -> Future:
+        if not self._hueco.acquire(timeout=self.espera_cola):
+            with self._lock:
+                self._stats["rechazados"] += 1
+            raise ColaHashLlena(f"Más de {self.max_cola} hashes pendientes")
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hasher")
+        futuro = self._pool.submit(fn, *args)
+        futuro.add_done_callback(lambda _f: self._hueco.release())
+        return futuro
+
+    def _pbkdf2(self, password: str, salt: bytes, iteraciones: int) -> bytes:
+        inicio = time.perf_counter()
+        hashed = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iteraciones)
+        with self._lock:
+            self._stats["tiempo_total_ms"] += (time.perf_counter() - inicio) * 1000
+        return hashed
+
+    def _hash(self, password: str) -> str:
+        salt = os.urandom(16)
+        registro = formatear_registro(self.iteraciones, salt, self._pbkdf2(password, salt, self.iteraciones))
+        with self._lock:
+            self._stats["hashes"] += 1
+        return registro
+
+    def _hash_legado(self, password: str) -> Tuple[str, str]:
+        salt = os.urandom(16)
+        hashed = self._pbkdf2(password, salt, ITERACIONES_LEGADO)
+        with self._lock:
+            self._stats["hashes"] += 1
+        return hashed.hex(), salt.hex()
+
+    def _verificar(self, password: str, registro: str, salt_legado: Optional[str]) -> Tuple[bool, bool]:
+        try:
+            iteraciones, salt, esperado = parsear_registro(registro, salt_legado)
+        except ValueError:
+            return False, False
+        calculado = self._pbkdf2(password, salt, iteraciones).hex()
+        correcta = hmac.compare_digest(calculado, esperado)
+        actualizar = correcta and self.necesita_actualizar(registro, salt_legado)
+        with self._lock:
+            self._stats["verificaciones"] += 1
+            if actualizar:
+                self._stats["actualizables"] += 1
+        return correcta, actualizar
+
+    # ==========================================================
+    # 📊 MÉTRICAS
+    # ==========================================================
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            operaciones = self._stats["hashes"] + self._stats["verificaciones"]
+            return {
+                "algoritmo": ALGORITMO,
+                "iteraciones": self.iteraciones,
+                "workers": self.workers,
+                "max_cola": self.max_cola,
+                **self._stats,
+                "tiempo_total_ms": round(self._stats["tiempo_total_ms"], 1),
+                "ms_por_hash": round(self._stats["tiempo_total_ms"] / operaciones, 1) if operaciones else 0.0,
+            }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
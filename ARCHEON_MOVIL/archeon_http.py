@@ -0,0 +1,248 @@
+# archeon_http.py - Cliente HTTP compartido (keep-alive, timeouts, reintentos) para los proveedores de IA
+import os
+import time
+import random
+import threading
+import importlib.util
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+# HTTP/2 sólo si están httpx y h2 (multiplexa varias peticiones en una conexión)
+HTTP2_AVAILABLE = importlib.util.find_spec("httpx") is not None and importlib.util.find_spec("h2") is not None
+
+# Hosts de los proveedores que se precalientan al abrir el dashboard
+HOSTS_IA = ("https://generativelanguage.googleapis.com", "https://openrouter.ai")
+
+
+class ClienteHTTP:
+    """
+    Un único pool de conexiones para todas las llamadas salientes a los LLM.
+
+    - Keep-alive: DNS + TCP + TLS se pagan una vez por host, no por mensaje.
+    - HTTP/2 con httpx si está instalado; si no, requests.Session con pool.
+    - Timeouts separados de conexión y de lectura (la respuesta de un LLM
+      puede tardar, pero conectar no debería).
+    - Reintentos con backoff y jitter sólo cuando la petición no llegó a
+      procesarse: fallo al conectar, conexión reutilizada que el servidor ya
+      había cerrado, o 429/5xx (respetando Retry-After).
+    - Proxy: AR_HTTP_PROXY o las variables HTTP(S)_PROXY habituales.
+    """
+
+    REINTENTABLES = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout_conexion: float = 5.0, timeout_lectura: float = 60.0,
+                 reintentos: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_conexiones: int = 10, proxy: Optional[str] = None, http2: Optional[bool] = None):
+        self.timeout_conexion = timeout_conexion
+        self.timeout_lectura = timeout_lectura
+        self.reintentos = max(0, int(reintentos))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_conexiones = max_conexiones
+        self.proxy = proxy
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        self._cliente = None
+        self._adaptador = None
+        self._streams_vistos: Dict[int, None] = {}
+        self._lock = threading.Lock()
+        self._stats = {"peticiones": 0, "reintentos": 0, "errores": 0, "precalentadas": 0,
+                       "conexiones": 0, "latencia_total_ms": 0.0}
+
+    @classmethod
+    def desde_entorno(cls) -> "ClienteHTTP":
+        http2 = os.getenv("AR_HTTP2")
+        return cls(
+            timeout_conexion=float(os.getenv("AR_HTTP_CONNECT_TIMEOUT", "5")),
+            timeout_lectura=float(os.getenv("AR_HTTP_READ_TIMEOUT", "60")),
+            reintentos=int(os.getenv("AR_HTTP_RETRIES", "2")),
+            max_conexiones=int(os.getenv("AR_HTTP_POOL", "10")),
+            proxy=os.getenv("AR_HTTP_PROXY") or None,
+            http2=None if http2 is None else http2 == "1",
+        )
+
+    # ==========================================================
+    # 🔌 CLIENTE SUBYACENTE (se crea en la primera petición)
+    # ==========================================================
+    def _obtener(self):
+        with self._lock:
+            if self._cliente is not None:
+                return self._cliente
+            if self.http2:
+                import httpx
+                self._cliente = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(self.timeout_lectura, connect=self.timeout_conexion),
+                    limits=httpx.Limits(max_connections=self.max_conexiones,
+                                        max_keepalive_connections=self.max_conexiones),
+                    proxy=self.proxy,
+                )
+            elif REQUESTS_AVAILABLE:
+                sesion = requests.Session()
+                # Reintentos propios (abajo): el adaptador no reintenta por su cuenta
+                self._adaptador = HTTPAdapter(pool_connections=len(HOSTS_IA) + 2,
+                                              pool_maxsize=self.max_conexiones, max_retries=0)
+                sesion.mount("https://", self._adaptador)
+                sesion.mount("http://", self._adaptador)
+                if self.proxy:
+                    sesion.proxies = {"http": self.proxy, "https": self.proxy}
+                self._cliente = sesion
+            else:
+                raise RuntimeError("Ni httpx ni requests están instalados")
+            return self._cliente
+
+    def _timeout(self, timeout: Optional[float]):
+        lectura = self.timeout_lectura if timeout is None else timeout
+        if self.http2:
+            import httpx
+            return httpx.Timeout(lectura, connect=self.timeout_conexion)
+        return (self.timeout_conexion, lectura)
+
+    def _errores_reintentables(self) -> tuple:
+        if self.http2:
+            import httpx
+            return (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+        # ConnectionError incluye ConnectTimeout y la conexión cerrada por el servidor;
+        # un ReadTimeout no: el modelo pudo haber empezado a responder
+        return (requests.ConnectionError,)
+
+    def _contar_conexiones(self, respuesta: Any):
+        """Cuántas conexiones distintas se han abierto hasta ahora (para el % de reutilización)."""
+        try:
+            if self.http2:
+                stream = respuesta.extensions.get("network_stream")
+                if stream is not None and id(stream) not in self._streams_vistos:
+                    self._streams_vistos[id(stream)] = None
+                    if len(self._streams_vistos) > 256:
+                        self._streams_vistos.pop(next(iter(self._streams_vistos)))
+                    self._stats["conexiones"] += 1
+            else:
+                pools = self._adaptador.poolmanager.pools
+                self._stats["conexiones"] = max(
+                    self._stats["conexiones"],
+                    sum(getattr(pools.get(clave), "num_connections", 0) for clave in pools.keys()),
+                )
+        except Exception:
+            pass
+
+    # ==========================================================
+    # 📡 PETICIONES
+    # ==========================================================
+    def _espera(self, intento: int, respuesta: Any = None) -> float:
+        retry_after = respuesta.headers.get("Retry-After") if respuesta is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(self.backoff_max, float(retry_after))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+
+    def request(self, metodo: str, url: str, timeout: Optional[float] = None, stream: bool = False,
+                **kwargs) -> Any:
+        """
+        Como requests.request: devuelve la respuesta (con .status_code, .json(), .text).
+        Con `stream` vuelve en cuanto llegan las cabeceras y el cuerpo se lee
+        con iter_lines(); hay que cerrarla al terminar.
+        """
+        cliente = self._obtener()
+        intentos = 1 + self.reintentos
+        inicio = time.perf_counter()
+        for intento in range(intentos):
+            ultimo = intento + 1 >= intentos
+            try:
+                if self.http2 and stream:
+                    peticion = cliente.build_request(metodo, url, timeout=self._timeout(timeout), **kwargs)
+                    respuesta = cliente.send(peticion, stream=True)
+                elif self.http2:
+                    respuesta = cliente.request(metodo, url, timeout=self._timeout(timeout), **kwargs)
+                else:
+                    respuesta = cliente.request(metodo, url, timeout=self._timeout(timeout),
+                                                stream=stream, **kwargs)
+            except self._errores_reintentables():
+                if ultimo:
+                    with self._lock:
+                        self._stats["errores"] += 1
+                    raise
+                with self._lock:
+                    self._stats["reintentos"] += 1
+                time.sleep(self._espera(intento))
+                continue
+            except Exception:
+                with self._lock:
+                    self._stats["errores"] += 1
+                raise
+
+            if respuesta.status_code in self.REINTENTABLES and not ultimo:
+                espera = self._espera(intento, respuesta)
+                respuesta.close()
+                with self._lock:
+                    self._stats["reintentos"] += 1
+                time.sleep(espera)
+                continue
+
+            with self._lock:
+                self._stats["peticiones"] += 1
+                self._stats["latencia_total_ms"] += (time.perf_counter() - inicio) * 1000
+                self._contar_conexiones(respuesta)
+            return respuesta
+
+    def post(self, url: str, **kwargs) -> Any:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> Any:
+        return self.request("GET", url, **kwargs)
+
+    def eventos_sse(self, url: str, timeout: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """POST con respuesta text/event-stream: devuelve el contenido de cada evento `data:`."""
+        respuesta = self.request("POST", url, timeout=timeout, stream=True, **kwargs)
+        try:
+            respuesta.raise_for_status()
+            # Se decodifica por línea: SSE no siempre declara charset
+            lineas = respuesta.iter_lines() if self.http2 else respuesta.iter_lines(chunk_size=None)
+            datos = []
+            for linea in lineas:
+                if isinstance(linea, bytes):
+                    linea = linea.decode("utf-8", "replace")
+                if not linea:
+                    if datos:
+                        yield "\n".join(datos)
+                        datos = []
+                elif linea.startswith("data:"):
+                    datos.append(linea[5:].lstrip())
+            if datos:
+                yield "\n".join(datos)
+        finally:
+            respuesta.close()
+
+    def precalentar(self, hosts: Iterable[str] = HOSTS_IA):
+        """Abre (DNS + TCP + TLS) una conexión por host para que el primer mensaje no la pague."""
+        for host in hosts:
+            try:
+                respuesta = self._obtener().request("HEAD", host, timeout=self._timeout(self.timeout_conexion))
+                respuesta.close()
+                with self._lock:
+                    self._stats["precalentadas"] += 1
+                    self._contar_conexiones(respuesta)
+            except Exception as e:
+                print(f"!! [HTTP] No se pudo precalentar {host}: {e}")
+
+    def cerrar(self):
+        with self._lock:
+            cliente, self._cliente = self._cliente, None
+        if cliente is not None:
+            try:
+                cliente.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        usadas = s["peticiones"] + s["precalentadas"]
+        s["reutilizacion"] = round(1 - s["conexiones"] / usadas, 3) if usadas else 0.0
+        total_ms = s.pop("latencia_total_ms")
+        s["latencia_media_ms"] = round(total_ms / s["peticiones"], 1) if s["peticiones"] else 0.0
+        s["backend"] = "httpx-h2" if self.http2 else "requests"
+        return s
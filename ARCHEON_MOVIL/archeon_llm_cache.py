@@ -0,0 +1,161 @@
+# archeon_llm_cache.py - Caché en disco (SQLite) de respuestas de la IA
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from archeon_skills import normalizar
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS respuestas (
+    clave TEXT PRIMARY KEY,
+    texto TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    ultimo_uso REAL NOT NULL,
+    aciertos INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_respuestas_uso ON respuestas(ultimo_uso);
+"""
+
+# Palabras (normalizadas) que hacen la pregunta personal o dependiente del
+# momento: su respuesta no se reutiliza
+VOLATILES = {
+    "hora", "horas", "fecha", "hoy", "ayer", "manana", "ahora", "clima", "temperatura",
+    "noticias", "precio", "cotizacion", "actual", "actualmente", "ultimo", "ultima", "ultimas",
+    "reciente", "semana", "mes", "dia",
+}
+PERSONALES = {
+    "mi", "mis", "me", "yo", "mio", "mia", "conmigo", "recuerdas", "recuerda", "dije",
+    "contrasena", "password", "correo", "email", "telefono", "direccion",
+}
+
+
+class CacheRespuestas:
+    """
+    Respuestas de la IA guardadas por (texto normalizado, modo, idioma,
+    hash de la ventana de historial).
+
+    - TTL por entrada y expulsión LRU (por `ultimo_uso`) cuando se pasan
+      `max_entradas` o `max_bytes`.
+    - `cacheable` descarta preguntas personales o volátiles (hora, clima,
+      "mis ..."); esas siempre van a la red.
+    """
+
+    def __init__(self, path: str = "archeon_llm_cache.db", ttl: float = 7 * 86400,
+                 max_entradas: int = 500, max_bytes: int = 2 * 1024 * 1024, historia: int = 4):
+        self.path = path
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.historia = historia
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.executescript(_ESQUEMA)
+        self._stats = {"consultas": 0, "aciertos": 0, "omitidas": 0, "guardadas": 0, "expulsadas": 0}
+
+    # ==========================================================
+    # 🔑 CLAVES
+    # ==========================================================
+    @staticmethod
+    def cacheable(texto: str) -> bool:
+        palabras = set(normalizar(texto).split())
+        return bool(palabras) and not (palabras & VOLATILES) and not (palabras & PERSONALES)
+
+    def clave(self, texto: str, modo: str = "", idioma: str = "",
+              historial: Optional[List[Any]] = None, extra: Any = None) -> str:
+        """sha256 del texto normalizado, modo, idioma, últimos `historia` mensajes y `extra`."""
+        ventana = list(historial or [])[-self.historia:] if self.historia else []
+        huella_historial = hashlib.sha256(
+            json.dumps(ventana, sort_keys=True, ensure_ascii=False, default=str).encode()
+        ).hexdigest()
+        partes = [normalizar(texto), modo or "", idioma or "", huella_historial, extra]
+        return hashlib.sha256(json.dumps(partes, ensure_ascii=False, default=str).encode()).hexdigest()
+
+    # ==========================================================
+    # 📦 LECTURA / ESCRITURA
+    # ==========================================================
+    def obtener(self, clave: str) -> Optional[str]:
+        ahora = time.time()
+        with self._lock:
+            self._stats["consultas"] += 1
+            try:
+                fila = self._conn.execute(
+                    "SELECT texto, creado FROM respuestas WHERE clave = ?", (clave,)
+                ).fetchone()
+                if fila is None:
+                    return None
+                if ahora - fila[1] > self.ttl:
+                    self._conn.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                    return None
+                self._conn.execute(
+                    "UPDATE respuestas SET ultimo_uso = ?, aciertos = aciertos + 1 WHERE clave = ?",
+                    (ahora, clave),
+                )
+                self._stats["aciertos"] += 1
+                return fila[0]
+            except sqlite3.DatabaseError as e:
+                print(f"!! [LLM-CACHE] Error leyendo: {e}")
+                return None
+
+    def guardar(self, clave: str, texto: str):
+        if not texto:
+            return
+        ahora = time.time()
+        tamano = len(texto.encode("utf-8"))
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO respuestas (clave, texto, bytes, creado, ultimo_uso) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (clave, texto, tamano, ahora, ahora),
+                )
+                self._stats["guardadas"] += 1
+                self._expulsar(ahora)
+            except sqlite3.DatabaseError as e:
+                print(f"!! [LLM-CACHE] Error guardando: {e}")
+
+    def omitida(self):
+        """Anota una pregunta que no pasó `cacheable` (para la tasa de aciertos)."""
+        with self._lock:
+            self._stats["omitidas"] += 1
+
+    def _expulsar(self, ahora: float):
+        """Quita lo caducado y, si aún sobra, lo menos usado recientemente."""
+        cur = self._conn.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - self.ttl,))
+        expulsadas = cur.rowcount
+        n, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()
+        if n > self.max_entradas or total > self.max_bytes:
+            sobran, claves = n - self.max_entradas, []
+            for clave, tamano in self._conn.execute("SELECT clave, bytes FROM respuestas ORDER BY ultimo_uso"):
+                if sobran <= 0 and total <= self.max_bytes:
+                    break
+                claves.append(clave)
+                sobran -= 1
+                total -= tamano
+            self._conn.executemany("DELETE FROM respuestas WHERE clave = ?", [(c,) for c in claves])
+            expulsadas += len(claves)
+        self._stats["expulsadas"] += expulsadas
+
+    def limpiar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM respuestas")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()
+            s = dict(self._stats)
+        s["hit_ratio"] = round(s["aciertos"] / s["consultas"], 3) if s["consultas"] else 0.0
+        return {"path": self.path, "entradas": n, "bytes": total, **s}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
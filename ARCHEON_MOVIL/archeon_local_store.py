@@ -0,0 +1,574 @@
+# archeon_local_store.py - Espejo SQLite local de las tablas del usuario (offline-first)
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    actualizado TEXT
+);
+CREATE TABLE IF NOT EXISTS memoria (
+    local_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    remote_id TEXT UNIQUE,
+    user_id TEXT NOT NULL,
+    categoria TEXT,
+    contenido TEXT,
+    importancia INTEGER DEFAULT 1,
+    fecha TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_memoria_user ON memoria(user_id, fecha);
+CREATE TABLE IF NOT EXISTS gustos (
+    user_id TEXT NOT NULL,
+    gusto TEXT NOT NULL,
+    activo INTEGER,
+    fecha TEXT,
+    PRIMARY KEY (user_id, gusto)
+);
+CREATE TABLE IF NOT EXISTS comandos (
+    user_id TEXT NOT NULL,
+    comando TEXT NOT NULL,
+    accion TEXT,
+    usos INTEGER DEFAULT 0,
+    fecha TEXT,
+    PRIMARY KEY (user_id, comando)
+);
+CREATE TABLE IF NOT EXISTS skills (
+    user_id TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    actions TEXT,
+    remote_id TEXT,
+    PRIMARY KEY (user_id, trigger)
+);
+CREATE TABLE IF NOT EXISTS chats_mensajes (
+    local_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    remote_id TEXT UNIQUE,
+    user_id TEXT NOT NULL,
+    contacto TEXT,
+    texto TEXT,
+    autor TEXT,
+    leido INTEGER DEFAULT 0,
+    fecha TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chats_user ON chats_mensajes(user_id, contacto, fecha);
+CREATE TABLE IF NOT EXISTS no_leidos (
+    user_id TEXT NOT NULL,
+    contacto TEXT NOT NULL,
+    n INTEGER DEFAULT 0,
+    PRIMARY KEY (user_id, contacto)
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabla TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER DEFAULT 0,
+    error TEXT,
+    creado REAL,
+    actualizado REAL
+);
+CREATE INDEX IF NOT EXISTS idx_journal_estado ON journal(estado, id);
+CREATE TABLE IF NOT EXISTS borrados (
+    email TEXT NOT NULL,
+    paso TEXT NOT NULL,
+    completado REAL,
+    duracion_ms REAL,
+    PRIMARY KEY (email, paso)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT NOT NULL,
+    tabla TEXT NOT NULL,
+    cursor TEXT,
+    sincronizado REAL,
+    PRIMARY KEY (user_id, tabla)
+);
+"""
+
+# Columnas que se guardan de cada tabla de filas (memoria / chats)
+_COLUMNAS = {
+    "memoria": ("user_id", "categoria", "contenido", "importancia", "fecha"),
+    "chats_mensajes": ("user_id", "contacto", "texto", "autor", "leido", "fecha"),
+}
+# Clave natural (junto a user_id) de las tablas sin id remoto en local
+_CLAVE_NATURAL = {"gustos": "gusto", "comandos": "comando"}
+# Columnas que identifican una fila local aún sin id remoto
+_CLAVE_CONTENIDO = {
+    "memoria": ("user_id", "fecha", "contenido"),
+    "chats_mensajes": ("user_id", "fecha", "texto"),
+}
+
+MAX_INTENTOS = 5
+
+
+class LocalStore:
+    """
+    Copia local (SQLite) de users.config, memoria, gustos, comandos, skills y
+    chats_mensajes, más un diario (journal) de las escrituras pendientes de
+    subir a Supabase. Todas las lecturas del CloudManager salen de aquí.
+    """
+
+    def __init__(self, path: str = "archeon_local.db"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.executescript(_ESQUEMA)
+
+    @contextmanager
+    def transaccion(self):
+        """Agrupa varias operaciones en una única transacción atómica."""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield self._conn
+                return
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _consultar(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ==========================================================
+    # 👤 USUARIOS Y ESTADO DE SINCRONIZACIÓN
+    # ==========================================================
+    def registrar_usuario(self, user_id: str, email: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO usuarios (user_id, email) VALUES (?, ?)", (user_id, email)
+            )
+
+    def usuarios(self) -> List[str]:
+        return [r["email"] for r in self._consultar("SELECT email FROM usuarios")]
+
+    def sincronizado(self, user_id: str, tabla: str) -> bool:
+        return bool(self._consultar(
+            "SELECT 1 FROM sync_state WHERE user_id = ? AND tabla = ?", (user_id, tabla)
+        ))
+
+    def cursor(self, user_id: str, tabla: str) -> Optional[str]:
+        filas = self._consultar(
+            "SELECT cursor FROM sync_state WHERE user_id = ? AND tabla = ?", (user_id, tabla)
+        )
+        return filas[0]["cursor"] if filas else None
+
+    def marcar_sync(self, user_id: str, tabla: str, cursor: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sync_state (user_id, tabla, cursor, sincronizado) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id, tabla) DO UPDATE SET "
+                "cursor = COALESCE(excluded.cursor, sync_state.cursor), sincronizado = excluded.sincronizado",
+                (user_id, tabla, cursor, time.time())
+            )
+
+    def olvidar_usuario(self, user_id: str):
+        """Borra todo rastro local del usuario (derecho al olvido)."""
+        with self.transaccion() as c:
+            for tabla in ("config", "memoria", "gustos", "comandos", "skills",
+                          "chats_mensajes", "no_leidos", "sync_state", "usuarios"):
+                c.execute(f"DELETE FROM {tabla} WHERE user_id = ?", (user_id,))
+        self.descartar_journal_usuario(user_id)
+
+    def descartar_journal_usuario(self, user_id: str) -> int:
+        """Quita del diario las escrituras del usuario (para que no se vuelvan a subir)."""
+        descartadas = []
+        for f in self._consultar("SELECT id, payload FROM journal"):
+            payload = json.loads(f["payload"])
+            duenio = payload.get("user_id") or (payload.get("fila") or {}).get("user_id")
+            if duenio == user_id:
+                descartadas.append((f["id"],))
+        with self._lock:
+            self._conn.executemany("DELETE FROM journal WHERE id = ?", descartadas)
+        return len(descartadas)
+
+    # ==========================================================
+    # ☠️ CHECKPOINT DE BORRADO DE CUENTAS
+    # ==========================================================
+    def iniciar_borrado(self, email: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO borrados (email, paso, completado) VALUES (?, '__inicio__', ?)",
+                (email, time.time())
+            )
+
+    def pasos_borrados(self, email: str) -> Dict[str, float]:
+        """Pasos ya terminados de un borrado en curso -> duración que tuvieron (ms)."""
+        return {f["paso"]: f["duracion_ms"] for f in self._consultar(
+            "SELECT paso, duracion_ms FROM borrados WHERE email = ? AND paso != '__inicio__'", (email,)
+        )}
+
+    def marcar_paso_borrado(self, email: str, paso: str, duracion_ms: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO borrados (email, paso, completado, duracion_ms) VALUES (?, ?, ?, ?)",
+                (email, paso, time.time(), duracion_ms)
+            )
+
+    def borrados_pendientes(self) -> List[str]:
+        return [f["email"] for f in self._consultar("SELECT DISTINCT email FROM borrados")]
+
+    def terminar_borrado(self, email: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM borrados WHERE email = ?", (email,))
+
+    # ==========================================================
+    # ⚙️ CONFIG
+    # ==========================================================
+    def config(self, user_id: str) -> Optional[Dict[str, Any]]:
+        filas = self._consultar("SELECT data FROM config WHERE user_id = ?", (user_id,))
+        if not filas:
+            return None
+        try:
+            return json.loads(filas[0]["data"])
+        except ValueError:
+            return {}
+
+    def guardar_config(self, user_id: str, config: Dict[str, Any], actualizado: Optional[str] = None,
+                       reemplazar: bool = False):
+        with self.transaccion() as c:
+            actual = {} if reemplazar else (self.config(user_id) or {})
+            c.execute(
+                "INSERT INTO config (user_id, data, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+                "actualizado = COALESCE(excluded.actualizado, config.actualizado)",
+                (user_id, json.dumps({**actual, **config}), actualizado)
+            )
+
+    # ==========================================================
+    # 🧠 MEMORIA Y 💬 CHATS (filas con id remoto)
+    # ==========================================================
+    def insertar_filas(self, tabla: str, filas: List[Dict[str, Any]]):
+        """
+        Inserta filas de memoria/chats. Las que vienen de la nube traen `id`:
+        si ya existe una copia local sin id remoto (escrita desde este equipo)
+        se le asigna el id en vez de duplicarla.
+        """
+        columnas = _COLUMNAS[tabla]
+        clave = _CLAVE_CONTENIDO[tabla]
+        with self.transaccion() as c:
+            for fila in filas:
+                valores = [fila.get(col) for col in columnas]
+                if "leido" in columnas:
+                    valores[columnas.index("leido")] = 1 if fila.get("leido") else 0
+                remote_id = fila.get("id")
+                if remote_id is not None:
+                    remote_id = str(remote_id)
+                    cur = c.execute(
+                        f"UPDATE {tabla} SET remote_id = ? WHERE remote_id IS NULL AND "
+                        + " AND ".join(f"{col} = ?" for col in clave),
+                        (remote_id, *[fila.get(col) for col in clave])
+                    )
+                    if cur.rowcount:
+                        continue
+                cur = c.execute(
+                    f"INSERT OR IGNORE INTO {tabla} (remote_id, {', '.join(columnas)}) "
+                    f"VALUES (?, {', '.join('?' for _ in columnas)})",
+                    (remote_id, *valores)
+                )
+                # Contador incremental de no leídos (sólo filas realmente nuevas)
+                if (cur.rowcount and tabla == "chats_mensajes"
+                        and fila.get("autor") != "yo" and not fila.get("leido")):
+                    c.execute(
+                        "INSERT INTO no_leidos (user_id, contacto, n) VALUES (?, ?, 1) "
+                        "ON CONFLICT(user_id, contacto) DO UPDATE SET n = n + 1",
+                        (fila.get("user_id"), fila.get("contacto"))
+                    )
+
+    def recuerdos(self, user_id: str, min_importancia: int = 1, limit: int = 10) -> List[Dict[str, Any]]:
+        filas = self._consultar(
+            "SELECT remote_id AS id, user_id, categoria, contenido, importancia, fecha FROM memoria "
+            "WHERE user_id = ? AND importancia >= ? ORDER BY fecha DESC LIMIT ?",
+            (user_id, min_importancia, limit)
+        )
+        return [dict(f) for f in filas]
+
+    def chat(self, user_id: str, contacto: str, limit: int = 50) -> List[Dict[str, Any]]:
+        filas = self._consultar(
+            "SELECT remote_id AS id, user_id, contacto, texto, autor, leido, fecha FROM chats_mensajes "
+            "WHERE user_id = ? AND contacto = ? ORDER BY fecha DESC LIMIT ?",
+            (user_id, contacto, limit)
+        )
+        mensajes = [{**dict(f), "leido": bool(f["leido"])} for f in filas]
+        mensajes.reverse()
+        return mensajes
+
+    def pagina(self, tabla: str, user_id: str, antes: Optional[tuple] = None, limite: int = 50,
+               contacto: Optional[str] = None, min_importancia: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Página keyset de memoria/chats, de la más nueva a la más antigua, sobre
+        (fecha, local_id). `antes` es el (fecha, local_id) de la última fila de la
+        página anterior: nunca se usa OFFSET.
+        """
+        sql = (f"SELECT local_id, remote_id AS id, {', '.join(_COLUMNAS[tabla])} "
+               f"FROM {tabla} WHERE user_id = ?")
+        params: List[Any] = [user_id]
+        if contacto is not None:
+            sql += " AND contacto = ?"
+            params.append(contacto)
+        if min_importancia is not None:
+            sql += " AND importancia >= ?"
+            params.append(min_importancia)
+        if antes:
+            sql += " AND (fecha < ? OR (fecha = ? AND local_id < ?))"
+            params.extend([antes[0], antes[0], antes[1]])
+        sql += " ORDER BY fecha DESC, local_id DESC LIMIT ?"
+        params.append(limite)
+        filas = [dict(f) for f in self._consultar(sql, tuple(params))]
+        if tabla == "chats_mensajes":
+            for f in filas:
+                f["leido"] = bool(f["leido"])
+        return filas
+
+    def contactos_sin_leer(self, user_id: str) -> List[str]:
+        return list(self.no_leidos(user_id))
+
+    def no_leidos(self, user_id: str) -> Dict[str, int]:
+        """{contacto: mensajes sin leer} desde la tabla de contadores."""
+        filas = self._consultar(
+            "SELECT contacto, n FROM no_leidos WHERE user_id = ? AND n > 0", (user_id,)
+        )
+        return {f["contacto"]: f["n"] for f in filas}
+
+    def reemplazar_no_leidos(self, user_id: str, conteos: Dict[str, int]):
+        """Sustituye los contadores por los del servidor (reconciliación)."""
+        with self.transaccion() as c:
+            c.execute("DELETE FROM no_leidos WHERE user_id = ?", (user_id,))
+            c.executemany(
+                "INSERT INTO no_leidos (user_id, contacto, n) VALUES (?, ?, ?)",
+                [(user_id, contacto, n) for contacto, n in conteos.items() if n]
+            )
+
+    def recontar_no_leidos(self, user_id: str) -> Dict[str, int]:
+        """Recalcula los contadores desde los mensajes locales."""
+        filas = self._consultar(
+            "SELECT contacto, COUNT(*) AS n FROM chats_mensajes "
+            "WHERE user_id = ? AND autor != 'yo' AND leido = 0 GROUP BY contacto",
+            (user_id,)
+        )
+        conteos = {f["contacto"]: f["n"] for f in filas}
+        self.reemplazar_no_leidos(user_id, conteos)
+        return conteos
+
+    def marcar_leidos(self, user_id: str, contactos: Optional[List[str]] = None):
+        """Marca como leídas las conversaciones indicadas (todas si es None)."""
+        filtro, params = "", [user_id]
+        if contactos is not None:
+            filtro = f" AND contacto IN ({', '.join('?' for _ in contactos)})"
+            params.extend(contactos)
+        with self.transaccion() as c:
+            c.execute(f"UPDATE chats_mensajes SET leido = 1 WHERE user_id = ? AND leido = 0{filtro}", params)
+            c.execute(f"DELETE FROM no_leidos WHERE user_id = ?{filtro}", params)
+
+    # ==========================================================
+    # ❤️ GUSTOS Y COMANDOS
+    # ==========================================================
+    def upsert_gustos(self, filas: List[Dict[str, Any]]):
+        """Gana la versión con la fecha más reciente (local o remota)."""
+        with self.transaccion() as c:
+            for fila in filas:
+                c.execute(
+                    "INSERT INTO gustos (user_id, gusto, activo, fecha) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id, gusto) DO UPDATE SET activo = excluded.activo, fecha = excluded.fecha "
+                    "WHERE gustos.fecha IS NULL OR excluded.fecha >= gustos.fecha",
+                    (fila["user_id"], fila["gusto"], 1 if fila.get("activo") else 0, fila.get("fecha"))
+                )
+
+    def gustos(self, user_id: str) -> Dict[str, bool]:
+        filas = self._consultar("SELECT gusto, activo FROM gustos WHERE user_id = ?", (user_id,))
+        return {f["gusto"]: bool(f["activo"]) for f in filas}
+
+    def upsert_comandos(self, filas: List[Dict[str, Any]], incrementar: bool = False):
+        """incrementar=True suma un uso (escritura local); si no, se copia `usos` remoto."""
+        with self.transaccion() as c:
+            for fila in filas:
+                if incrementar:
+                    c.execute(
+                        "INSERT INTO comandos (user_id, comando, accion, usos, fecha) VALUES (?, ?, ?, 1, ?) "
+                        "ON CONFLICT(user_id, comando) DO UPDATE SET accion = excluded.accion, "
+                        "usos = comandos.usos + 1, fecha = excluded.fecha",
+                        (fila["user_id"], fila["comando"], fila.get("accion"), fila.get("fecha"))
+                    )
+                else:
+                    c.execute(
+                        "INSERT INTO comandos (user_id, comando, accion, usos, fecha) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT(user_id, comando) DO UPDATE SET accion = excluded.accion, "
+                        "usos = excluded.usos, fecha = excluded.fecha "
+                        "WHERE comandos.fecha IS NULL OR excluded.fecha >= comandos.fecha",
+                        (fila["user_id"], fila["comando"], fila.get("accion"), fila.get("usos", 0), fila.get("fecha"))
+                    )
+
+    def borrar_por_clave(self, tabla: str, user_id: str, valor: str):
+        """Borrado llegado de otro equipo (gustos/comandos) por su clave natural."""
+        columna = _CLAVE_NATURAL[tabla]
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {tabla} WHERE user_id = ? AND {columna} = ?", (user_id, valor))
+
+    def comandos(self, user_id: str) -> Dict[str, str]:
+        filas = self._consultar("SELECT comando, accion FROM comandos WHERE user_id = ?", (user_id,))
+        return {f["comando"]: f["accion"] for f in filas}
+
+    # ==========================================================
+    # ⚡ SKILLS
+    # ==========================================================
+    def upsert_skill(self, user_id: str, trigger: str, actions: Any, remote_id: Any = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO skills (user_id, trigger, actions, remote_id) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id, trigger) DO UPDATE SET actions = excluded.actions, "
+                "remote_id = COALESCE(excluded.remote_id, skills.remote_id)",
+                (user_id, trigger, json.dumps(actions), None if remote_id is None else str(remote_id))
+            )
+
+    def reemplazar_skills(self, user_id: str, filas: List[Dict[str, Any]]):
+        """Copia completa de la nube; conserva las skills locales aún sin subir."""
+        with self.transaccion() as c:
+            c.execute("DELETE FROM skills WHERE user_id = ? AND remote_id IS NOT NULL", (user_id,))
+            for fila in filas:
+                self.upsert_skill(user_id, fila.get("trigger"), fila.get("actions"), fila.get("id"))
+
+    def borrar_skill(self, remote_id: Any):
+        with self._lock:
+            self._conn.execute("DELETE FROM skills WHERE remote_id = ?", (str(remote_id),))
+
+    def skills(self, user_id: str) -> List[Dict[str, Any]]:
+        filas = self._consultar(
+            "SELECT remote_id, trigger, actions FROM skills WHERE user_id = ? ORDER BY trigger", (user_id,)
+        )
+        resultado = []
+        for f in filas:
+            try:
+                actions = json.loads(f["actions"]) if f["actions"] else []
+            except ValueError:
+                actions = []
+            if isinstance(actions, str):
+                try: actions = json.loads(actions)
+                except ValueError: actions = []
+            remote_id = f["remote_id"]
+            resultado.append({
+                "id": int(remote_id) if remote_id and remote_id.isdigit() else remote_id,
+                "trigger": f["trigger"],
+                "actions": actions
+            })
+        return resultado
+
+    # ==========================================================
+    # 📒 DIARIO DE ESCRITURAS (JOURNAL)
+    # ==========================================================
+    def encolar(self, tabla: str, tipo: str, payload: Dict[str, Any]) -> int:
+        """Registra una escritura pendiente de subir. tipo: 'lote' o 'tarea'."""
+        ahora = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO journal (tabla, tipo, payload, estado, creado, actualizado) "
+                "VALUES (?, ?, ?, 'pendiente', ?, ?)",
+                (tabla, tipo, json.dumps(payload), ahora, ahora)
+            )
+            return cur.lastrowid
+
+    def tomar(self, jid: int) -> bool:
+        """Marca la entrada como 'enviando' si nadie la ha tomado ya."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE journal SET estado = 'enviando', actualizado = ? WHERE id = ? AND estado = 'pendiente'",
+                (time.time(), jid)
+            )
+            return cur.rowcount == 1
+
+    def actualizar_payload(self, jid: int, payload: Dict[str, Any]) -> bool:
+        """Reescribe una entrada que aún nadie ha tomado (para coalescer escrituras)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE journal SET payload = ?, actualizado = ? WHERE id = ? AND estado = 'pendiente'",
+                (json.dumps(payload), time.time(), jid)
+            )
+            return cur.rowcount == 1
+
+    def confirmar(self, jid: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM journal WHERE id = ?", (jid,))
+
+    def liberar(self, jid: int, error: Optional[str] = None, contar: bool = True):
+        """
+        Devuelve la entrada a 'pendiente' (o 'fallido' tras MAX_INTENTOS).
+        Con contar=False (la nube estaba caída) no gasta un intento.
+        """
+        with self._lock:
+            if not contar:
+                self._conn.execute(
+                    "UPDATE journal SET estado = 'pendiente', error = ?, actualizado = ? WHERE id = ?",
+                    (error, time.time(), jid)
+                )
+                return
+            self._conn.execute(
+                "UPDATE journal SET intentos = intentos + 1, error = ?, actualizado = ?, "
+                "estado = CASE WHEN intentos + 1 >= ? THEN 'fallido' ELSE 'pendiente' END WHERE id = ?",
+                (error, time.time(), MAX_INTENTOS, jid)
+            )
+
+    def confirmado(self, jid: int) -> bool:
+        return not self._consultar("SELECT 1 FROM journal WHERE id = ?", (jid,))
+
+    def pendientes(self, limite: int = 200, enviando_caducado: float = 300) -> List[Dict[str, Any]]:
+        """Entradas a reintentar: pendientes y 'enviando' que llevan demasiado tiempo así."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE journal SET estado = 'pendiente' WHERE estado = 'enviando' AND actualizado < ?",
+                (time.time() - enviando_caducado,)
+            )
+            filas = self._conn.execute(
+                "SELECT id, tabla, tipo, payload FROM journal WHERE estado = 'pendiente' ORDER BY id LIMIT ?",
+                (limite,)
+            ).fetchall()
+        return [{"id": f["id"], "tabla": f["tabla"], "tipo": f["tipo"], "payload": json.loads(f["payload"])}
+                for f in filas]
+
+    def parches_config_pendientes(self, user_id: str) -> Dict[str, Any]:
+        """Cambios de config aún no subidos (se reaplican sobre la copia remota)."""
+        parche: Dict[str, Any] = {}
+        for f in self._consultar("SELECT payload FROM journal WHERE tabla = 'config' ORDER BY id"):
+            payload = json.loads(f["payload"])
+            if payload.get("user_id") == user_id:
+                parche.update(payload.get("args", [None, {}])[1] or {})
+        return parche
+
+    def journal_tabla(self, user_id: str, tabla: str) -> List[Dict[str, Any]]:
+        """Entradas aún no subidas de `tabla` del usuario (filas y tareas), en orden."""
+        entradas = []
+        for f in self._consultar("SELECT tipo, payload FROM journal WHERE tabla = ? ORDER BY id", (tabla,)):
+            payload = json.loads(f["payload"])
+            dueno = payload.get("fila", {}).get("user_id") if f["tipo"] == "lote" else payload.get("user_id")
+            if dueno == user_id:
+                entradas.append({"tipo": f["tipo"], "payload": payload})
+        return entradas
+
+    def stats(self) -> Dict[str, Any]:
+        estados = {f["estado"]: f["n"] for f in self._consultar(
+            "SELECT estado, COUNT(*) AS n FROM journal GROUP BY estado"
+        )}
+        return {
+            "path": self.path,
+            "usuarios": self._consultar("SELECT COUNT(*) AS n FROM usuarios")[0]["n"],
+            "journal": estados,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,131 @@
+# archeon_metrics.py - Histogramas de latencia por (tabla, operación) y exportación
+import json
+import time
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Límites superiores (ms) de los buckets acumulados, como en Prometheus
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def tamano_respuesta(resultado: Any) -> int:
+    """Bytes aproximados de lo que devolvió Supabase (JSON de `data` o bytes crudos)."""
+    if isinstance(resultado, (bytes, bytearray)):
+        return len(resultado)
+    data = getattr(resultado, "data", resultado)
+    if data is None:
+        return 0
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Histograma:
+    """
+    Latencias de una clave: contadores acumulados por bucket (para exportar)
+    y las últimas `muestras` observaciones para percentiles exactos recientes.
+    """
+
+    def __init__(self, muestras: int = 1024):
+        self.n = 0
+        self.errores = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.recientes: deque = deque(maxlen=muestras)
+
+    def observar(self, ms: float, ok: bool, bytes_: int):
+        self.n += 1
+        self.errores += 0 if ok else 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.bytes += bytes_
+        self.recientes.append(ms)
+        for i, limite in enumerate(BUCKETS_MS):
+            if ms <= limite:
+                self.buckets[i] += 1
+
+    def resumen(self) -> Dict[str, Any]:
+        ordenadas = sorted(self.recientes)
+
+        def percentil(p: float) -> float:
+            if not ordenadas:
+                return 0.0
+            return round(ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))], 2)
+
+        return {
+            "n": self.n,
+            "errores": self.errores,
+            "p50_ms": percentil(50),
+            "p95_ms": percentil(95),
+            "p99_ms": percentil(99),
+            "max_ms": round(self.max_ms, 2),
+            "media_ms": round(self.total_ms / self.n, 2) if self.n else 0.0,
+            "total_ms": round(self.total_ms, 1),
+            "bytes": self.bytes,
+        }
+
+
+class RegistroMetricas:
+    """Un histograma por (tabla, operación). Seguro entre hilos."""
+
+    def __init__(self, muestras: int = 1024):
+        self.muestras = muestras
+        self.inicio = time.time()
+        self._histogramas: Dict[Tuple[str, str], Histograma] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, tabla: str, op: str, ms: float, ok: bool = True, bytes_: int = 0):
+        with self._lock:
+            histograma = self._histogramas.get((tabla, op))
+            if histograma is None:
+                histograma = self._histogramas[(tabla, op)] = Histograma(self.muestras)
+            histograma.observar(ms, ok, bytes_)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """{"tabla.op": resumen, ...} ordenado por tiempo total (lo que más pesa primero)."""
+        with self._lock:
+            resumenes = {f"{t}.{op}": h.resumen() for (t, op), h in self._histogramas.items()}
+        return dict(sorted(resumenes.items(), key=lambda kv: -kv[1]["total_ms"]))
+
+    def reiniciar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self.inicio = time.time()
+
+    # ==========================================================
+    # 📤 EXPORTACIÓN
+    # ==========================================================
+    def prometheus(self, extra: Optional[Dict[str, float]] = None, prefijo: str = "archeon") -> str:
+        """Formato de texto de Prometheus; `extra` añade gauges sueltos (cola, caché...)."""
+        lineas: List[str] = [
+            f"# HELP {prefijo}_supabase_latency_ms Latencia de las llamadas a Supabase",
+            f"# TYPE {prefijo}_supabase_latency_ms histogram",
+        ]
+        with self._lock:
+            items = sorted(self._histogramas.items())
+            for (tabla, op), h in items:
+                etiquetas = f'table="{tabla}",op="{op}"'
+                for limite, cuenta in zip(BUCKETS_MS, h.buckets):
+                    lineas.append(f'{prefijo}_supabase_latency_ms_bucket{{{etiquetas},le="{limite}"}} {cuenta}')
+                lineas.append(f'{prefijo}_supabase_latency_ms_bucket{{{etiquetas},le="+Inf"}} {h.n}')
+                lineas.append(f"{prefijo}_supabase_latency_ms_sum{{{etiquetas}}} {h.total_ms:.3f}")
+                lineas.append(f"{prefijo}_supabase_latency_ms_count{{{etiquetas}}} {h.n}")
+            lineas.append(f"# TYPE {prefijo}_supabase_errors_total counter")
+            for (tabla, op), h in items:
+                lineas.append(f'{prefijo}_supabase_errors_total{{table="{tabla}",op="{op}"}} {h.errores}')
+            lineas.append(f"# TYPE {prefijo}_supabase_response_bytes_total counter")
+            for (tabla, op), h in items:
+                lineas.append(f'{prefijo}_supabase_response_bytes_total{{table="{tabla}",op="{op}"}} {h.bytes}')
+        for nombre, valor in (extra or {}).items():
+            lineas.append(f"# TYPE {prefijo}_{nombre} gauge")
+            lineas.append(f"{prefijo}_{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    def jsonl(self, extra: Optional[Dict[str, Any]] = None) -> str:
+        """Una línea JSON con marca de tiempo (para ir añadiendo a un fichero)."""
+        return json.dumps({"ts": round(time.time(), 3), "supabase": self.snapshot(), **(extra or {})},
+                          default=str) + "\n"
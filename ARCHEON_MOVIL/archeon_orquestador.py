@@ -0,0 +1,247 @@
+# archeon_orquestador.py - Peticiones con cobertura (hedging) entre varios proveedores de IA
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Un proveedor recibe (prompt, al_fragmento o None, evento de cancelación) y
+# devuelve el texto completo; si falla, lanza excepción. El prompt se pasa tal
+# cual: cada proveedor lo da el formato que necesita
+Proveedor = Callable[[Any, Optional[Callable[[str], None]], threading.Event], str]
+
+
+class SinRespuesta(RuntimeError):
+    """Ningún proveedor dio una respuesta válida; `errores` tiene el motivo de cada uno."""
+
+    def __init__(self, errores: Dict[str, str]):
+        super().__init__("; ".join(f"{n}: {e}" for n, e in errores.items()) or "Sin proveedores disponibles")
+        self.errores = errores
+
+
+class OrquestadorIA:
+    """
+    Lanza la misma petición a varios proveedores y se queda con la primera
+    respuesta buena.
+
+    - "cobertura" (por defecto): primero el proveedor principal; si en
+      `cobertura_ms` no ha llegado ni un fragmento, se lanza también el
+      siguiente. Sin AR_HEDGE_MS la espera es el p90 reciente del principal.
+    - "carrera": todos a la vez desde el principio.
+    - "secuencial": el siguiente sólo si el anterior falla (comportamiento antiguo).
+
+    La burbuja es del primero que empieza a escribir: sólo sus fragmentos
+    llegan a `al_fragmento`, y si otro termina antes sin streaming su texto
+    queda de reserva mientras el dueño siga vivo (la respuesta visible no
+    cambia de contenido a mitad). A los perdedores se les activa su evento
+    de cancelación (los que leen en streaming cortan la conexión) y no dejan
+    muestra de latencia. Con latencias y errores recientes de cada proveedor
+    se elige el principal: el preferido por el usuario salvo que otro sea
+    claramente mejor.
+    """
+
+    MODOS = ("cobertura", "carrera", "secuencial")
+
+    def __init__(self, modo: str = "cobertura", cobertura_ms: Optional[float] = None,
+                 ventana: int = 50, min_muestras: int = 5):
+        self.modo = modo if modo in self.MODOS else "cobertura"
+        self.cobertura_ms = cobertura_ms
+        self.min_muestras = min_muestras
+        self._proveedores: Dict[str, Tuple[Proveedor, Callable[[], bool]]] = {}
+        self._muestras: Dict[str, deque] = {}
+        self._ventana = ventana
+        self._lock = threading.Lock()
+        self._stats = {"peticiones": 0, "coberturas": 0, "fallbacks": 0, "sin_respuesta": 0}
+        self._ganadas: Dict[str, int] = {}
+
+    @classmethod
+    def desde_entorno(cls) -> "OrquestadorIA":
+        cobertura = os.getenv("AR_HEDGE_MS")
+        return cls(modo=os.getenv("AR_IA_MODO", "cobertura"),
+                   cobertura_ms=float(cobertura) if cobertura else None)
+
+    def registrar(self, nombre: str, proveedor: Proveedor, disponible: Callable[[], bool] = lambda: True):
+        self._proveedores[nombre] = (proveedor, disponible)
+        self._muestras.setdefault(nombre, deque(maxlen=self._ventana))
+        self._ganadas.setdefault(nombre, 0)
+
+    # ==========================================================
+    # 📊 ESTADÍSTICAS Y ELECCIÓN DEL PRINCIPAL
+    # ==========================================================
+    def _anotar(self, nombre: str, ms: float, ok: bool):
+        with self._lock:
+            self._muestras[nombre].append((ms, ok))
+
+    def _resumen(self, nombre: str) -> Dict[str, Any]:
+        muestras = list(self._muestras.get(nombre, ()))
+        tiempos = sorted(ms for ms, ok in muestras if ok)
+
+        def percentil(p: float) -> Optional[float]:
+            if not tiempos:
+                return None
+            return round(tiempos[min(len(tiempos) - 1, int(p / 100 * len(tiempos)))], 1)
+
+        fallos = sum(1 for _, ok in muestras if not ok)
+        return {"n": len(muestras), "p50_ms": percentil(50), "p90_ms": percentil(90),
+                "tasa_error": round(fallos / len(muestras), 3) if muestras else 0.0}
+
+    def _puntuacion(self, nombre: str) -> Optional[float]:
+        """Menor es mejor: mediana de latencia penalizada por la tasa de error."""
+        r = self._resumen(nombre)
+        if r["n"] < self.min_muestras:
+            return None
+        if r["p50_ms"] is None:
+            return float("inf")
+        return r["p50_ms"] * (1 + 4 * r["tasa_error"])
+
+    def orden(self, preferido: Optional[str] = None) -> List[str]:
+        """Proveedores disponibles, el principal primero."""
+        disponibles = [n for n, (_, disponible) in self._proveedores.items() if disponible()]
+        if preferido in disponibles:
+            disponibles.remove(preferido)
+            disponibles.insert(0, preferido)
+        with self._lock:
+            puntos = {n: self._puntuacion(n) for n in disponibles}
+        if len(disponibles) > 1 and all(p is not None for p in puntos.values()):
+            mejor = min(disponibles, key=lambda n: puntos[n])
+            # Histéresis: el preferido sólo cede si el otro es bastante mejor
+            if puntos[mejor] < 0.7 * puntos[disponibles[0]]:
+                disponibles.remove(mejor)
+                disponibles.insert(0, mejor)
+        return disponibles
+
+    def _espera_cobertura(self, principal: str) -> float:
+        if self.cobertura_ms is not None:
+            return self.cobertura_ms / 1000
+        with self._lock:
+            r = self._resumen(principal)
+        if r["n"] < self.min_muestras or r["p90_ms"] is None:
+            return 1.5
+        return max(0.5, r["p90_ms"] / 1000)
+
+    # ==========================================================
+    # 🏁 EJECUCIÓN
+    # ==========================================================
+    def ejecutar(self, prompt: Any, al_fragmento: Optional[Callable[[str], None]] = None,
+                 preferido: Optional[str] = None) -> Tuple[str, str]:
+        """Devuelve (texto, proveedor ganador) o lanza SinRespuesta."""
+        orden = self.orden(preferido)
+        with self._lock:
+            self._stats["peticiones"] += 1
+        if not orden:
+            with self._lock:
+                self._stats["sin_respuesta"] += 1
+            raise SinRespuesta({})
+
+        resultados: "queue.Queue[Tuple[str, Optional[str], Optional[str]]]" = queue.Queue()
+        cancelados = {nombre: threading.Event() for nombre in orden}
+        escribiendo = {"dueño": None}
+        hay_fragmento = threading.Event()
+        lock_fragmentos = threading.Lock()
+
+        def lanzar(nombre: str):
+            proveedor = self._proveedores[nombre][0]
+            inicio = time.perf_counter()
+            primer_fragmento = []
+
+            def fragmento(texto: str):
+                if not primer_fragmento:
+                    primer_fragmento.append(time.perf_counter())
+                with lock_fragmentos:
+                    if escribiendo["dueño"] is None:
+                        escribiendo["dueño"] = nombre
+                        hay_fragmento.set()
+                    if escribiendo["dueño"] != nombre or cancelados[nombre].is_set():
+                        return
+                al_fragmento(texto)
+
+            def correr():
+                try:
+                    texto = proveedor(prompt, fragmento if al_fragmento else None, cancelados[nombre])
+                    error = None if texto and texto.strip() else "respuesta vacía"
+                except Exception as e:
+                    texto, error = None, str(e)[:200]
+                # Latencia percibida: hasta el primer fragmento si hubo streaming. Un
+                # perdedor cancelado no anota nada: su tiempo hasta el corte no dice
+                # cuánto habría tardado (y contado desde un lanzamiento tardío parecería rápido)
+                if not cancelados[nombre].is_set():
+                    fin = primer_fragmento[0] if primer_fragmento else time.perf_counter()
+                    self._anotar(nombre, (fin - inicio) * 1000, error is None)
+                resultados.put((nombre, texto, error))
+
+            threading.Thread(target=correr, daemon=True, name=f"ia-{nombre}").start()
+
+        pendientes = list(orden)
+        activos = 0
+        for _ in range(len(orden) if self.modo == "carrera" else 1):
+            lanzar(pendientes.pop(0))
+            activos += 1
+        limite = time.monotonic() + self._espera_cobertura(orden[0])
+        errores: Dict[str, str] = {}
+        reserva: Optional[Tuple[str, str]] = None  # Respuesta de quien no escribe en la burbuja
+
+        def ganar(texto: str, nombre: str) -> Tuple[str, str]:
+            for otro, evento in cancelados.items():
+                if otro != nombre:
+                    evento.set()
+            with self._lock:
+                self._ganadas[nombre] += 1
+            return texto, nombre
+
+        while activos:
+            esperar = None
+            if self.modo == "cobertura" and pendientes and not hay_fragmento.is_set():
+                esperar = max(0.0, limite - time.monotonic())
+            try:
+                nombre, texto, error = resultados.get(timeout=esperar)
+            except queue.Empty:
+                if hay_fragmento.is_set():
+                    continue
+                lanzar(pendientes.pop(0))
+                activos += 1
+                with self._lock:
+                    self._stats["coberturas"] += 1
+                continue
+            activos -= 1
+            if error is None:
+                with lock_fragmentos:
+                    dueño = escribiendo["dueño"]
+                    if dueño is None:
+                        escribiendo["dueño"] = nombre  # Ya nadie más empieza a escribir
+                if dueño is not None and dueño != nombre:
+                    # Otro está escribiendo en la burbuja: se espera su respuesta
+                    reserva = reserva or (texto, nombre)
+                    continue
+                return ganar(texto, nombre)
+            errores[nombre] = error
+            print(f"!! [IA] {nombre} falló: {error}")
+            with lock_fragmentos:
+                if escribiendo["dueño"] == nombre:
+                    # Otro proveedor puede quedarse la burbuja (los fragmentos son acumulados)
+                    escribiendo["dueño"] = None
+                    hay_fragmento.clear()
+                    if reserva is not None:
+                        escribiendo["dueño"] = reserva[1]
+            if reserva is not None and escribiendo["dueño"] == reserva[1]:
+                return ganar(*reserva)
+            if pendientes and not activos:
+                lanzar(pendientes.pop(0))
+                activos += 1
+                with self._lock:
+                    self._stats["fallbacks"] += 1
+
+        if reserva is not None:
+            return ganar(*reserva)
+        with self._lock:
+            self._stats["sin_respuesta"] += 1
+        raise SinRespuesta(errores)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "modo": self.modo,
+                **self._stats,
+                "proveedores": {n: {**self._resumen(n), "ganadas": self._ganadas.get(n, 0)}
+                                for n in self._proveedores},
+            }
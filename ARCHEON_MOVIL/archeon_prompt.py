@@ -0,0 +1,235 @@
+# archeon_prompt.py - Montaje del prompt con presupuesto de tokens y resumen del historial
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+INSTRUCCIONES = """Eres {nombre}, un asistente inteligente TODO-TERRENO.
+
+ROL GENERAL:
+Ayudas en CUALQUIER TEMA: programación, tecnología, estudios, cocina, tareas diarias, explicación de conceptos, consejos prácticos y conversación general.
+
+PRIORIDAD ABSOLUTA:
+1. Comprender la INTENCIÓN REAL del usuario.
+2. Responder de la forma MÁS ÚTIL y DIRECTA posible según esa intención.
+
+DETECCIÓN DE INTENCIÓN (INTERNA):
+Antes de responder, clasifica internamente la petición como UNA de estas:
+- Conversación general / pregunta simple
+- Explicación o aprendizaje
+- Tarea práctica (cocinar, estudiar, usar algo)
+- Programación / código
+- Corrección o mejora de código
+
+⚠️ REGLA CRÍTICA:
+La detección de intención es SOLO INTERNA.
+NUNCA expliques, menciones ni describas la intención del usuario en la respuesta.
+
+COMPORTAMIENTO SEGÚN INTENCIÓN:
+
+🟢 GENERAL (por defecto):
+- Responde claro, natural y útil.
+- Ve directo a la solución.
+- Usa pasos o listas solo si aportan valor.
+- Evita explicaciones innecesarias.
+
+🟡 EXPLICACIÓN / APRENDIZAJE:
+- Explica con ejemplos simples.
+- Usa listas cuando ayuden a entender.
+- Ajusta la profundidad al contexto.
+
+🔵 PROGRAMACIÓN:
+- Sé técnico y preciso.
+- Usa buenas prácticas.
+- Explica SOLO lo necesario para comprender o usar la solución.
+
+🔴 CORRECCIÓN / MEJORA DE CÓDIGO:
+(Solo si el usuario pide corregir, arreglar o mejorar)
+- ZERO FLUFF.
+- Diagnóstico breve en bullets.
+- Código corregido OBLIGATORIO.
+- Usa Markdown y separación de archivos si aplica.
+- No des solo explicación: ENTREGA SOLUCIÓN.
+
+REGLAS DE SALIDA (OBLIGATORIAS):
+- Empieza directamente con la respuesta, no con introducciones.
+- NO frases meta ("entiendo que…", "tu intención es…").
+- NO expliques el proceso interno.
+- NO nombres modos ni reglas.
+- Saluda SOLO si el usuario saluda primero.
+- Máximo 1 a 2 líneas antes de entrar al contenido real.
+
+IDIOMA (REGLA CRÍTICA):
+- Responde EXCLUSIVAMENTE en el idioma del último mensaje del usuario.
+- Ignora el idioma del historial si difiere.
+- Nunca cambies de idioma por iniciativa propia."""
+
+_CABECERA_RESUMEN = "\n\nRESUMEN DE LA CONVERSACIÓN ANTERIOR:\n"
+_ROLES_USUARIO = {"user", "usuario", "human", "humano"}
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación sin tokenizador: ~4 caracteres por token (algo más en código)."""
+    return (len(texto or "") + 3) // 4
+
+
+def _turno(item: Any) -> Optional[Tuple[str, str]]:
+    """Acepta los formatos habituales de historial y devuelve ("usuario"|"asistente", texto)."""
+    if isinstance(item, dict):
+        rol = item.get("role") or item.get("rol") or item.get("autor") or "user"
+        texto = item.get("content") or item.get("texto") or item.get("text")
+        if texto is None and isinstance(item.get("parts"), list):
+            texto = "".join(p.get("text", "") for p in item["parts"] if isinstance(p, dict))
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        rol, texto = item
+    elif isinstance(item, str):
+        rol, texto = "user", item
+    else:
+        return None
+    if not texto:
+        return None
+    return ("usuario" if str(rol).lower() in _ROLES_USUARIO else "asistente"), str(texto)
+
+
+class ConstructorPrompt:
+    """
+    Arma lo que se envía a la IA:
+
+    - `sistema`: las instrucciones fijas (se generan una vez por nombre del
+      asistente) más el resumen de la conversación anterior, para el campo
+      de sistema del proveedor.
+    - `turnos`: historial como turnos con rol, del más antiguo al más nuevo,
+      sólo los recientes que caben en `presupuesto` tokens.
+    - Lo que no cabe, o lo que ContextMemory ya ha descartado, se pliega en
+      un resumen extractivo acumulado de como mucho `max_resumen` tokens.
+    """
+
+    def __init__(self, presupuesto: int = 3000, max_resumen: int = 250, max_turno: int = 160):
+        self.presupuesto = presupuesto
+        self.max_resumen = max_resumen
+        self.max_turno = max_turno  # Caracteres de cada turno dentro del resumen
+        self._instrucciones: Dict[str, str] = {}
+        self._resumen = ""
+        self._plegados: Dict[str, None] = {}  # Huellas de turnos ya resumidos (orden de llegada)
+        self._anteriores: List[Tuple[str, str, str]] = []  # (huella, rol, texto) de la última llamada
+        self._lock = threading.Lock()
+        self._stats = {"peticiones": 0, "tokens_total": 0, "tokens_max": 0, "turnos_resumidos": 0}
+
+    def instrucciones(self, nombre: str) -> str:
+        texto = self._instrucciones.get(nombre)
+        if texto is None:
+            texto = self._instrucciones[nombre] = INSTRUCCIONES.format(nombre=nombre)
+        return texto
+
+    # ==========================================================
+    # 🗜️ RESUMEN ACUMULADO
+    # ==========================================================
+    @staticmethod
+    def _huella(rol: str, texto: str) -> str:
+        return hashlib.sha1(f"{rol}\x00{texto}".encode("utf-8")).hexdigest()
+
+    def _plegar(self, turnos: List[Tuple[str, str, str]]):
+        nuevos = []
+        for huella, rol, texto in turnos:
+            if huella in self._plegados:
+                continue
+            self._plegados[huella] = None
+            linea = " ".join(texto.split())
+            if len(linea) > self.max_turno:
+                linea = linea[:self.max_turno - 1] + "…"
+            nuevos.append(f"{'Usuario' if rol == 'usuario' else 'Asistente'}: {linea}")
+        if not nuevos:
+            return
+        self._stats["turnos_resumidos"] += len(nuevos)
+        while len(self._plegados) > 512:
+            self._plegados.pop(next(iter(self._plegados)))
+        resumen = "\n".join(filter(None, [self._resumen, *nuevos]))
+        # Se conserva lo más reciente: fuera las líneas más antiguas
+        lineas = resumen.split("\n")
+        while len(lineas) > 1 and estimar_tokens("\n".join(lineas)) > self.max_resumen:
+            lineas.pop(0)
+        self._resumen = "\n".join(lineas)
+
+    # ==========================================================
+    # 🧱 MONTAJE
+    # ==========================================================
+    def construir(self, texto_usuario: str, historial: Optional[List[Any]] = None,
+                  nombre: str = "Archeon") -> Dict[str, Any]:
+        """Devuelve {"sistema", "turnos": [(rol, texto)...], "usuario", "tokens": {...}}."""
+        actuales = []
+        for item in historial or []:
+            turno = _turno(item)
+            if turno is not None:
+                actuales.append((self._huella(*turno), *turno))
+
+        with self._lock:
+            # Lo que ContextMemory dejó de devolver desde la última llamada
+            vigentes = {h for h, _, _ in actuales}
+            self._plegar([t for t in self._anteriores if t[0] not in vigentes])
+            self._anteriores = actuales
+
+            instrucciones = self.instrucciones(nombre)
+            fijos = estimar_tokens(instrucciones) + estimar_tokens(texto_usuario)
+            if self._resumen or actuales:
+                # Hueco para el resumen completo: plegar turnos no debe pasarse del presupuesto
+                fijos += self.max_resumen + estimar_tokens(_CABECERA_RESUMEN)
+            disponible = self.presupuesto - fijos
+            incluidos: List[Tuple[str, str, str]] = []
+            for huella, rol, texto in reversed(actuales):
+                coste = estimar_tokens(texto)
+                if coste > disponible:
+                    if not incluidos and disponible > 50:
+                        # El último turno es enorme (código pegado): va recortado por el principio
+                        incluidos.append((huella, rol, "…" + texto[-disponible * 4:]))
+                        disponible = 0
+                    break
+                incluidos.append((huella, rol, texto))
+                disponible -= coste
+            incluidos.reverse()
+            fuera = actuales[:len(actuales) - len(incluidos)]
+            if fuera:
+                self._plegar(fuera)
+            resumen = self._resumen
+
+            sistema = instrucciones
+            if resumen:
+                sistema += _CABECERA_RESUMEN + resumen
+            turnos = [(rol, texto) for _, rol, texto in incluidos]
+            tokens = {
+                "sistema": estimar_tokens(sistema),
+                "historial": sum(estimar_tokens(t) for _, t in turnos),
+                "usuario": estimar_tokens(texto_usuario),
+                "turnos": len(turnos),
+                "resumidos": len(fuera),
+            }
+            tokens["total"] = tokens["sistema"] + tokens["historial"] + tokens["usuario"]
+            self._stats["peticiones"] += 1
+            self._stats["tokens_total"] += tokens["total"]
+            self._stats["tokens_max"] = max(self._stats["tokens_max"], tokens["total"])
+        return {"sistema": sistema, "turnos": turnos, "usuario": texto_usuario, "tokens": tokens}
+
+    # ==========================================================
+    # 📤 FORMATOS POR PROVEEDOR
+    # ==========================================================
+    @staticmethod
+    def para_gemini(prompt: Dict[str, Any]) -> Dict[str, Any]:
+        """Cuerpo de generateContent: system_instruction + contents con roles user/model."""
+        contents = [{"role": "user" if rol == "usuario" else "model", "parts": [{"text": texto}]}
+                    for rol, texto in prompt["turnos"]]
+        contents.append({"role": "user", "parts": [{"text": prompt["usuario"]}]})
+        return {"system_instruction": {"parts": [{"text": prompt["sistema"]}]}, "contents": contents}
+
+    @staticmethod
+    def como_texto(prompt: Dict[str, Any]) -> str:
+        """Para proveedores que sólo aceptan una cadena: sistema + transcripción con roles."""
+        lineas = [prompt["sistema"], "", "CONVERSACIÓN:"]
+        lineas += [f"{'Usuario' if rol == 'usuario' else 'Asistente'}: {texto}" for rol, texto in prompt["turnos"]]
+        lineas.append(f"Usuario: {prompt['usuario']}")
+        return "\n".join(lineas)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["resumen_tokens"] = estimar_tokens(self._resumen)
+        s["tokens_medios"] = round(s["tokens_total"] / s["peticiones"], 1) if s["peticiones"] else 0.0
+        s["presupuesto"] = self.presupuesto
+        return s
@@ -0,0 +1,233 @@
+# archeon_realtime.py - Feed de cambios de filas (Supabase Realtime) para la caché
+import random
+import asyncio
+import threading
+import importlib.util
+from typing import Any, Callable, Dict, List, Optional
+
+# Cliente Realtime (viene con supabase-py); sin él no hay feed remoto.
+# Se importa al conectar, no al cargar el módulo
+REALTIME_AVAILABLE = importlib.util.find_spec("realtime") is not None
+
+Cambio = Dict[str, Any]  # {"tabla", "tipo": INSERT|UPDATE|DELETE, "nuevo", "anterior"}
+
+
+class FeedCambios:
+    """
+    Suscripciones a cambios de filas filtradas por columna = valor.
+
+    Los callbacks reciben un Cambio y se ejecutan en el hilo del feed; los
+    oyentes de estado reciben True al (re)conectar y False al perder la
+    conexión (los cambios ocurridos mientras tanto NO llegan: hay que ponerse
+    al día por otra vía).
+    """
+
+    def __init__(self):
+        self._subs: Dict[int, tuple] = {}
+        self._siguiente_id = 1
+        self._oyentes_estado: List[Callable[[bool], None]] = []
+        self._conectado = False
+        self._lock = threading.Lock()
+        self._stats = {"eventos": 0, "entregados": 0, "errores_callback": 0,
+                       "conexiones": 0, "desconexiones": 0}
+
+    @property
+    def conectado(self) -> bool:
+        return self._conectado
+
+    def suscribir(self, tabla: str, columna: str, valor: Any, callback: Callable[[Cambio], None]) -> int:
+        with self._lock:
+            sub_id = self._siguiente_id
+            self._siguiente_id += 1
+            self._subs[sub_id] = (tabla, columna, valor, callback)
+        self._al_suscribir(sub_id, tabla, columna, valor)
+        return sub_id
+
+    def cancelar(self, sub_id: int):
+        with self._lock:
+            sub = self._subs.pop(sub_id, None)
+        if sub is not None:
+            self._al_cancelar(sub_id)
+
+    def al_cambiar_estado(self, oyente: Callable[[bool], None]):
+        self._oyentes_estado.append(oyente)
+
+    # Ganchos para los feeds concretos
+    def iniciar(self):
+        pass
+
+    def detener(self):
+        pass
+
+    def _al_suscribir(self, sub_id: int, tabla: str, columna: str, valor: Any):
+        pass
+
+    def _al_cancelar(self, sub_id: int):
+        pass
+
+    def _entregar(self, tabla: str, tipo: str, nuevo: Optional[Dict[str, Any]],
+                  anterior: Optional[Dict[str, Any]]):
+        """Reparte un cambio a las suscripciones cuya columna coincide."""
+        nuevo, anterior = nuevo or {}, anterior or {}
+        cambio = {"tabla": tabla, "tipo": tipo.upper(), "nuevo": nuevo, "anterior": anterior}
+        with self._lock:
+            self._stats["eventos"] += 1
+            destinos = [cb for (t, columna, valor, cb) in self._subs.values()
+                        if t == tabla and valor in (nuevo.get(columna), anterior.get(columna))]
+        for callback in destinos:
+            try:
+                callback(cambio)
+                with self._lock:
+                    self._stats["entregados"] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats["errores_callback"] += 1
+                print(f"!! [REALTIME] Error aplicando cambio de {tabla}: {e}")
+
+    def _marcar_estado(self, conectado: bool):
+        if conectado == self._conectado:
+            return
+        self._conectado = conectado
+        with self._lock:
+            self._stats["conexiones" if conectado else "desconexiones"] += 1
+        for oyente in list(self._oyentes_estado):
+            try:
+                oyente(conectado)
+            except Exception as e:
+                print(f"!! [REALTIME] Error en oyente de estado: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tipo": type(self).__name__, "conectado": self._conectado,
+                    "suscripciones": len(self._subs), **self._stats}
+
+
+class FeedLocal(FeedCambios):
+    """
+    Sustituto en proceso del websocket de Realtime (pruebas y modo offline):
+    `publicar` entrega el cambio como lo haría el servidor, y
+    `desconectar`/`iniciar` simulan cortes de la conexión.
+    """
+
+    def iniciar(self):
+        self._marcar_estado(True)
+
+    def detener(self):
+        self._marcar_estado(False)
+
+    def desconectar(self):
+        self._marcar_estado(False)
+
+    def publicar(self, tabla: str, tipo: str, nuevo: Optional[Dict[str, Any]] = None,
+                 anterior: Optional[Dict[str, Any]] = None):
+        if self._conectado:
+            self._entregar(tabla, tipo, nuevo, anterior)
+
+
+class FeedSupabase(FeedCambios):
+    """
+    Supabase Realtime (canales postgres_changes) en un bucle asyncio propio.
+    Las tablas tienen que estar en la publicación de Realtime:
+
+        alter publication supabase_realtime add table users, gustos, comandos, skills;
+        -- Para que los DELETE traigan la clave natural (gusto, comando)
+        alter table gustos replica identity full;
+        alter table comandos replica identity full;
+
+    Si la conexión cae se reintenta con backoff y se vuelven a abrir todos
+    los canales.
+    """
+
+    def __init__(self, url: str, key: str, comprobar_cada: float = 5.0,
+                 backoff_max: float = 60.0):
+        super().__init__()
+        self.url = url.rstrip("/").replace("https://", "wss://").replace("http://", "ws://") + "/realtime/v1"
+        self.key = key
+        self.comprobar_cada = comprobar_cada
+        self.backoff_max = backoff_max
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._cliente = None
+        self._canales: Dict[int, Any] = {}
+        self._parar = threading.Event()
+
+    def iniciar(self):
+        if not REALTIME_AVAILABLE or self._hilo is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._loop.run_forever, daemon=True, name="realtime")
+        self._hilo.start()
+        asyncio.run_coroutine_threadsafe(self._mantener_conexion(), self._loop)
+
+    def detener(self):
+        self._parar.set()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cerrar(), self._loop)
+        self._marcar_estado(False)
+
+    def _al_suscribir(self, sub_id: int, tabla: str, columna: str, valor: Any):
+        if self._loop is not None and self._conectado:
+            asyncio.run_coroutine_threadsafe(self._abrir_canal(sub_id, tabla, columna, valor), self._loop)
+
+    def _al_cancelar(self, sub_id: int):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cerrar_canal(sub_id), self._loop)
+
+    async def _mantener_conexion(self):
+        from realtime import AsyncRealtimeClient
+        intento = 0
+        while not self._parar.is_set():
+            try:
+                self._cliente = AsyncRealtimeClient(self.url, self.key)
+                await self._cliente.connect()
+                self._canales.clear()
+                with self._lock:
+                    subs = dict(self._subs)
+                for sub_id, (tabla, columna, valor, _) in subs.items():
+                    await self._abrir_canal(sub_id, tabla, columna, valor)
+                intento = 0
+                self._marcar_estado(True)
+                while not self._parar.is_set() and getattr(self._cliente, "is_connected", True):
+                    await asyncio.sleep(self.comprobar_cada)
+            except Exception as e:
+                print(f"!! [REALTIME] Conexión perdida: {e}")
+            self._marcar_estado(False)
+            await self._cerrar()
+            if self._parar.is_set():
+                break
+            intento += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, 2 ** intento)))
+
+    async def _abrir_canal(self, sub_id: int, tabla: str, columna: str, valor: Any):
+        def al_recibir(payload: Dict[str, Any]):
+            datos = payload.get("data", payload)
+            self._entregar(datos.get("table", tabla),
+                           datos.get("type") or datos.get("eventType") or "UPDATE",
+                           datos.get("record") or datos.get("new"),
+                           datos.get("old_record") or datos.get("old"))
+
+        canal = self._cliente.channel(f"archeon:{tabla}:{sub_id}")
+        canal.on_postgres_changes("*", schema="public", table=tabla,
+                                  filter=f"{columna}=eq.{valor}", callback=al_recibir)
+        await canal.subscribe()
+        self._canales[sub_id] = canal
+
+    async def _cerrar_canal(self, sub_id: int):
+        canal = self._canales.pop(sub_id, None)
+        if canal is not None:
+            try:
+                await canal.unsubscribe()
+            except Exception:
+                pass
+
+    async def _cerrar(self):
+        cliente, self._cliente = self._cliente, None
+        self._canales.clear()
+        if cliente is not None:
+            try:
+                await cliente.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "disponible": REALTIME_AVAILABLE}
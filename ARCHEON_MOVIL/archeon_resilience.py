@@ -0,0 +1,395 @@
+# archeon_resilience.py - Timeouts, reintentos con backoff y circuit breaker para Supabase
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from archeon_metrics import RegistroMetricas, tamano_respuesta
+
+
+class CircuitoAbierto(ConnectionError):
+    """La nube se considera caída: la llamada se rechaza sin tocar la red."""
+
+
+class CircuitBreaker:
+    """
+    Tres estados:
+    - cerrado: todo pasa; `umbral` fallos seguidos lo abren.
+    - abierto: todo se rechaza al instante durante `enfriamiento` segundos.
+    - semiabierto: deja pasar una única llamada de prueba; si sale bien se
+      cierra, si falla vuelve a abrirse.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, umbral: int = 5, enfriamiento: float = 30.0):
+        self.umbral = max(1, int(umbral))
+        self.enfriamiento = enfriamiento
+        self._estado = self.CERRADO
+        self._fallos_seguidos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+        self._stats = {"exitos": 0, "fallos": 0, "rechazadas": 0, "aperturas": 0}
+        self._ultimo_error: Optional[str] = None
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado_actual()
+
+    def _estado_actual(self) -> str:
+        if self._estado == self.ABIERTO and time.monotonic() - self._abierto_desde >= self.enfriamiento:
+            self._estado = self.SEMIABIERTO
+            self._prueba_en_curso = False
+        return self._estado
+
+    def permitir(self) -> bool:
+        """Reserva el paso de una llamada (en semiabierto, sólo una a la vez)."""
+        with self._lock:
+            estado = self._estado_actual()
+            if estado == self.CERRADO:
+                return True
+            if estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            self._stats["rechazadas"] += 1
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._stats["exitos"] += 1
+            self._fallos_seguidos = 0
+            self._prueba_en_curso = False
+            if self._estado != self.CERRADO:
+                print(">> [CLOUD] Circuito cerrado: la nube vuelve a responder")
+            self._estado = self.CERRADO
+
+    def fallo(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._stats["fallos"] += 1
+            self._fallos_seguidos += 1
+            self._prueba_en_curso = False
+            if error is not None:
+                self._ultimo_error = f"{type(error).__name__}: {error}"[:200]
+            estado = self._estado_actual()
+            if estado == self.SEMIABIERTO or (estado == self.CERRADO and self._fallos_seguidos >= self.umbral):
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._stats["aperturas"] += 1
+                print(f"!! [CLOUD] Circuito abierto tras {self._fallos_seguidos} fallos: modo offline "
+                      f"durante {self.enfriamiento:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            estado = self._estado_actual()
+            restante = 0.0
+            if estado == self.ABIERTO:
+                restante = max(0.0, self.enfriamiento - (time.monotonic() - self._abierto_desde))
+            return {
+                "estado": estado,
+                "fallos_seguidos": self._fallos_seguidos,
+                "umbral": self.umbral,
+                "reabre_en_s": round(restante, 1),
+                "ultimo_error": self._ultimo_error,
+                **self._stats,
+            }
+
+
+class LimitadorIntentos:
+    """
+    Ventana deslizante por clave (ej. email): como mucho `max_intentos`
+    eventos registrados en `ventana` segundos. Pasado el límite, `permitir`
+    rechaza sin tocar la red hasta que el evento más antiguo sale de la ventana.
+    """
+
+    def __init__(self, max_intentos: int = 5, ventana: float = 900.0, max_claves: int = 10000):
+        self.max_intentos = max(1, int(max_intentos))
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._eventos: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"permitidos": 0, "rechazados": 0}
+
+    def _vigentes(self, clave: str, ahora: float) -> deque:
+        eventos = self._eventos.get(clave)
+        if eventos is None:
+            return deque()
+        while eventos and ahora - eventos[0] >= self.ventana:
+            eventos.popleft()
+        if not eventos:
+            del self._eventos[clave]
+        return eventos
+
+    def permitir(self, clave: str) -> Tuple[bool, float]:
+        """Devuelve (permitido, segundos hasta el próximo intento posible)."""
+        with self._lock:
+            ahora = time.monotonic()
+            eventos = self._vigentes(clave, ahora)
+            if len(eventos) >= self.max_intentos:
+                self._stats["rechazados"] += 1
+                return False, self.ventana - (ahora - eventos[0])
+            self._stats["permitidos"] += 1
+            return True, 0.0
+
+    def registrar(self, clave: str):
+        with self._lock:
+            ahora = time.monotonic()
+            self._vigentes(clave, ahora)
+            self._eventos.setdefault(clave, deque()).append(ahora)
+            self._eventos.move_to_end(clave)
+            while len(self._eventos) > self.max_claves:
+                self._eventos.popitem(last=False)
+
+    def limpiar(self, clave: str):
+        with self._lock:
+            self._eventos.pop(clave, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"claves": len(self._eventos), "max_intentos": self.max_intentos,
+                    "ventana_s": self.ventana, **self._stats}
+
+
+def es_transitorio(error: BaseException) -> bool:
+    """
+    Errores de red/tiempo/5xx (vale la pena reintentar y cuentan para el breaker).
+    Un 4xx de PostgREST (restricción, permiso, columna inexistente) significa
+    que el servidor respondió: ni se reintenta ni abre el circuito.
+    """
+    if isinstance(error, (TimeoutError, FuturoTimeout, ConnectionError)):
+        return True
+    nombre = type(error).__name__.lower()
+    if any(p in nombre for p in ("timeout", "connect", "network", "transport", "protocol", "remote")):
+        return True
+    for atributo in ("status_code", "status", "code"):
+        valor = getattr(error, atributo, None)
+        try:
+            # Sólo estados HTTP 5xx (el `code` de PostgREST suele ser un SQLSTATE)
+            if valor is not None and 500 <= int(valor) < 600:
+                return True
+        except (TypeError, ValueError):
+            continue
+    return isinstance(error, OSError)
+
+
+class PoliticaLlamadas:
+    """
+    Ejecuta llamadas bloqueantes con timeout por operación, reintentos con
+    backoff exponencial y jitter (sólo si la operación es idempotente) y
+    un CircuitBreaker compartido.
+
+    Si tiene `metricas`, cada llamada con `destino` (tabla, "rpc:fn" o
+    "storage:bucket") se cronometra entera, reintentos incluidos, en el
+    histograma (destino, op).
+
+    El timeout de aquí no puede parar una llamada que ya está en curso: el
+    corte real lo hace el transporte (ver `timeout_transporte`). Mientras
+    tanto, la llamada abandonada sigue ocupando un hilo; el pool crece hasta
+    `max_abandonadas` hilos extra para que no haga cola lo nuevo, y pasado
+    ese límite se falla al momento en vez de esperar turno.
+    """
+
+    TIMEOUTS = {"select": 8.0, "insert": 10.0, "upsert": 10.0, "update": 10.0,
+                "delete": 10.0, "rpc": 10.0, "storage": 60.0}
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, reintentos: int = 3,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 timeouts: Optional[Dict[str, float]] = None, workers: int = 8,
+                 metricas: Optional[RegistroMetricas] = None, max_abandonadas: int = 8):
+        self.breaker = breaker or CircuitBreaker()
+        self.reintentos = max(0, int(reintentos))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeouts = {**self.TIMEOUTS, **(timeouts or {})}
+        self.workers = workers
+        self.metricas = metricas
+        self.max_abandonadas = max(0, int(max_abandonadas))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._abandonadas: set = set()  # Futuros que vencieron y aún no han terminado
+        self._lock = threading.Lock()
+        self._stats = {"llamadas": 0, "reintentos": 0, "timeouts": 0, "errores": 0,
+                       "abandonadas_total": 0, "rechazadas_colgadas": 0}
+
+    def timeout_transporte(self, op: str) -> float:
+        """Timeout a pasar al cliente HTTP subyacente (algo más holgado que el de la política)."""
+        return self.timeouts.get(op, max(self.timeouts.values())) + 1.0
+
+    def _espera(self, intento: int) -> float:
+        # "Full jitter": aleatorio entre 0 y el backoff exponencial del intento
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+
+    def _con_timeout(self, fn: Callable[[], Any], timeout: Optional[float]) -> Any:
+        if not timeout:
+            return fn()
+        with self._lock:
+            if len(self._abandonadas) >= self.max_abandonadas > 0:
+                self._stats["rechazadas_colgadas"] += 1
+                raise TimeoutError(f"{len(self._abandonadas)} llamadas a Supabase siguen colgadas")
+            if self._pool is None:
+                # Los hilos se crean según hacen falta: los extra sólo si hay colgadas
+                self._pool = ThreadPoolExecutor(max_workers=self.workers + self.max_abandonadas,
+                                                thread_name_prefix="supabase-io")
+        futuro = self._pool.submit(fn)
+        try:
+            return futuro.result(timeout=timeout)
+        except FuturoTimeout:
+            with self._lock:
+                self._stats["timeouts"] += 1
+                if not futuro.cancel():
+                    self._abandonadas.add(futuro)
+                    self._stats["abandonadas_total"] += 1
+            futuro.add_done_callback(self._liberar)
+            raise TimeoutError(f"Sin respuesta de Supabase en {timeout:.1f}s")
+
+    def _liberar(self, futuro):
+        with self._lock:
+            self._abandonadas.discard(futuro)
+
+    def ejecutar(self, fn: Callable[[], Any], op: str = "select", idempotente: Optional[bool] = None,
+                 timeout: Optional[float] = None, destino: Optional[str] = None,
+                 etiqueta: Optional[str] = None) -> Any:
+        """`etiqueta` sustituye a `op` en las métricas (p.ej. el método de storage)."""
+        if self.metricas is None or destino is None:
+            return self._ejecutar(fn, op, idempotente, timeout)
+        inicio = time.perf_counter()
+        try:
+            resultado = self._ejecutar(fn, op, idempotente, timeout)
+        except Exception:
+            self.metricas.registrar(destino, etiqueta or op, (time.perf_counter() - inicio) * 1000, ok=False)
+            raise
+        self.metricas.registrar(destino, etiqueta or op, (time.perf_counter() - inicio) * 1000,
+                                bytes_=tamano_respuesta(resultado))
+        return resultado
+
+    def _ejecutar(self, fn: Callable[[], Any], op: str, idempotente: Optional[bool],
+                  timeout: Optional[float]) -> Any:
+        if idempotente is None:
+            idempotente = op in ("select", "upsert", "update", "delete")
+        timeout = self.timeouts.get(op) if timeout is None else timeout
+        intentos = 1 + (self.reintentos if idempotente else 0)
+
+        with self._lock:
+            self._stats["llamadas"] += 1
+
+        for intento in range(intentos):
+            if not self.breaker.permitir():
+                raise CircuitoAbierto("Nube no disponible (circuito abierto)")
+            try:
+                resultado = self._con_timeout(fn, timeout)
+            except Exception as e:
+                if not es_transitorio(e):
+                    self.breaker.exito()  # El servidor respondió, aunque sea con error
+                    with self._lock:
+                        self._stats["errores"] += 1
+                    raise
+                self.breaker.fallo(e)
+                if intento + 1 >= intentos:
+                    with self._lock:
+                        self._stats["errores"] += 1
+                    raise
+                with self._lock:
+                    self._stats["reintentos"] += 1
+                time.sleep(self._espera(intento))
+            else:
+                self.breaker.exito()
+                return resultado
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "abandonadas": len(self._abandonadas),
+                    "max_abandonadas": self.max_abandonadas,
+                    "reintentos_max": self.reintentos, "timeouts_s": dict(self.timeouts)}
+
+
+# ==========================================================
+# 🛡️ PROXY DEL CLIENTE SUPABASE
+# ==========================================================
+class _ConsultaResiliente:
+    """Envuelve un query builder: la cadena es la misma, `execute()` pasa por la política."""
+
+    _OPERACIONES = ("select", "insert", "upsert", "update", "delete")
+
+    def __init__(self, builder: Any, politica: PoliticaLlamadas, op: Optional[str] = None,
+                 destino: Optional[str] = None):
+        self._builder = builder
+        self._politica = politica
+        self._op = op
+        self._destino = destino
+
+    def __getattr__(self, nombre: str):
+        atributo = getattr(self._builder, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def encadenar(*args, **kwargs):
+            resultado = atributo(*args, **kwargs)
+            op = self._op or (nombre if nombre in self._OPERACIONES else None)
+            return _ConsultaResiliente(resultado, self._politica, op, self._destino)
+        return encadenar
+
+    def execute(self) -> Any:
+        return self._politica.ejecutar(self._builder.execute, self._op or "select",
+                                       destino=self._destino)
+
+
+class _BucketResiliente:
+    _IDEMPOTENTES = ("download", "list", "remove", "create_signed_url", "get_public_url")
+
+    def __init__(self, bucket: Any, politica: PoliticaLlamadas, nombre: str = ""):
+        self._bucket = bucket
+        self._politica = politica
+        self._destino = f"storage:{nombre}"
+
+    def __getattr__(self, nombre: str):
+        atributo = getattr(self._bucket, nombre)
+        if not callable(atributo) or nombre == "get_public_url":
+            return atributo
+
+        def llamar(*args, **kwargs):
+            return self._politica.ejecutar(lambda: atributo(*args, **kwargs), "storage",
+                                           idempotente=nombre in self._IDEMPOTENTES,
+                                           destino=self._destino, etiqueta=nombre)
+        return llamar
+
+
+class _StorageResiliente:
+    def __init__(self, storage: Any, politica: PoliticaLlamadas):
+        self._storage = storage
+        self._politica = politica
+
+    def from_(self, bucket: str) -> _BucketResiliente:
+        return _BucketResiliente(self._storage.from_(bucket), self._politica, bucket)
+
+    def __getattr__(self, nombre: str):
+        return getattr(self._storage, nombre)
+
+
+class ClienteResiliente:
+    """
+    Sustituto transparente del cliente de Supabase: `table()`, `rpc()` y
+    `storage.from_()` devuelven envoltorios cuyo execute/llamada final aplica
+    timeout, reintento y circuit breaker. Lo demás se delega tal cual.
+    """
+
+    def __init__(self, cliente: Any, politica: PoliticaLlamadas):
+        self._cliente = cliente
+        self.politica = politica
+
+    def table(self, nombre: str) -> _ConsultaResiliente:
+        return _ConsultaResiliente(self._cliente.table(nombre), self.politica, destino=nombre)
+
+    def rpc(self, funcion: str, params: Optional[Dict[str, Any]] = None) -> _ConsultaResiliente:
+        return _ConsultaResiliente(self._cliente.rpc(funcion, params or {}), self.politica, "rpc",
+                                   destino=f"rpc:{funcion}")
+
+    @property
+    def storage(self) -> _StorageResiliente:
+        return _StorageResiliente(self._cliente.storage, self.politica)
+
+    def __getattr__(self, nombre: str):
+        return getattr(self._cliente, nombre)
@@ -0,0 +1,154 @@
+# archeon_skills.py - Índice de triggers de skills (Aho–Corasick) para emparejar frases
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con cualquier signo convertido en un único espacio."""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"[^0-9a-zñ]+", " ", texto).strip()
+
+
+class _Nodo:
+    __slots__ = ("hijos", "fallo", "trigger", "salida")
+
+    def __init__(self):
+        self.hijos: Dict[str, "_Nodo"] = {}
+        self.fallo: Optional["_Nodo"] = None
+        self.trigger: Optional[str] = None  # Trigger normalizado que termina aquí
+        self.salida: Optional["_Nodo"] = None  # Siguiente nodo con trigger por la cadena de fallos
+
+
+class IndiceTriggers:
+    """
+    Autómata Aho–Corasick sobre los triggers normalizados de un usuario.
+
+    - `buscar` recorre el texto una sola vez (O(len(texto)) + coincidencias) y
+      devuelve la skill con el trigger más largo que aparece como palabras
+      completas (" pon musica " no casa con "componer música"). Por defecto
+      el trigger tiene que abrir la frase: una skill manda una macro a la
+      Base PC y no debe dispararse por una mención a mitad de conversación.
+    - Los cambios son incrementales: añadir inserta el camino del trigger y
+      marca los enlaces de fallo para recalcularlos en la siguiente búsqueda;
+      quitar sólo desmarca el nodo final.
+    """
+
+    def __init__(self, skills: Iterable[Dict[str, Any]] = ()):
+        self._raiz = _Nodo()
+        self._skills: Dict[str, Dict[str, Any]] = {}  # trigger normalizado -> skill
+        self._sucio = False
+        self._lock = threading.Lock()
+        self._stats = {"busquedas": 0, "aciertos": 0, "recompilaciones": 0}
+        self.reemplazar(skills)
+
+    def __len__(self) -> int:
+        return len(self._skills)
+
+    # ==========================================================
+    # ✏️ CAMBIOS INCREMENTALES
+    # ==========================================================
+    def agregar(self, trigger: str, actions: Any, skill_id: Any = None):
+        clave = normalizar(trigger)
+        if not clave:
+            return
+        with self._lock:
+            nodo = self._raiz
+            for caracter in f" {clave} ":
+                siguiente = nodo.hijos.get(caracter)
+                if siguiente is None:
+                    siguiente = nodo.hijos[caracter] = _Nodo()
+                    self._sucio = True
+                nodo = siguiente
+            nodo.trigger = clave
+            self._skills[clave] = {"id": skill_id, "trigger": trigger, "actions": actions}
+            self._sucio = True  # Las cadenas de salida dependen de qué nodos terminan trigger
+
+    def quitar(self, trigger: str):
+        clave = normalizar(trigger)
+        with self._lock:
+            if self._skills.pop(clave, None) is None:
+                return
+            nodo = self._raiz
+            for caracter in f" {clave} ":
+                nodo = nodo.hijos[caracter]
+            nodo.trigger = None
+            self._sucio = True
+
+    def quitar_id(self, skill_id: Any) -> bool:
+        triggers = [s["trigger"] for s in self._skills.values() if str(s["id"]) == str(skill_id)]
+        for trigger in triggers:
+            self.quitar(trigger)
+        return bool(triggers)
+
+    def reemplazar(self, skills: Iterable[Dict[str, Any]]):
+        """Deja el índice igual a `skills` tocando sólo los triggers que cambian."""
+        nuevas = {normalizar(s.get("trigger")): s for s in skills if normalizar(s.get("trigger"))}
+        for clave in [c for c in self._skills if c not in nuevas]:
+            self.quitar(self._skills[clave]["trigger"])
+        for clave, skill in nuevas.items():
+            actual = self._skills.get(clave)
+            if actual is None or actual["actions"] != skill.get("actions") or actual["id"] != skill.get("id"):
+                self.agregar(skill["trigger"], skill.get("actions"), skill.get("id"))
+
+    def _compilar(self):
+        """Recalcula fallos y salidas en anchura (O(tamaño del trie))."""
+        self._raiz.fallo = None
+        self._raiz.salida = None
+        cola = deque()
+        for hijo in self._raiz.hijos.values():
+            hijo.fallo = self._raiz
+            hijo.salida = None
+            cola.append(hijo)
+        while cola:
+            nodo = cola.popleft()
+            for caracter, hijo in nodo.hijos.items():
+                fallo = nodo.fallo
+                while fallo is not None and caracter not in fallo.hijos:
+                    fallo = fallo.fallo
+                hijo.fallo = fallo.hijos[caracter] if fallo is not None else self._raiz
+                hijo.salida = hijo.fallo if hijo.fallo.trigger is not None else hijo.fallo.salida
+                cola.append(hijo)
+        self._sucio = False
+        self._stats["recompilaciones"] += 1
+
+    # ==========================================================
+    # 🔎 BÚSQUEDA
+    # ==========================================================
+    def buscar(self, texto: str, anclado: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Skill cuyo trigger aparece en el texto (el más largo; a igualdad, el
+        primero). Con `anclado`, sólo triggers al principio del texto (o el texto entero).
+        """
+        with self._lock:
+            self._stats["busquedas"] += 1
+            if not self._skills:
+                return None
+            if self._sucio:
+                self._compilar()
+            mejor, inicio_mejor = None, 0
+            nodo = self._raiz
+            frase = f" {normalizar(texto)} "
+            for posicion, caracter in enumerate(frase):
+                while nodo is not self._raiz and caracter not in nodo.hijos:
+                    nodo = nodo.fallo
+                nodo = nodo.hijos.get(caracter, self._raiz)
+                encontrado = nodo if nodo.trigger is not None else nodo.salida
+                while encontrado is not None:
+                    inicio = posicion - len(encontrado.trigger) - 1
+                    if (not anclado or inicio == 0) and (
+                            mejor is None or len(encontrado.trigger) > len(mejor) or
+                            (len(encontrado.trigger) == len(mejor) and inicio < inicio_mejor)):
+                        mejor, inicio_mejor = encontrado.trigger, inicio
+                    encontrado = encontrado.salida
+            if mejor is None:
+                return None
+            self._stats["aciertos"] += 1
+            return dict(self._skills[mejor])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"triggers": len(self._skills), **self._stats}
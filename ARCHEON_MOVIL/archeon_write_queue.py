@@ -0,0 +1,702 @@
+# archeon_write_queue.py - Cola de escritura en segundo plano (write-behind)
+import os
+import json
+import time
+import zlib
+import threading
+import itertools
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+POLITICAS = ("block", "drop_oldest", "spill")
+
+
+class _Shard:
+    """Cola acotada atendida por un único hilo (garantiza orden por clave)."""
+
+    def __init__(self, indice: int, spill_path: Optional[str]):
+        self.indice = indice
+        self.cola = deque()
+        self.cond = threading.Condition()
+        self.en_curso = 0
+        self.spill_path = spill_path
+        self.spill_pendientes = 0
+
+
+class WriteBehindExecutor:
+    """
+    Pool fijo de hilos con colas acotadas para escrituras Fire & Forget.
+
+    Cada clave (normalmente el usuario) se asigna siempre al mismo hilo, así
+    sus escrituras llegan a la nube en el mismo orden en que se encolaron.
+    Cuando una cola se llena se aplica la política de contrapresión:
+      - "block": el llamador espera a que haya hueco.
+      - "drop_oldest": se descarta la tarea más antigua de esa cola.
+      - "spill": la tarea se guarda en disco (JSONL) y se reinyecta después.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 256, politica: str = "block",
+                 spill_dir: Optional[str] = None, resolver: Optional[Callable[[str], Optional[Callable]]] = None,
+                 nombre: str = "cloud-writer"):
+        if politica not in POLITICAS:
+            print(f"!! [COLA] Política desconocida '{politica}', usando 'block'")
+            politica = "block"
+
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.politica = politica
+        self.spill_dir = spill_dir
+        self.nombre = nombre
+        self._resolver = resolver
+
+        self._shards: List[_Shard] = []
+        for i in range(self.workers):
+            spill_path = os.path.join(spill_dir, f"{nombre}_{i}.jsonl") if spill_dir else None
+            self._shards.append(_Shard(i, spill_path))
+
+        self._hilos: List[threading.Thread] = []
+        self._lock_inicio = threading.Lock()
+        self._round_robin = itertools.count()
+        self._cerrado = False
+
+        # Contadores
+        self._lock_stats = threading.Lock()
+        self._stats = {
+            "encoladas": 0,
+            "completadas": 0,
+            "fallidas": 0,
+            "descartadas": 0,
+            "derramadas": 0,
+            "rechazadas": 0,
+        }
+        self._profundidad_max = 0
+        self._espera_total = 0.0
+        self._latencia_total = 0.0
+        self._latencia_max = 0.0
+
+        # Tareas derramadas en una ejecución anterior de la app
+        self._recuperar_spill_previo()
+
+    # ==========================================================
+    # 🚀 ARRANQUE PEREZOSO DE HILOS
+    # ==========================================================
+    def _iniciar(self):
+        """Arranca los hilos sólo cuando llega la primera tarea."""
+        if self._hilos:
+            return
+        with self._lock_inicio:
+            if self._hilos:
+                return
+            for shard in self._shards:
+                t = threading.Thread(
+                    target=self._worker, args=(shard,), daemon=True,
+                    name=f"{self.nombre}-{shard.indice}"
+                )
+                t.start()
+                self._hilos.append(t)
+
+    def _indice(self, key: Any) -> int:
+        if key is None:
+            return next(self._round_robin) % self.workers
+        return zlib.crc32(str(key).encode()) % self.workers
+
+    # ==========================================================
+    # 📥 ENCOLADO CON CONTRAPRESIÓN
+    # ==========================================================
+    def submit(self, key: Any, fn: Callable, *args) -> bool:
+        """Encola fn(*args). Devuelve False si la tarea no se aceptó."""
+        shard = self._shards[self._indice(key)]
+        tarea = (fn, args, time.time())
+
+        with shard.cond:
+            if self._cerrado:
+                self._contar("rechazadas")
+                return False
+            self._iniciar()
+
+            # Si ya hay tareas en disco, las nuevas van detrás para no romper el orden;
+            # si esta no se puede derramar, las de disco vuelven antes a memoria
+            if shard.spill_pendientes:
+                if self._spill(shard, tarea):
+                    return True
+                self._recargar_spill(shard, todo=True)
+
+            while len(shard.cola) >= self.max_queue:
+                if self.politica == "drop_oldest":
+                    shard.cola.popleft()
+                    self._contar("descartadas")
+                    break
+                if self.politica == "spill" and self._spill(shard, tarea):
+                    return True
+                shard.cond.wait(timeout=1.0)
+                if self._cerrado:
+                    self._contar("rechazadas")
+                    return False
+
+            shard.cola.append(tarea)
+            self._contar("encoladas")
+            self._registrar_profundidad()
+            shard.cond.notify_all()
+        return True
+
+    def _spill(self, shard: _Shard, tarea) -> bool:
+        """Escribe la tarea en disco. Sólo es posible con funciones resolubles y args JSON."""
+        if not shard.spill_path or not self._resolver:
+            return False
+        fn, args, t_encolado = tarea
+        nombre_fn = getattr(fn, "__name__", "")
+        if not nombre_fn or self._resolver(nombre_fn) is None:
+            return False
+        try:
+            linea = json.dumps({"fn": nombre_fn, "args": list(args), "t": t_encolado})
+            os.makedirs(os.path.dirname(shard.spill_path), exist_ok=True)
+            with open(shard.spill_path, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+        except (TypeError, ValueError, OSError) as e:
+            print(f"!! [COLA] No se pudo derramar a disco: {e}")
+            return False
+
+        shard.spill_pendientes += 1
+        self._contar("derramadas")
+        shard.cond.notify_all()
+        return True
+
+    def _recargar_spill(self, shard: _Shard, todo: bool = False):
+        """
+        Devuelve a memoria las tareas derramadas (llamar con shard.cond adquirido).
+        Normalmente sólo las que caben en la cola; con `todo`, todas aunque se
+        pase de `max_queue` (para que una tarea nueva no se adelante a ellas).
+        """
+        try:
+            with open(shard.spill_path, "r", encoding="utf-8") as f:
+                lineas = [l for l in f.read().splitlines() if l.strip()]
+        except OSError:
+            lineas = []
+
+        hueco = len(lineas) if todo else self.max_queue - len(shard.cola)
+        cargar, resto = lineas[:hueco], lineas[hueco:]
+
+        for linea in cargar:
+            try:
+                item = json.loads(linea)
+                fn = self._resolver(item["fn"]) if self._resolver else None
+                if fn is None:
+                    raise ValueError(f"función no resoluble: {item.get('fn')}")
+                shard.cola.append((fn, tuple(item.get("args", [])), item.get("t", time.time())))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"!! [COLA] Tarea derramada inválida descartada: {e}")
+                self._contar("descartadas")
+
+        try:
+            if resto:
+                with open(shard.spill_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(resto) + "\n")
+            elif os.path.exists(shard.spill_path):
+                os.remove(shard.spill_path)
+        except OSError as e:
+            print(f"!! [COLA] Error reescribiendo spill: {e}")
+
+        shard.spill_pendientes = len(resto)
+        self._registrar_profundidad()
+
+    def _recuperar_spill_previo(self):
+        pendientes = False
+        for shard in self._shards:
+            if shard.spill_path and os.path.exists(shard.spill_path):
+                try:
+                    with open(shard.spill_path, "r", encoding="utf-8") as f:
+                        shard.spill_pendientes = sum(1 for l in f if l.strip())
+                except OSError:
+                    shard.spill_pendientes = 0
+                pendientes = pendientes or shard.spill_pendientes > 0
+        if pendientes:
+            print(">> [COLA] Reanudando escrituras pendientes de la sesión anterior")
+            self._iniciar()
+
+    # ==========================================================
+    # ⚙️ HILO TRABAJADOR
+    # ==========================================================
+    def _worker(self, shard: _Shard):
+        while True:
+            with shard.cond:
+                while not shard.cola:
+                    if shard.spill_pendientes:
+                        self._recargar_spill(shard)
+                        continue
+                    if self._cerrado:
+                        return
+                    shard.cond.wait()
+                fn, args, t_encolado = shard.cola.popleft()
+                shard.en_curso += 1
+                shard.cond.notify_all()
+
+            t_inicio = time.time()
+            ok = True
+            try:
+                fn(*args)
+            except Exception as e:
+                ok = False
+                print(f"!! [COLA] Error en escritura async ({getattr(fn, '__name__', fn)}): {e}")
+            t_fin = time.time()
+
+            with self._lock_stats:
+                self._stats["completadas" if ok else "fallidas"] += 1
+                self._espera_total += t_inicio - t_encolado
+                latencia = t_fin - t_encolado
+                self._latencia_total += latencia
+                self._latencia_max = max(self._latencia_max, latencia)
+
+            with shard.cond:
+                shard.en_curso -= 1
+                shard.cond.notify_all()
+
+    # ==========================================================
+    # 🛑 VACIADO Y CIERRE
+    # ==========================================================
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todas las tareas (incluidas las de disco) terminen."""
+        limite = None if timeout is None else time.time() + timeout
+        if any(s.spill_pendientes for s in self._shards):
+            self._iniciar()
+
+        for shard in self._shards:
+            with shard.cond:
+                while shard.cola or shard.en_curso or shard.spill_pendientes:
+                    if not self._hilos:
+                        break
+                    restante = None if limite is None else limite - time.time()
+                    if restante is not None and restante <= 0:
+                        return False
+                    shard.cond.wait(timeout=restante)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0) -> bool:
+        """Vacía la cola y detiene los hilos. Las tareas nuevas se rechazan."""
+        vaciado = self.flush(timeout)
+        for shard in self._shards:
+            with shard.cond:
+                self._cerrado = True
+                shard.cond.notify_all()
+        for t in self._hilos:
+            t.join(timeout=1.0)
+        return vaciado
+
+    # ==========================================================
+    # 📊 MÉTRICAS
+    # ==========================================================
+    def _contar(self, campo: str):
+        with self._lock_stats:
+            self._stats[campo] += 1
+
+    def _registrar_profundidad(self):
+        profundidad = sum(len(s.cola) for s in self._shards)
+        with self._lock_stats:
+            self._profundidad_max = max(self._profundidad_max, profundidad)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock_stats:
+            terminadas = self._stats["completadas"] + self._stats["fallidas"]
+            return {
+                "workers": self.workers,
+                "politica": self.politica,
+                "max_queue": self.max_queue,
+                "profundidad": sum(len(s.cola) for s in self._shards),
+                "profundidad_max": self._profundidad_max,
+                "en_curso": sum(s.en_curso for s in self._shards),
+                "en_disco": sum(s.spill_pendientes for s in self._shards),
+                **self._stats,
+                "espera_media_ms": round(self._espera_total / terminadas * 1000, 2) if terminadas else 0.0,
+                "latencia_media_ms": round(self._latencia_total / terminadas * 1000, 2) if terminadas else 0.0,
+                "latencia_max_ms": round(self._latencia_max * 1000, 2),
+            }
+
+
+class InsertBatcher:
+    """
+    Agrupa filas por tabla durante una ventana corta y las envía en UNA sola
+    llamada bulk (insert/upsert) a través del WriteBehindExecutor.
+
+    Un lote se envía cuando llega a `max_filas` o cuando su fila más antigua
+    cumple `max_espera` segundos, lo que ocurra primero. Si el envío bulk falla
+    se reintenta fila a fila para aislar las filas inválidas y reportar el
+    error de cada una por su callback.
+    """
+
+    def __init__(self, enviar: Callable[[str, List[Dict[str, Any]], str], Any],
+                 executor: WriteBehindExecutor, max_filas: int = 50, max_espera: float = 1.0,
+                 claves_upsert: Optional[Dict[str, tuple]] = None):
+        self._enviar = enviar
+        self._executor = executor
+        self.max_filas = max(1, int(max_filas))
+        self.max_espera = max(0.01, float(max_espera))
+        # Columnas que identifican una fila en los upsert (para deduplicar en el lote)
+        self._claves_upsert = claves_upsert or {}
+
+        # {(tabla, modo): {"filas": [...], "callbacks": [...], "desde": t}}
+        self._buffers: Dict[tuple, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._reloj: Optional[threading.Thread] = None
+        self._cerrado = False
+
+        self._lock_stats = threading.Lock()
+        self._stats = {"filas": 0, "lotes": 0, "filas_enviadas": 0, "filas_fallidas": 0, "reintentos_fila": 0}
+        self._errores = deque(maxlen=20)
+
+    # ==========================================================
+    # 📥 ACUMULACIÓN
+    # ==========================================================
+    def agregar(self, tabla: str, fila: Dict[str, Any], modo: str = "insert",
+                callback: Optional[Callable[[bool, Optional[str]], None]] = None) -> bool:
+        """Añade una fila al lote de su tabla. callback(ok, error) se llama al enviarla."""
+        clave = (tabla, modo)
+        with self._cond:
+            if self._cerrado:
+                return False
+            buf = self._buffers.get(clave)
+            if buf is None:
+                buf = {"filas": [], "callbacks": [], "desde": time.time()}
+                self._buffers[clave] = buf
+            buf["filas"].append(fila)
+            buf["callbacks"].append(callback)
+            lleno = len(buf["filas"]) >= self.max_filas
+            if lleno:
+                del self._buffers[clave]
+            else:
+                self._iniciar_reloj()
+                self._cond.notify_all()
+
+        with self._lock_stats:
+            self._stats["filas"] += 1
+        if lleno:
+            self._despachar(clave, buf)
+        return True
+
+    def _iniciar_reloj(self):
+        if self._reloj is None:
+            self._reloj = threading.Thread(target=self._bucle_reloj, daemon=True, name="cloud-batcher")
+            self._reloj.start()
+
+    def _bucle_reloj(self):
+        """Despacha los lotes que han cumplido su tiempo máximo de espera."""
+        while True:
+            vencidos = []
+            with self._cond:
+                if self._cerrado and not self._buffers:
+                    return
+                ahora = time.time()
+                proximo = None
+                for clave, buf in list(self._buffers.items()):
+                    limite = buf["desde"] + self.max_espera
+                    if limite <= ahora:
+                        vencidos.append((clave, self._buffers.pop(clave)))
+                    elif proximo is None or limite < proximo:
+                        proximo = limite
+                if not vencidos:
+                    self._cond.wait(timeout=None if proximo is None else proximo - ahora)
+                    continue
+            for clave, buf in vencidos:
+                self._despachar(clave, buf)
+
+    # ==========================================================
+    # 📤 ENVÍO BULK
+    # ==========================================================
+    def _despachar(self, clave: tuple, buf: Dict[str, Any]):
+        tabla, modo = clave
+        if not self._executor.submit(("lote", tabla), self._enviar_lote, tabla, modo, buf["filas"], buf["callbacks"]):
+            # Cola cerrada: enviamos en el hilo actual para no perder filas
+            self._enviar_lote(tabla, modo, buf["filas"], buf["callbacks"])
+
+    def _deduplicar(self, tabla: str, filas: List[Dict], callbacks: List) -> tuple:
+        """En un upsert la misma fila no puede aparecer dos veces: gana la última."""
+        columnas = self._claves_upsert.get(tabla)
+        if not columnas:
+            return filas, [[cb] for cb in callbacks]
+        posiciones: Dict[tuple, int] = {}
+        unicas, grupos = [], []
+        for fila, cb in zip(filas, callbacks):
+            k = tuple(fila.get(c) for c in columnas)
+            if k in posiciones:
+                unicas[posiciones[k]] = fila
+                grupos[posiciones[k]].append(cb)
+            else:
+                posiciones[k] = len(unicas)
+                unicas.append(fila)
+                grupos.append([cb])
+        return unicas, grupos
+
+    def _enviar_lote(self, tabla: str, modo: str, filas: List[Dict], callbacks: List):
+        if modo == "upsert":
+            filas, grupos = self._deduplicar(tabla, filas, callbacks)
+        else:
+            grupos = [[cb] for cb in callbacks]
+
+        with self._lock_stats:
+            self._stats["lotes"] += 1
+        try:
+            self._enviar(tabla, filas, modo)
+            self._notificar(grupos, [(True, None)] * len(filas))
+            return
+        except Exception as e:
+            if len(filas) == 1:
+                self._notificar(grupos, [(False, str(e))])
+                self._registrar_error(tabla, filas[0], e)
+                return
+            print(f"!! [CLOUD] Lote de {len(filas)} filas en '{tabla}' falló ({e}). Reintentando fila a fila...")
+
+        # Aislar las filas problemáticas
+        resultados = []
+        for fila in filas:
+            with self._lock_stats:
+                self._stats["reintentos_fila"] += 1
+            try:
+                self._enviar(tabla, [fila], modo)
+                resultados.append((True, None))
+            except Exception as e:
+                resultados.append((False, str(e)))
+                self._registrar_error(tabla, fila, e)
+        self._notificar(grupos, resultados)
+
+    def _notificar(self, grupos: List[List], resultados: List[tuple]):
+        ok_total = 0
+        for grupo, (ok, error) in zip(grupos, resultados):
+            ok_total += len(grupo) if ok else 0
+            for cb in grupo:
+                if cb is None:
+                    continue
+                try:
+                    cb(ok, error)
+                except Exception as e:
+                    print(f"!! [CLOUD] Error en callback de lote: {e}")
+        with self._lock_stats:
+            total = sum(len(g) for g in grupos)
+            self._stats["filas_enviadas"] += ok_total
+            self._stats["filas_fallidas"] += total - ok_total
+
+    def _registrar_error(self, tabla: str, fila: Dict, error: Exception):
+        print(f"!! [CLOUD] Fila rechazada en '{tabla}': {error}")
+        self._errores.append({"tabla": tabla, "error": str(error)[:200], "fecha": time.time()})
+
+    # ==========================================================
+    # 🛑 VACIADO
+    # ==========================================================
+    def flush(self):
+        """Despacha inmediatamente todos los lotes abiertos."""
+        with self._cond:
+            pendientes = list(self._buffers.items())
+            self._buffers.clear()
+        for clave, buf in pendientes:
+            self._despachar(clave, buf)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            abiertas = sum(len(b["filas"]) for b in self._buffers.values())
+        with self._lock_stats:
+            lotes = self._stats["lotes"]
+            return {
+                "max_filas": self.max_filas,
+                "max_espera_s": self.max_espera,
+                "filas_en_espera": abiertas,
+                **self._stats,
+                "filas_por_lote": round((self._stats["filas_enviadas"] + self._stats["filas_fallidas"]) / lotes, 2) if lotes else 0.0,
+                "ultimos_errores": list(self._errores),
+            }
+
+
+class AgregadorDeltas:
+    """
+    Suma localmente los incrementos repetidos de una misma clave (p. ej. usos
+    de un comando) y entrega un único delta por clave cada `intervalo`
+    segundos, o antes si hay más de `max_claves` claves abiertas.
+
+    `enviar(clave, delta, dato)` recibe la suma acumulada y el último `dato`
+    asociado a la clave (la acción del comando, por ejemplo).
+    """
+
+    def __init__(self, enviar: Callable[[Hashable, int, Any], Any], intervalo: float = 10.0,
+                 max_claves: int = 256):
+        self._enviar = enviar
+        self.intervalo = max(0.01, float(intervalo))
+        self.max_claves = max(1, int(max_claves))
+
+        # {clave: [delta, dato]}
+        self._pendientes: Dict[Hashable, list] = {}
+        self._desde: Optional[float] = None
+        self._cond = threading.Condition()
+        self._reloj: Optional[threading.Thread] = None
+        self._cerrado = False
+
+        self._lock_stats = threading.Lock()
+        self._stats = {"sumas": 0, "envios": 0, "errores_envio": 0}
+
+    def sumar(self, clave: Hashable, delta: int = 1, dato: Any = None) -> bool:
+        with self._cond:
+            if self._cerrado:
+                return False
+            actual = self._pendientes.get(clave)
+            if actual is None:
+                self._pendientes[clave] = [delta, dato]
+            else:
+                actual[0] += delta
+                actual[1] = dato
+            if self._desde is None:
+                self._desde = time.time()
+            lleno = len(self._pendientes) >= self.max_claves
+            if not lleno:
+                self._iniciar_reloj()
+                self._cond.notify_all()
+
+        with self._lock_stats:
+            self._stats["sumas"] += 1
+        if lleno:
+            self.flush()
+        return True
+
+    def _iniciar_reloj(self):
+        if self._reloj is None:
+            self._reloj = threading.Thread(target=self._bucle_reloj, daemon=True, name="cloud-deltas")
+            self._reloj.start()
+
+    def _bucle_reloj(self):
+        while True:
+            with self._cond:
+                if self._cerrado:
+                    return
+                if self._desde is None:
+                    self._cond.wait()
+                    continue
+                restante = self._desde + self.intervalo - time.time()
+                if restante > 0:
+                    self._cond.wait(timeout=restante)
+                    continue
+            self.flush()
+
+    def flush(self) -> int:
+        """Entrega ya todos los deltas acumulados. Devuelve cuántas claves se enviaron."""
+        with self._cond:
+            pendientes = self._pendientes
+            self._pendientes = {}
+            self._desde = None
+        for clave, (delta, dato) in pendientes.items():
+            try:
+                self._enviar(clave, delta, dato)
+                with self._lock_stats:
+                    self._stats["envios"] += 1
+            except Exception as e:
+                print(f"!! [CLOUD] Error enviando delta de {clave}: {e}")
+                with self._lock_stats:
+                    self._stats["errores_envio"] += 1
+        return len(pendientes)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            abiertas = len(self._pendientes)
+        with self._lock_stats:
+            sumas = self._stats["sumas"]
+            return {
+                "intervalo_s": self.intervalo,
+                "claves_en_espera": abiertas,
+                **self._stats,
+                "ahorro": round(1 - self._stats["envios"] / sumas, 3) if sumas else 0.0,
+            }
+
+
+class Debouncer:
+    """
+    Agrupa ráfagas de eventos por clave: `accion(clave)` se ejecuta cuando
+    pasan `espera` segundos sin nuevos `tocar(clave)`, o como mucho
+    `espera_max` segundos después del primero de la ráfaga.
+    """
+
+    def __init__(self, accion: Callable[[Hashable], Any], espera: float = 1.5, espera_max: float = 5.0):
+        self._accion = accion
+        self.espera = max(0.0, float(espera))
+        self.espera_max = max(self.espera, float(espera_max))
+
+        # {clave: (primer_toque, ultimo_toque)}
+        self._abiertas: Dict[Hashable, tuple] = {}
+        self._cond = threading.Condition()
+        self._reloj: Optional[threading.Thread] = None
+        self._cerrado = False
+        self._stats = {"toques": 0, "disparos": 0}
+
+    def tocar(self, clave: Hashable) -> bool:
+        with self._cond:
+            if self._cerrado:
+                return False
+            ahora = time.time()
+            primero, _ = self._abiertas.get(clave, (ahora, ahora))
+            self._abiertas[clave] = (primero, ahora)
+            self._stats["toques"] += 1
+            if self._reloj is None:
+                self._reloj = threading.Thread(target=self._bucle_reloj, daemon=True, name="cloud-debounce")
+                self._reloj.start()
+            self._cond.notify_all()
+        return True
+
+    def _vence(self, primero: float, ultimo: float) -> float:
+        return min(ultimo + self.espera, primero + self.espera_max)
+
+    def _bucle_reloj(self):
+        while True:
+            vencidas = []
+            with self._cond:
+                if self._cerrado:
+                    return
+                ahora = time.time()
+                proximo = None
+                for clave, (primero, ultimo) in list(self._abiertas.items()):
+                    limite = self._vence(primero, ultimo)
+                    if limite <= ahora:
+                        vencidas.append(clave)
+                        del self._abiertas[clave]
+                    elif proximo is None or limite < proximo:
+                        proximo = limite
+                if not vencidas:
+                    self._cond.wait(timeout=None if proximo is None else proximo - ahora)
+                    continue
+            self._disparar(vencidas)
+
+    def _disparar(self, claves: List[Hashable]):
+        for clave in claves:
+            try:
+                self._accion(clave)
+            except Exception as e:
+                print(f"!! [CLOUD] Error en escritura agrupada de {clave}: {e}")
+        with self._cond:
+            self._stats["disparos"] += len(claves)
+
+    def flush(self):
+        """Dispara ya todas las ráfagas abiertas."""
+        with self._cond:
+            claves = list(self._abiertas)
+            self._abiertas.clear()
+        self._disparar(claves)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            toques = self._stats["toques"]
+            return {
+                "espera_s": self.espera,
+                "espera_max_s": self.espera_max,
+                "abiertas": len(self._abiertas),
+                **self._stats,
+                "ahorro": round(1 - self._stats["disparos"] / toques, 3) if toques else 0.0,
+            }
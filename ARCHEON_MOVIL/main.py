@@ -2,8 +2,8 @@ import flet as ft
 import os
 import sys
 import time
+T_ARRANQUE = time.perf_counter()  # Para medir el tiempo hasta el primer frame
 import threading
-import requests
 import base64
 import json
 import uuid
@@ -30,9 +30,17 @@ except ImportError as e:
     ArcheonReasoner = None
     ContextMemory = None
 
+from archeon_http import ClienteHTTP
+from archeon_orquestador import OrquestadorIA, SinRespuesta
+from archeon_llm_cache import CacheRespuestas
+from archeon_prompt import ConstructorPrompt
+
 
 API_KEY = os.environ.get("GOOGLE_API_KEY")
 GEMINI_ACTIVO = bool(API_KEY)  # Solo verificamos si hay llave
+GEMINI_MODELO = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash"
+# Respuestas en streaming: refrescos por segundo de la burbuja mientras llega el texto (0 = sin streaming)
+STREAM_FPS = float(os.environ.get("AR_STREAM_FPS", "12"))
 
 # --- ESTILOS ---
 C_BG = "#050505"
@@ -157,6 +165,30 @@ class MobileNeuro:
         self.memory = ContextMemory(max_messages=15) if ContextMemory else None
         self.reasoner = ArcheonReasoner(self.memory) if ArcheonReasoner else None
         self.router = OpenRouterAdapter() if OpenRouterAdapter else None
+        # Pool keep-alive compartido por todas las llamadas a los proveedores de IA
+        self.http = ClienteHTTP.desde_entorno()
+        # Gemini y OpenRouter en paralelo con cobertura; gana la primera respuesta buena
+        self.orquestador = OrquestadorIA.desde_entorno()
+        # Prompt con presupuesto de tokens; lo antiguo del historial va resumido
+        self.prompts = ConstructorPrompt(presupuesto=int(os.environ.get("AR_PROMPT_TOKENS", "3000")))
+        self.tokens_prompt_reales = None  # Último recuento que devolvió el proveedor
+        # Respuestas repetidas desde disco (AR_LLM_CACHE=0 lo desactiva)
+        self.cache_respuestas = None
+        if os.environ.get("AR_LLM_CACHE", "1") != "0":
+            try:
+                self.cache_respuestas = CacheRespuestas(
+                    os.environ.get("AR_LLM_CACHE_DB", "archeon_llm_cache.db"),
+                    ttl=float(os.environ.get("AR_LLM_CACHE_TTL", str(7 * 86400))),
+                    max_entradas=int(os.environ.get("AR_LLM_CACHE_ENTRIES", "500")),
+                    max_bytes=int(os.environ.get("AR_LLM_CACHE_BYTES", str(2 * 1024 * 1024))),
+                )
+            except Exception as e:
+                print(f"⚠️ Caché de respuestas no disponible: {e}")
+        self.orquestador.registrar("gemini", self._proveedor_gemini, lambda: GEMINI_ACTIVO)
+        self.orquestador.registrar(
+            "openrouter", self._proveedor_openrouter,
+            lambda: bool(self.router and hasattr(self.router, 'ready') and self.router.ready)
+        )
         self.audio_cache = {}
         self.music_playing = False
         self.current_music_url = None
@@ -271,8 +303,89 @@ class MobileNeuro:
             print(f"⚠️ Error limpiando archivos de voz: {e}")
             return False
     
-    def procesar(self, texto_usuario, imagen_path=None):
-        """Procesa el mensaje del usuario"""
+    def _gemini_stream(self, data, al_fragmento, cancelado=None):
+        """streamGenerateContent (SSE): pasa el texto acumulado a `al_fragmento` según llega."""
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        url = f"{GEMINI_MODELO}:streamGenerateContent?alt=sse&key={api_key}"
+        texto = ""
+        for evento in self.http.eventos_sse(url, headers={'Content-Type': 'application/json'}, json=data):
+            if cancelado is not None and cancelado.is_set():
+                break  # Otro proveedor ganó: cerrar el generador corta la conexión
+            try:
+                cuerpo = json.loads(evento)
+                self._anotar_tokens(cuerpo)
+                partes = cuerpo['candidates'][0]['content']['parts']
+            except (ValueError, KeyError, IndexError):
+                continue
+            trozo = "".join(p.get('text', '') for p in partes)
+            if trozo:
+                texto += trozo
+                al_fragmento(texto)
+        return texto
+
+    def _vision_stream(self, data, al_fragmento, cancelado, response):
+        """Visión en streaming: si la conexión cae a mitad se conserva lo ya mostrado."""
+        parcial = []
+
+        def fragmento(texto):
+            parcial[:] = [texto]
+            al_fragmento(texto)
+
+        try:
+            texto = self._gemini_stream(data, fragmento, cancelado)
+            if not texto.strip() and not cancelado.is_set():
+                raise RuntimeError("respuesta vacía")
+            response["texto"] = texto
+        except Exception as e:
+            print(f"Error visión (streaming): {e}")
+            response["error"] = True
+            if parcial:
+                response["texto"] = parcial[0] + "\n\n⚠️ Respuesta interrumpida."
+            else:
+                response["texto"] = "⚠️ Error procesando imagen."
+        return response
+
+    def _proveedor_gemini(self, prompt, al_fragmento, cancelado):
+        data = ConstructorPrompt.para_gemini(prompt)
+        if al_fragmento:
+            return self._gemini_stream(data, al_fragmento, cancelado)
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        res = self.http.post(f"{GEMINI_MODELO}:generateContent?key={api_key}",
+                             headers={'Content-Type': 'application/json'}, json=data)
+        if res.status_code != 200:
+            print(f"Error API: {res.text}")
+            raise RuntimeError(f"Gemini API {res.status_code}")
+        cuerpo = res.json()
+        self._anotar_tokens(cuerpo)
+        return cuerpo['candidates'][0]['content']['parts'][0]['text']
+    
+    def _anotar_tokens(self, cuerpo):
+        """Gemini devuelve el recuento real en usageMetadata (en streaming, en el último evento)."""
+        uso = cuerpo.get('usageMetadata') if isinstance(cuerpo, dict) else None
+        if uso and uso.get('promptTokenCount'):
+            self.tokens_prompt_reales = uso['promptTokenCount']
+    
+    def _proveedor_openrouter(self, prompt, al_fragmento, cancelado):
+        # El adaptador sólo acepta una cadena: sistema + transcripción con roles
+        prompt = ConstructorPrompt.como_texto(prompt)
+        if al_fragmento and hasattr(self.router, 'stream_message'):
+            respuesta = ""
+            for trozo in self.router.stream_message(prompt):
+                if cancelado.is_set():
+                    break
+                respuesta += trozo
+                al_fragmento(respuesta)
+            return respuesta
+        res_obj = self.router.send_message(prompt)
+        return res_obj.text if hasattr(res_obj, 'text') else str(res_obj)
+    
+    def procesar(self, texto_usuario, imagen_path=None, al_fragmento=None, modo=None, cancelado=None):
+        """
+        Procesa el mensaje del usuario. Con `al_fragmento` las respuestas de
+        la IA llegan en streaming: se le llama con el texto acumulado.
+        `modo` (asistente/programador/...) forma parte de la clave de caché.
+        `cancelado` (threading.Event) corta el streaming de visión.
+        """
         response = {
             "texto": "", 
             "accion": None, 
@@ -305,6 +418,21 @@ class MobileNeuro:
         if len(texto_usuario) > 60:
             es_codigo_o_largo = True
             
+        # 2b. SKILLS DEL USUARIO (índice local de triggers, sin red). Nunca con código
+        # o texto largo: un trigger citado a mitad de un mensaje no lanza la macro
+        if not imagen_path and not es_codigo_o_largo and self.cloud and hasattr(self.cloud, 'buscar_skill'):
+            usuario = getattr(self.cloud, 'usuario_actual', None)
+            if usuario and usuario != "guest":
+                skill = self.cloud.buscar_skill(usuario, texto_usuario)
+                if skill:
+                    # La Base PC ejecuta la macro al recibir su trigger
+                    self.cloud.guardar_comando(usuario, "cmd_remoto", skill["trigger"])
+                    response["texto"] = f"⚡ Skill '{skill['trigger']}' enviada a la Base PC"
+                    response["accion"] = "skill"
+                    response["dato"] = skill
+                    response["necesita_voz"] = False
+                    return response
+
         # 3. VISIÓN (imagen) - VERSIÓN COMPATIBLE CON ANDROID
         if imagen_path and GEMINI_ACTIVO:
             try:
@@ -334,7 +462,10 @@ class MobileNeuro:
                     }]
                 }
                 
-                res = requests.post(url, headers=headers, json=data)
+                if al_fragmento:
+                    return self._vision_stream(data, al_fragmento, cancelado or threading.Event(), response)
+                
+                res = self.http.post(url, headers=headers, json=data)
                 
                 if res.status_code == 200:
                     response["texto"] = res.json()['candidates'][0]['content']['parts'][0]['text']
@@ -442,116 +573,55 @@ class MobileNeuro:
             except: 
                 historial = []
         
-        sys_prompt = f"""
-SYSTEM: Eres {self.config.get('asistente_nombre')}, un asistente inteligente TODO-TERRENO.
-
-ROL GENERAL:
-Ayudas en CUALQUIER TEMA: programación, tecnología, estudios, cocina, tareas diarias, explicación de conceptos, consejos prácticos y conversación general.
-
-PRIORIDAD ABSOLUTA:
-1. Comprender la INTENCIÓN REAL del usuario.
-2. Responder de la forma MÁS ÚTIL y DIRECTA posible según esa intención.
-
-DETECCIÓN DE INTENCIÓN (INTERNA):
-Antes de responder, clasifica internamente la petición como UNA de estas:
-- Conversación general / pregunta simple
-- Explicación o aprendizaje
-- Tarea práctica (cocinar, estudiar, usar algo)
-- Programación / código
-- Corrección o mejora de código
-
-⚠️ REGLA CRÍTICA:
-La detección de intención es SOLO INTERNA.
-NUNCA expliques, menciones ni describas la intención del usuario en la respuesta.
-
-COMPORTAMIENTO SEGÚN INTENCIÓN:
-
-🟢 GENERAL (por defecto):
-- Responde claro, natural y útil.
-- Ve directo a la solución.
-- Usa pasos o listas solo si aportan valor.
-- Evita explicaciones innecesarias.
-
-🟡 EXPLICACIÓN / APRENDIZAJE:
-- Explica con ejemplos simples.
-- Usa listas cuando ayuden a entender.
-- Ajusta la profundidad al contexto.
-
-🔵 PROGRAMACIÓN:
-- Sé técnico y preciso.
-- Usa buenas prácticas.
-- Explica SOLO lo necesario para comprender o usar la solución.
+        # Instrucciones fijas al campo de sistema, historial con roles y dentro de presupuesto
+        prompt = self.prompts.construir(texto_usuario, historial, self.config.get('asistente_nombre'))
+        t = prompt["tokens"]
+        print(f">> [PROMPT] ~{t['total']} tokens (sistema {t['sistema']}, historial {t['historial']} "
+              f"en {t['turnos']} turnos, {t['resumidos']} resumidos)")
 
-🔴 CORRECCIÓN / MEJORA DE CÓDIGO:
-(Solo si el usuario pide corregir, arreglar o mejorar)
-- ZERO FLUFF.
-- Diagnóstico breve en bullets.
-- Código corregido OBLIGATORIO.
-- Usa Markdown y separación de archivos si aplica.
-- No des solo explicación: ENTREGA SOLUCIÓN.
-
-REGLAS DE SALIDA (OBLIGATORIAS):
-- Empieza directamente con la respuesta, no con introducciones.
-- NO frases meta ("entiendo que…", "tu intención es…").
-- NO expliques el proceso interno.
-- NO nombres modos ni reglas.
-- Saluda SOLO si el usuario saluda primero.
-- Máximo 1 a 2 líneas antes de entrar al contenido real.
-
-IDIOMA (REGLA CRÍTICA):
-- Responde EXCLUSIVAMENTE en el idioma del último mensaje del usuario.
-- Ignora el idioma del historial si difiere.
-- Nunca cambies de idioma por iniciativa propia.
-
-CONTEXTO:
-Historial: {historial}
-Usuario: {texto_usuario}
-"""
-
-        ia_seleccionada = self.config.get("ia_principal")
-        respuesta = ""
+        # Preguntas repetidas (no personales ni dependientes del momento) sin red
+        clave_cache = None
+        if self.cache_respuestas and not imagen_path:
+            if self.cache_respuestas.cacheable(texto_usuario):
+                clave_cache = self.cache_respuestas.clave(
+                    texto_usuario, modo, self.config.get("idioma_voz"), historial,
+                    extra=self.config.get("asistente_nombre")
+                )
+            else:
+                self.cache_respuestas.omitida()
+        respuesta = self.cache_respuestas.obtener(clave_cache) if clave_cache else None
         
-        if ia_seleccionada == "gemini" and GEMINI_ACTIVO:
+        if respuesta:
+            print(">> [IA] Respuesta desde caché")
+        else:
+            self.tokens_prompt_reales = None
+            # Último texto que llegó a la burbuja, por si todos los proveedores caen a mitad
+            parcial = []
+            fragmento = None
+            if al_fragmento:
+                def fragmento(texto):
+                    parcial[:] = [texto]
+                    al_fragmento(texto)
             try:
-                api_key = os.environ.get("GOOGLE_API_KEY")
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-                headers = {'Content-Type': 'application/json'}
-                
-                # Enviamos solo texto
-                data = {
-                    "contents": [{
-                        "parts": [{"text": sys_prompt}]
-                    }]
-                }
-                
-                res = requests.post(url, headers=headers, json=data)
-                
-                if res.status_code == 200:
-                    respuesta = res.json()['candidates'][0]['content']['parts'][0]['text']
+                respuesta, proveedor = self.orquestador.ejecutar(
+                    prompt, fragmento, preferido=self.config.get("ia_principal")
+                )
+                print(f">> [IA] Respuesta de {proveedor}"
+                      + (f" | tokens de prompt: {self.tokens_prompt_reales}" if self.tokens_prompt_reales else ""))
+                if clave_cache:
+                    self.cache_respuestas.guardar(clave_cache, respuesta)
+            except SinRespuesta as e:
+                print(f"Error IA: {e}")
+                response["error"] = True
+                if parcial:
+                    respuesta = parcial[0] + "\n\n⚠️ Respuesta interrumpida."
                 else:
-                    print(f"Error API: {res.text}")
-                    respuesta = f"⚠️ Error Gemini API: {res.status_code}"
-                    ia_seleccionada = "openrouter" # Fallback
-                    
-            except Exception as e:
-                print(f"Error Gemini REST: {e}")
-                respuesta = "⚠️ Error de conexión con Gemini."
-                ia_seleccionada = "openrouter"
-
-        if ia_seleccionada == "openrouter":
-            if self.router and hasattr(self.router, 'ready') and self.router.ready:
-                try:
-                    res_obj = self.router.send_message(sys_prompt)
-                    respuesta = res_obj.text if hasattr(res_obj, 'text') else str(res_obj)
-                except Exception as e:
-                    respuesta = f"⚠️ Error OpenRouter: {str(e)[:100]}"
-            else:
-                respuesta = "⚠️ IA no disponible."
+                    respuesta = "⚠️ IA no disponible." if not e.errores else "⚠️ Error de conexión con la IA."
 
         response["texto"] = respuesta
         
-        # Guardar en memoria
-        if self.memory:
+        # Guardar en memoria (los errores no: ensuciarían el historial del modelo)
+        if self.memory and not response["error"]:
             try:
                 self.memory.add("user", texto_usuario)
                 self.memory.add("assistant", respuesta)
@@ -597,14 +667,15 @@ def main(page: ft.Page):
     # Configuración
     config = ConfigManager()
     
-    # Inicializar Nube
+    # Inicializar Nube: la conexión se abre en segundo plano para que la
+    # pantalla de acceso salga ya; login/registro esperan a que esté lista
     print(">> [MÓVIL] Iniciando sistemas...")
     try:
         if CloudManager:
             cloud = CloudManager(supabase_config={
                 "supabase_url": "https://rcgipowzivogyqbuwzlv.supabase.co",
                 "supabase_key": "sb_publishable_V0kfZlDv6HKNudCl_vObeQ_pRbDU1RU"
-            })
+            }, en_segundo_plano=True)
             print("✓ CloudManager inicializado")
         else:
             raise ImportError("CloudManager no disponible")
@@ -793,8 +864,17 @@ def main(page: ft.Page):
             border=ft.border.all(1, "#222")
         )
     
+    def nube_disponible():
+        """Falla rápido si la nube está caída (circuito abierto) en vez de esperar al timeout."""
+        if getattr(cloud, "cloud_ready", False) and getattr(cloud, "supabase", None) is not None:
+            return True
+        mostrar_notificacion("☁️ Sin conexión con la nube. Inténtalo en unos segundos.", "warning")
+        return False
+    
     def descargar_archivo(url_path):
         """Descarga real del archivo desde Supabase Storage"""
+        if not nube_disponible():
+            return
         # Obtenemos el nombre real del archivo desde la ruta de la nube
         nombre_archivo = os.path.basename(url_path)
         mostrar_notificacion(f"⏳ Descargando: {nombre_archivo}...", "info")
@@ -825,6 +905,8 @@ def main(page: ft.Page):
     
     def eliminar_archivo(id_file):
         """Eliminación permanente de Storage y Base de Datos SQL"""
+        if not nube_disponible():
+            return
         mostrar_notificacion("⚠️ Eliminando archivo de la nube...", "warning")
         
         def proceso_eliminacion():
@@ -862,6 +944,8 @@ def main(page: ft.Page):
         if not e.files or cloud.usuario_actual == "guest":
             mostrar_notificacion("⚠️ Inicia sesión para subir archivos a la nube", "error")
             return
+        if not nube_disponible():
+            return
         
         archivo = e.files[0]
         user_id = cloud.usuario_actual #
@@ -930,6 +1014,9 @@ def main(page: ft.Page):
 
         # 2. CONSULTA A SUPABASE
         try:
+            if not nube_disponible():
+                raise ConnectionError("Nube no disponible")
+
             # Traemos los archivos que pertenecen a este user_id
             res = cloud.supabase.table('archivos').select("*").eq("user_id", user_id).execute()
             archivos_db = res.data if res.data else []
@@ -983,6 +1070,11 @@ def main(page: ft.Page):
                         )
                     )
                     
+        except ConnectionError as e:
+            # Si la nube no estaba disponible, nube_disponible() ya avisó
+            print(f"❌ Error Cloud Drive: {e}")
+            if getattr(cloud, "cloud_ready", False):
+                mostrar_notificacion("Error al conectar con la nube", "error")
         except Exception as e:
             print(f"❌ Error Cloud Drive: {e}")
             mostrar_notificacion("Error al conectar con la nube", "error")
@@ -1195,23 +1287,51 @@ def main(page: ft.Page):
         except:
             pass
     
+    # El hash de contraseña tarda cientos de ms: todo lo que llama a la nube en
+    # login/registro/recuperación corre en un hilo para no congelar la UI
+    auth_en_curso = threading.Event()
+    
+    def ejecutar_auth(tarea):
+        if auth_en_curso.is_set():
+            mostrar_notificacion("Espera, hay una operación en curso...", "info")
+            return
+        auth_en_curso.set()
+        
+        def hilo_auth():
+            try:
+                tarea()
+            except Exception as ex:
+                print(f"❌ Error en autenticación: {ex}")
+                mostrar_notificacion("Error inesperado, inténtalo de nuevo", "error")
+            finally:
+                auth_en_curso.clear()
+        
+        threading.Thread(target=hilo_auth, daemon=True).start()
+    
     def accion_login(e):
         if not inp_email.value or not inp_pass.value:
             mostrar_notificacion("Faltan datos", "error")
             return
         
         mostrar_notificacion("Verificando en la Nube...", "info")
-        
-        if cloud and hasattr(cloud, 'validar_login'):
-            if cloud.validar_login(inp_email.value, inp_pass.value):
-                cloud.usuario_actual = inp_email.value
-                mostrar_notificacion(f"Bienvenido {inp_email.value}", "success")
-                
-                ir_dashboard(primer_inicio=True) 
+        email, password = inp_email.value, inp_pass.value
+        
+        def tarea():
+            if cloud and hasattr(cloud, 'validar_login'):
+                if cloud.validar_login(email, password):
+                    cloud.usuario_actual = email
+                    # Config, gustos, comandos, skills y recuerdos de una vez, en segundo plano
+                    if hasattr(cloud, 'warm_user'):
+                        threading.Thread(target=cloud.warm_user, args=(email,), daemon=True).start()
+                    mostrar_notificacion(f"Bienvenido {email}", "success")
+                    
+                    ir_dashboard(primer_inicio=True) 
+                else:
+                    mostrar_notificacion("Credenciales incorrectas o usuario no existe", "error")
             else:
-                mostrar_notificacion("Credenciales incorrectas o usuario no existe", "error")
-        else:
-            mostrar_notificacion("Servicio no disponible", "error")
+                mostrar_notificacion("Servicio no disponible", "error")
+        
+        ejecutar_auth(tarea)
     
     def accion_registro(e):
         if not all([inp_email.value, inp_usuario.value, inp_pass.value, inp_pass_confirm.value]):
@@ -1227,21 +1347,25 @@ def main(page: ft.Page):
             return
         
         mostrar_notificacion("Registrando usuario...", "info")
+        email, usuario, password = inp_email.value, inp_usuario.value, inp_pass.value
         
-        if cloud and hasattr(cloud, 'crear_usuario'):
-            resultado = cloud.crear_usuario(inp_email.value, inp_usuario.value, inp_pass.value)
-            
-            if isinstance(resultado, dict) and resultado.get("ok"):
-                mostrar_notificacion("¡Cuenta creada! Iniciando...", "success")
-                cloud.usuario_actual = inp_email.value
+        def tarea():
+            if cloud and hasattr(cloud, 'crear_usuario'):
+                resultado = cloud.crear_usuario(email, usuario, password)
                 
-                # CORRECCIÓN: Pasamos primer_inicio=True para que Archeon se presente
-                ir_dashboard(primer_inicio=True) 
+                if isinstance(resultado, dict) and resultado.get("ok"):
+                    mostrar_notificacion("¡Cuenta creada! Iniciando...", "success")
+                    cloud.usuario_actual = email
+                    
+                    # CORRECCIÓN: Pasamos primer_inicio=True para que Archeon se presente
+                    ir_dashboard(primer_inicio=True) 
+                else:
+                    error_msg = resultado.get("error", "Error desconocido") if isinstance(resultado, dict) else "Error en el registro"
+                    mostrar_notificacion(f"Error: {error_msg}", "error")
             else:
-                error_msg = resultado.get("error", "Error desconocido") if isinstance(resultado, dict) else "Error en el registro"
-                mostrar_notificacion(f"Error: {error_msg}", "error")
-        else:
-            mostrar_notificacion("Servicio no disponible", "error")
+                mostrar_notificacion("Servicio no disponible", "error")
+        
+        ejecutar_auth(tarea)
     
     def accion_recuperar(e):
         if not inp_email.value or not inp_pass_nueva.value:
@@ -1252,22 +1376,27 @@ def main(page: ft.Page):
             mostrar_notificacion("La nueva contraseña debe tener al menos 6 caracteres", "error")
             return
         
-        if inp_pass.value and hasattr(cloud, 'validar_login'):
-            if not cloud.validar_login(inp_email.value, inp_pass.value):
-                mostrar_notificacion("Contraseña actual incorrecta", "error")
-                return
-        
-        mostrar_notificacion("Actualizando base de datos...", "info")
+        email, actual, nueva = inp_email.value, inp_pass.value, inp_pass_nueva.value
         
-        if cloud and hasattr(cloud, 'actualizar_password'):
-            if cloud.actualizar_password(inp_email.value, inp_pass_nueva.value):
-                mostrar_notificacion("Contraseña actualizada con éxito", "success")
-                tabs_auth.selected_index = 0
-                actualizar_form_auth(ft.ControlEvent(control=tabs_auth))
+        def tarea():
+            if actual and hasattr(cloud, 'validar_login'):
+                if not cloud.validar_login(email, actual):
+                    mostrar_notificacion("Contraseña actual incorrecta", "error")
+                    return
+            
+            mostrar_notificacion("Actualizando base de datos...", "info")
+            
+            if cloud and hasattr(cloud, 'actualizar_password'):
+                if cloud.actualizar_password(email, nueva):
+                    mostrar_notificacion("Contraseña actualizada con éxito", "success")
+                    tabs_auth.selected_index = 0
+                    actualizar_form_auth(ft.ControlEvent(control=tabs_auth))
+                else:
+                    mostrar_notificacion("No se pudo actualizar (¿Email correcto?)", "error")
             else:
-                mostrar_notificacion("No se pudo actualizar (¿Email correcto?)", "error")
-        else:
-            mostrar_notificacion("Servicio no disponible", "error")
+                mostrar_notificacion("Servicio no disponible", "error")
+        
+        ejecutar_auth(tarea)
     
     # Tabs de autenticación
     tabs_auth = ft.Tabs(
@@ -1375,6 +1504,53 @@ def main(page: ft.Page):
             page.update()
         except:
             pass
+        return mensaje_container
+    
+    def actualizar_mensaje(mensaje_container, texto):
+        """Cambia el texto de una burbuja ya pintada (respuestas en streaming)."""
+        with chat_lock:
+            mensaje_container.content.controls[0].value = texto
+            if mensaje_container.width is None and len(texto) > 30:
+                screen_width = current_width if current_width > 0 else 350
+                factor = 0.65 if ResponsiveHelper.get_device_type(screen_width) == "tablet" else 0.75
+                mensaje_container.width = screen_width * factor
+        try:
+            page.update()
+        except:
+            pass
+    
+    def respuesta_en_streaming(thinking):
+        """
+        Burbuja que se crea con el primer fragmento y se refresca como mucho
+        STREAM_FPS veces por segundo. Devuelve (al_fragmento, terminar):
+        terminar(texto) pinta el texto final y dice si la burbuja existía.
+        """
+        if STREAM_FPS <= 0:
+            return None, lambda texto_final: False
+        estado = {"burbuja": None, "ultimo": 0.0, "pendiente": None}
+        intervalo = 1.0 / STREAM_FPS
+        
+        def al_fragmento(parcial):
+            ahora = time.monotonic()
+            if estado["burbuja"] is not None and ahora - estado["ultimo"] < intervalo:
+                estado["pendiente"] = parcial
+                return
+            estado["ultimo"], estado["pendiente"] = ahora, None
+            if estado["burbuja"] is None:
+                with chat_lock:
+                    if thinking in chat_list.controls:
+                        chat_list.controls.remove(thinking)
+                estado["burbuja"] = agregar_mensaje(parcial, es_usuario=False)
+            else:
+                actualizar_mensaje(estado["burbuja"], parcial)
+        
+        def terminar(texto_final):
+            if estado["burbuja"] is None:
+                return False
+            actualizar_mensaje(estado["burbuja"], texto_final or estado["pendiente"] or "")
+            return True
+        
+        return al_fragmento, terminar
     
     def toggle_voz_entrada():
         actual = config.get("activacion_voz")
@@ -1532,14 +1708,16 @@ def main(page: ft.Page):
         page.update()
 
         def hilo():
-            resultado = brain.procesar(texto, path)
+            al_fragmento, terminar = respuesta_en_streaming(thinking)
+            resultado = brain.procesar(texto, path, al_fragmento=al_fragmento, modo=modo_actual)
             
             with chat_lock:
                 if thinking in chat_list.controls:
                     chat_list.controls.remove(thinking)
             
             if resultado["texto"]:
-                agregar_mensaje(resultado["texto"], es_usuario=False)
+                if not terminar(resultado["texto"]):
+                    agregar_mensaje(resultado["texto"], es_usuario=False)
                 if resultado.get("necesita_voz", True):
                     reproducir_voz(resultado["texto"])
             page.update()
@@ -1564,7 +1742,8 @@ def main(page: ft.Page):
             pass
         
         def hilo_procesamiento():
-            resultado = brain.procesar(texto)
+            al_fragmento, terminar = respuesta_en_streaming(thinking)
+            resultado = brain.procesar(texto, al_fragmento=al_fragmento, modo=modo_actual)
             
             def remove_thinking():
                 with chat_lock:
@@ -1613,8 +1792,12 @@ def main(page: ft.Page):
                 elif resultado["accion"] == "remote_pc":
                     mostrar_notificacion("📡 Comando enviado a PC", "success")
                 
+                elif resultado["accion"] == "skill":
+                    mostrar_notificacion("⚡ Skill ejecutada", "success")
+                
                 if resultado["texto"]:
-                    agregar_mensaje(resultado["texto"], es_usuario=False)
+                    if not terminar(resultado["texto"]):
+                        agregar_mensaje(resultado["texto"], es_usuario=False)
                     
                     if resultado.get("necesita_voz", True):
                         reproducir_voz(resultado["texto"])
@@ -1943,6 +2126,8 @@ def main(page: ft.Page):
     
     def ir_dashboard(primer_inicio=False):
         page.clean()
+        # Conexiones con los proveedores de IA abiertas antes del primer mensaje
+        threading.Thread(target=brain.http.precalentar, daemon=True).start()
         
         # Creamos una columna para apilar la previsualización y la barra de entrada
         bottom_area_column = ft.Column(
@@ -2198,6 +2383,11 @@ def main(page: ft.Page):
     # Iniciar con autenticación
     current_width = page.width
     page.add(vista_autenticacion())
+    ms_primer_frame = (time.perf_counter() - T_ARRANQUE) * 1000
+    if hasattr(cloud, "marcar_primer_frame"):
+        cloud.marcar_primer_frame(ms_primer_frame)
+    else:
+        print(f">> [MÓVIL] Primer frame en {ms_primer_frame:.0f} ms")
 
 if __name__ == "__main__":
     # Crear carpetas necesarias
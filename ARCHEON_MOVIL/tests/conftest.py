@@ -0,0 +1,5 @@
+# conftest.py - Los módulos de la app viven planos en ARCHEON_MOVIL
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,116 @@
+# test_nube_fake.py - CloudManager contra el Supabase en memoria (AR_FAKE_SUPABASE=1)
+import pytest
+
+from archeon_cloud import CloudManager
+
+EMAIL = "ana@archeon.local"
+
+
+@pytest.fixture
+def nube(tmp_path, monkeypatch):
+    monkeypatch.setenv("AR_FAKE_SUPABASE", "1")
+    monkeypatch.setenv("AR_LOCAL_DB", str(tmp_path / "local.db"))
+    monkeypatch.setenv("AR_SPILL_DIR", str(tmp_path / "spill"))
+    monkeypatch.setenv("AR_CONFIG_DEBOUNCE", "0.05")
+    monkeypatch.setenv("AR_CONFIG_DEBOUNCE_MAX", "0.2")
+    monkeypatch.setenv("AR_BATCH_WAIT", "0.05")
+    monkeypatch.setenv("AR_REALTIME", "0")
+    cloud = CloudManager()
+    assert cloud.esperar_listo(5)
+    yield cloud
+    cloud.close()
+
+
+def _tabla(cloud, nombre):
+    return cloud.supabase._cliente.tablas.get(nombre, [])
+
+
+def _llamadas(cloud, prefijo):
+    return sum(r["n"] for clave, r in cloud._metricas.snapshot().items() if clave.startswith(prefijo))
+
+
+def test_login_correcto_e_incorrecto(nube):
+    assert nube.crear_usuario(EMAIL, "ana", "secreta")["ok"]
+    assert not nube.crear_usuario(EMAIL, "ana", "otra")["ok"]
+    assert nube.validar_login(EMAIL, "secreta")
+    assert not nube.validar_login(EMAIL, "mala")
+    assert not nube.validar_login("nadie@archeon.local", "secreta")
+
+    # Por defecto se escribe el formato que lee la Base PC: hash hex + columna salt
+    usuario = _tabla(nube, "users")[0]
+    assert "$" not in usuario["password_hash"] and usuario["salt"]
+
+
+def test_rafaga_de_config_en_una_escritura(nube):
+    nube.crear_usuario(EMAIL, "ana", "secreta")
+    antes = _llamadas(nube, "rpc:merge_config") + _llamadas(nube, "users.update")
+    for i in range(10):
+        nube.guardar_config(EMAIL, {"tema": f"t{i}", f"clave{i}": i})
+    assert nube.obtener_config(EMAIL)["tema"] == "t9"
+    assert nube.flush_writes(5)
+
+    despues = _llamadas(nube, "rpc:merge_config") + _llamadas(nube, "users.update")
+    assert despues - antes == 1
+    import json
+    remoto = json.loads(_tabla(nube, "users")[0]["config"])
+    assert remoto["tema"] == "t9" and remoto["clave0"] == 0 and remoto["clave9"] == 9
+
+
+def test_lote_de_inserciones(nube):
+    antes = _llamadas(nube, "memoria.insert")
+    for i in range(20):
+        nube.guardar_recuerdo(EMAIL, "nota", f"recuerdo {i}")
+    assert nube.flush_writes(5)
+    assert len(_tabla(nube, "memoria")) == 20
+    assert _llamadas(nube, "memoria.insert") - antes < 20
+
+
+def test_skill_repetida_no_se_duplica(nube):
+    nube.guardar_skill(EMAIL, "pon musica", [{"paso": 1}])
+    nube.guardar_skill(EMAIL, "pon musica", [{"paso": 2}])
+    assert nube.flush_writes(5)
+    filas = [f for f in _tabla(nube, "skills") if f["trigger"] == "pon musica"]
+    assert len(filas) == 1 and '"paso": 2' in filas[0]["actions"]
+    assert nube.buscar_skill(EMAIL, "pon musica ya")["trigger"] == "pon musica"
+    assert nube.buscar_skill(EMAIL, "no quiero que pon musica") is None
+
+
+def test_no_leidos_y_marcar_leidos(nube):
+    nube.guardar_mensaje_chat(EMAIL, "luis", "hola", "luis")
+    nube.guardar_mensaje_chat(EMAIL, "luis", "¿estás?", "luis")
+    nube.guardar_mensaje_chat(EMAIL, "eva", "hey", "eva")
+    nube.guardar_mensaje_chat(EMAIL, "eva", "respuesta", "yo")
+    assert nube.contar_no_leidos(EMAIL) == {"luis": 2, "eva": 1}
+
+    nube.marcar_leidos(EMAIL, ["luis"])
+    assert nube.contar_no_leidos(EMAIL) == {"eva": 1}
+    assert nube.flush_writes(5)
+    pendientes = [f for f in _tabla(nube, "chats_mensajes") if not f["leido"] and f["autor"] != "yo"]
+    assert [f["contacto"] for f in pendientes] == ["eva"]
+
+
+def test_codigo_de_verificacion_se_consume_una_vez(nube):
+    assert nube.guardar_codigo_verificacion(EMAIL, "123456")
+    assert not nube.validar_codigo_verificacion(EMAIL, "000000")["ok"]
+    assert nube.validar_codigo_verificacion(EMAIL, "123456")["ok"]
+    assert not nube.validar_codigo_verificacion(EMAIL, "123456")["ok"]
+
+
+def test_borrado_total_de_la_cuenta(nube):
+    nube.crear_usuario(EMAIL, "ana", "secreta")
+    token = nube.crear_sesion(EMAIL)
+    nube.guardar_recuerdo(EMAIL, "nota", "algo")
+    nube.guardar_gusto(EMAIL, "jazz")
+    nube.guardar_skill(EMAIL, "apaga", [])
+    nube.guardar_mensaje_chat(EMAIL, "luis", "hola", "luis")
+    assert nube.guardar_codigo_verificacion(EMAIL, "123456")
+    assert nube.flush_writes(5)
+
+    informe = nube.borrar_cuenta(EMAIL)
+    assert informe["ok"], informe
+    assert nube.obtener_usuario_por_token(token) is None
+    for tabla in ("users", "memoria", "gustos", "skills", "chats_mensajes", "sessions", "verification_codes"):
+        restantes = [f for f in _tabla(nube, tabla) if EMAIL in str(f.values())
+                     or f.get("user_id") == nube._get_user_doc_id(EMAIL)]
+        assert not restantes, tabla
+    assert not nube.validar_login(EMAIL, "secreta")
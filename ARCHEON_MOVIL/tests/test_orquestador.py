@@ -0,0 +1,90 @@
+# Pruebas del orquestador de IA con proveedores simulados (sin red)
+import time
+
+import pytest
+
+from archeon_orquestador import OrquestadorIA, SinRespuesta
+
+
+def proveedor(texto=None, retardo=0.0, fragmentos=(), error=None):
+    """Proveedor falso: emite sus fragmentos, tarda `retardo` (o hasta que lo cancelen) y responde o falla."""
+    def llamar(prompt, al_fragmento, cancelado):
+        for fragmento in fragmentos:
+            if al_fragmento:
+                al_fragmento(fragmento)
+        if cancelado.wait(retardo):
+            raise RuntimeError("cancelado")
+        if error:
+            raise RuntimeError(error)
+        return texto
+    return llamar
+
+
+def test_cobertura_lanza_el_segundo_y_el_perdedor_no_deja_muestra():
+    ia = OrquestadorIA(modo="cobertura", cobertura_ms=50, min_muestras=1)
+    ia.registrar("lento", proveedor("Lento", retardo=2.0))
+    ia.registrar("rapido", proveedor("Rápido", retardo=0.01))
+
+    assert ia.ejecutar("hola", preferido="lento") == ("Rápido", "rapido")
+    time.sleep(0.1)  # El perdedor termina al ver su cancelación
+    stats = ia.stats()
+    assert stats["coberturas"] == 1
+    assert stats["proveedores"]["lento"]["n"] == 0
+    assert stats["proveedores"]["rapido"]["ganadas"] == 1
+    # Sin muestras del cancelado no hay con qué comparar: el preferido sigue primero
+    assert ia.orden(preferido="lento")[0] == "lento"
+
+
+def test_secuencial_pasa_al_siguiente_cuando_falla():
+    ia = OrquestadorIA(modo="secuencial")
+    ia.registrar("roto", proveedor(error="HTTP 500"))
+    ia.registrar("sano", proveedor("Bien"))
+
+    assert ia.ejecutar("hola") == ("Bien", "sano")
+    stats = ia.stats()
+    assert stats["fallbacks"] == 1
+    assert stats["proveedores"]["roto"]["tasa_error"] == 1.0
+
+
+def test_proveedor_no_disponible_no_se_lanza():
+    ia = OrquestadorIA(modo="secuencial")
+    ia.registrar("apagado", proveedor(error="no debería llamarse"), disponible=lambda: False)
+    ia.registrar("sano", proveedor("Bien"))
+
+    assert ia.orden() == ["sano"]
+    assert ia.ejecutar("hola", preferido="apagado") == ("Bien", "sano")
+
+
+def test_carrera_gana_quien_escribe_en_la_burbuja():
+    ia = OrquestadorIA(modo="carrera")
+    ia.registrar("stream", proveedor("Hola mundo", retardo=0.2, fragmentos=("Ho", "Hola")))
+    ia.registrar("rapido", proveedor("Otra respuesta", retardo=0.02))
+    recibidos = []
+
+    texto, nombre = ia.ejecutar("hola", al_fragmento=recibidos.append)
+    # La respuesta rápida queda de reserva: la burbuja no cambia de contenido a mitad
+    assert (texto, nombre) == ("Hola mundo", "stream")
+    assert recibidos == ["Ho", "Hola"]
+
+
+def test_carrera_usa_la_reserva_si_el_dueno_falla():
+    ia = OrquestadorIA(modo="carrera")
+    ia.registrar("stream", proveedor(retardo=0.15, fragmentos=("Ho",), error="conexión cortada"))
+    ia.registrar("rapido", proveedor("Otra respuesta", retardo=0.02))
+
+    assert ia.ejecutar("hola", al_fragmento=lambda _: None) == ("Otra respuesta", "rapido")
+
+
+def test_sin_respuesta_lleva_el_error_de_cada_proveedor():
+    ia = OrquestadorIA(modo="secuencial")
+    ia.registrar("a", proveedor(error="HTTP 500"))
+    ia.registrar("b", proveedor(""))
+
+    with pytest.raises(SinRespuesta) as info:
+        ia.ejecutar("hola")
+    assert info.value.errores == {"a": "HTTP 500", "b": "respuesta vacía"}
+    assert ia.stats()["sin_respuesta"] == 1
+
+    vacio = OrquestadorIA()
+    with pytest.raises(SinRespuesta):
+        vacio.ejecutar("hola")